@@ -0,0 +1,131 @@
+# ReportGenerator - Corpus sintetici per i benchmark
+# Creato da Alessandro Frullo
+#
+# Genera immagini simili alle schermate dei drive test (mappa a tinte piatte
+# con strade, percorso di misura colorato e legenda) circondate da margini
+# bianchi, in dimensioni e formati diversi. Con lo stesso seme il corpus è
+# identico byte per byte, quindi i risultati di esecuzioni diverse sono
+# confrontabili; un corpus già generato con gli stessi parametri viene
+# riusato.
+
+import json
+import math
+import random
+import sys
+from pathlib import Path
+
+from PIL import Image, ImageDraw
+
+from image_names import OPERATORS, ORDER
+
+__author__ = "Alessandro Frullo"
+
+SIZES_MP = (1, 4, 12, 24, 40)
+FORMATS = ('PNG', 'JPEG', 'BMP')
+_EXTENSIONS = {'PNG': '.png', 'JPEG': '.jpg', 'BMP': '.bmp'}
+_ASPECT = 4 / 3
+_MANIFEST = 'corpus.json'
+
+# Colori tipici delle mappe di copertura (sfondo mappa e scala della legenda)
+_MAP_COLORS = ['#e8e4d8', '#d5e8d4', '#cfe2f3', '#f4e3c1', '#e6e6e6']
+_SCALE_COLORS = ['#00a000', '#7fd000', '#ffff00', '#ffa500', '#ff0000', '#8b0000']
+
+
+def corpus_names():
+    """Tutte le combinazioni OPERATORS x ORDER come nomi file (senza estensione).
+
+    Una parte dei nomi usa il formato esportato da Excel ('_Workbook_'),
+    così anche quel caso di `extract_label_name` è coperto.
+    """
+    names = []
+    for i, (op, lbl) in enumerate((op, lbl) for op in OPERATORS for lbl in ORDER):
+        names.append(f'{op}_Workbook_{lbl}' if i % 3 == 0 else f'{op} {lbl}')
+    return names
+
+
+def size_for_mp(mp):
+    """Dimensioni in pixel (4:3) di un'immagine da `mp` megapixel."""
+    h = round(math.sqrt(mp * 1_000_000 / _ASPECT))
+    return round(h * _ASPECT), h
+
+
+def make_map_image(size, rng):
+    """Disegna una schermata sintetica di dimensioni `size` con margini bianchi."""
+    w, h = size
+    img = Image.new('RGB', size, 'white')
+    draw = ImageDraw.Draw(img)
+    # Contenuto utile con margini bianchi diversi su ogni lato.
+    left, right = (round(w * rng.uniform(0.02, 0.12)) for _ in range(2))
+    top, bottom = (round(h * rng.uniform(0.02, 0.12)) for _ in range(2))
+    box = (left, top, w - right, h - bottom)
+    draw.rectangle(box, fill=rng.choice(_MAP_COLORS))
+    cw, ch = box[2] - box[0], box[3] - box[1]
+    scale = max(1, min(cw, ch) // 400)
+
+    def point():
+        return box[0] + rng.randrange(cw), box[1] + rng.randrange(ch)
+
+    for _ in range(12):  # isolati / aree
+        cx, cy = point()
+        r = rng.randrange(cw // 20 + 1, cw // 6 + 2)
+        draw.polygon([(cx + r * math.cos(a), cy + r * math.sin(a))
+                      for a in sorted(rng.uniform(0, 2 * math.pi) for _ in range(6))],
+                     fill=rng.choice(_MAP_COLORS))
+    for _ in range(25):  # strade
+        draw.line([point() for _ in range(4)], fill='#9e9e9e', width=3 * scale)
+    # Percorso di misura: punti colorati secondo la scala.
+    x, y = point()
+    step = 6 * scale
+    for _ in range(1500):
+        x = min(max(box[0], x + rng.randint(-step, step)), box[2] - 1)
+        y = min(max(box[1], y + rng.randint(-step, step)), box[3] - 1)
+        r = 2 * scale
+        draw.ellipse((x - r, y - r, x + r, y + r), fill=rng.choice(_SCALE_COLORS))
+    # Legenda nell'angolo in basso a destra.
+    lw, lh = cw // 6, ch // 4
+    lx, ly = box[2] - lw - 10, box[3] - lh - 10
+    draw.rectangle((lx, ly, lx + lw, ly + lh), fill='white', outline='black', width=scale)
+    row = lh // (len(_SCALE_COLORS) + 1)
+    for i, color in enumerate(_SCALE_COLORS):
+        y0 = ly + row // 2 + i * row
+        draw.rectangle((lx + 8, y0, lx + 8 + row, y0 + row - 4), fill=color)
+        draw.line((lx + 16 + row, y0 + row // 2, lx + lw - 8, y0 + row // 2), fill='black', width=scale)
+    return img
+
+
+def generate_corpus(root, sizes_mp=SIZES_MP, formats=FORMATS, count=4, seed=1):
+    """Genera (o riusa) il corpus in `root` e restituisce i suoi insiemi.
+
+    Per ogni dimensione e formato vengono create `count` immagini; in più
+    l'insieme 'names' contiene un'immagine da 1 MP per ogni combinazione
+    OPERATORS x ORDER, usata per la generazione completa dei documenti.
+    Restituisce un dict {nome insieme: {'mp', 'format', 'images'}}.
+    """
+    root = Path(root)
+    params = {'sizes_mp': list(sizes_mp), 'formats': list(formats), 'count': count, 'seed': seed}
+    manifest = root / _MANIFEST
+    if manifest.exists():
+        saved = json.loads(manifest.read_text(encoding='utf-8'))
+        if saved.get('params') == params and all(
+                Path(p).exists() for s in saved['sets'].values() for p in s['images']):
+            return saved['sets']
+
+    names = corpus_names()
+    plan = {f'{mp}MP_{fmt}': (mp, fmt, [names[(k * count + i) % len(names)] for i in range(count)])
+            for k, (mp, fmt) in enumerate((mp, fmt) for mp in sizes_mp for fmt in formats)}
+    plan['names'] = (1, 'PNG', names)
+    sets = {}
+    for set_name, (mp, fmt, stems) in plan.items():
+        folder = root / set_name
+        folder.mkdir(parents=True, exist_ok=True)
+        rng = random.Random(f'{seed}-{set_name}')
+        images = []
+        for stem in stems:
+            out = folder / (stem + _EXTENSIONS[fmt])
+            img = make_map_image(size_for_mp(mp), rng)
+            img.save(out, format=fmt, **({'quality': 90} if fmt == 'JPEG' else {}))
+            images.append(str(out))
+        sets[set_name] = {'mp': mp, 'format': fmt, 'images': images}
+        print(f'Corpus: {set_name} ({len(images)} immagini)', file=sys.stderr)
+    manifest.write_text(json.dumps({'params': params, 'sets': sets}, indent=2), encoding='utf-8')
+    return sets
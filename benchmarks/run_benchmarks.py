@@ -0,0 +1,255 @@
+# ReportGenerator - Benchmark per fase di elaborazione
+# Creato da Alessandro Frullo
+#
+# Esempio:
+#   python benchmarks/run_benchmarks.py --sizes 1 4 12 --out risultati.json
+#   python benchmarks/run_benchmarks.py --compare prima.json dopo.json
+#
+# Su un corpus sintetico (vedi corpus.py) misura separatamente decodifica,
+# ritaglio, etichetta e codifica (fasi registrate da `load_processed_image`),
+# `add_picture` e `doc.save`, poi esegue una generazione completa con
+# `generate_reports`. Confronta inoltre il ritaglio pixel per pixel della
+# prima versione (concatenator.py) con `crop_image`. I
+# risultati vengono salvati in JSON con chiavi ordinate, confrontabili con
+# --compare o con un normale diff. Ogni insieme di immagini e la generazione
+# completa vengono eseguiti in un processo separato, così il picco di
+# memoria riportato è il loro e non il massimo raggiunto fino a quel momento.
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import docx  # noqa: E402
+import PIL  # noqa: E402
+from docx.shared import Inches  # noqa: E402
+from PIL import Image  # noqa: E402
+
+from corpus import FORMATS, SIZES_MP, generate_corpus  # noqa: E402
+from report_engine import (  # noqa: E402
+    SECTION_MARGIN, create_image_pool, crop_image, generate_reports, load_processed_image, new_document,
+)
+from report_settings import ENCODINGS, ImageOptions  # noqa: E402
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+__author__ = "Alessandro Frullo"
+
+STAGES = ('decode', 'crop', 'label', 'encode', 'add_picture', 'save')
+# Fasi di `load_processed_image` (stats) corrispondenti a quelle del benchmark
+_ENGINE_STAGES = {'open': 'decode', 'crop': 'crop', 'label': 'label', 'encode': 'encode'}
+_DEFAULT_CORPUS = Path(tempfile.gettempdir()) / 'reportgenerator_bench_corpus'
+
+
+def peak_rss():
+    """Picco di memoria residente del processo in byte (None se non disponibile).
+
+    È il massimo dall'avvio del processo: ogni misura va eseguita in un
+    processo separato (vedi `_isolated`).
+    """
+    try:
+        import resource
+    except ImportError:  # Windows
+        try:
+            import psutil
+        except ImportError:
+            return None
+        return getattr(psutil.Process().memory_info(), 'peak_wset', None)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024  # Linux: KB
+
+
+def _isolated(func, *args):
+    """Esegue func(*args) in un processo nuovo, così peak_rss misura solo quella chiamata."""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return pool.submit(func, *args).result()
+
+
+def bench_stages(images, options, out_path):
+    """Elabora le immagini fase per fase e restituisce tempi e dimensioni."""
+    times = dict.fromkeys(STAGES, 0.0)
+    doc = new_document()
+    sec = doc.add_section()
+    sec.top_margin = sec.bottom_margin = Inches(SECTION_MARGIN)
+    sec.left_margin = sec.right_margin = Inches(SECTION_MARGIN)
+    max_w = sec.page_width.inches - 2 * SECTION_MARGIN
+    max_h = sec.page_height.inches - 2 * SECTION_MARGIN
+    encoded_bytes = 0
+    for path in images:
+        stats = {}
+        item = load_processed_image(path, options, stats=stats)
+        for stage, name in _ENGINE_STAGES.items():
+            times[name] += stats.get(stage, 0.0)
+        w, h = item.size
+        scale = min(max_w / w, max_h / h)
+        t0 = time.perf_counter()
+        doc.add_picture(item.source, width=Inches(w * scale), height=Inches(h * scale))
+        times['add_picture'] += time.perf_counter() - t0
+        if isinstance(item.source, str):  # originale inserito senza ricodifica
+            encoded_bytes += os.path.getsize(item.source)
+        else:
+            encoded_bytes += item.source.getbuffer().nbytes
+    t0 = time.perf_counter()
+    doc.save(str(out_path))
+    times['save'] = time.perf_counter() - t0
+    total = sum(times.values())
+    return {
+        'images': len(images),
+        'seconds': {k: round(v, 4) for k, v in times.items()},
+        'total_seconds': round(total, 4),
+        'images_per_second': round(len(images) / total, 3) if total else None,
+        'encoded_bytes': encoded_bytes,
+        'output_bytes': out_path.stat().st_size,
+        'peak_rss_bytes': peak_rss(),
+    }
+
+
+def bench_legacy_crop(images, repeat=1):
+    """Confronta crop_sides/crop_top_bottom (concatenator.py) con `crop_image`."""
+    try:
+        import concatenator as legacy
+    except ImportError as e:  # tkinter o tqdm assenti
+        return {'skipped': str(e)}
+    legacy_s = v2_s = 0.0
+    same = True
+    for path in images:
+        with Image.open(path) as src:
+            img = src.convert('RGB')
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            old = legacy.crop_top_bottom(legacy.crop_sides(img))
+            t1 = time.perf_counter()
+            new = crop_image(img, 'both')
+            t2 = time.perf_counter()
+            legacy_s += t1 - t0
+            v2_s += t2 - t1
+        same = same and old.tobytes() == new.tobytes()
+    return {
+        'images': len(images),
+        'legacy_seconds': round(legacy_s, 4),
+        'v2_seconds': round(v2_s, 4),
+        'speedup': round(legacy_s / v2_s, 1) if v2_s else None,
+        'identical': same,
+    }
+
+
+def bench_end_to_end(images, options, workers, out_dir):
+    """Generazione completa dei documenti per tutti gli operatori."""
+    pool = create_image_pool(workers)
+    try:
+        t0 = time.perf_counter()
+        errors = generate_reports('Benchmark', out_dir, {'Drive Test': images}, options, image_pool=pool)
+        elapsed = time.perf_counter() - t0
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return {
+        'images': len(images),
+        'workers': workers,
+        'seconds': round(elapsed, 4),
+        'images_per_second': round(len(images) / elapsed, 3),
+        'output_bytes': sum(p.stat().st_size for p in Path(out_dir).glob('*.docx')),
+        'errors': sorted(errors),
+        'peak_rss_bytes': peak_rss(),
+    }
+
+
+def run(args):
+    sets = generate_corpus(args.corpus, args.sizes, args.formats, args.count, args.seed)
+    options = ImageOptions(crop_mode='both', add_label=True, encoding=args.encoding,
+                           crop_tolerance=args.tolerance)
+    results = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'pillow': PIL.__version__,
+            'python_docx': getattr(docx, '__version__', 'n/d'),
+            'numpy': np.__version__ if np is not None else None,
+            'options': options._asdict(),
+            'corpus': {'sizes_mp': args.sizes, 'formats': args.formats, 'count': args.count, 'seed': args.seed},
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'stages': {},
+        'legacy_crop': {},
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, info in sets.items():
+            if name == 'names':
+                continue
+            print(f'Fasi: {name}...', file=sys.stderr)
+            results['stages'][name] = _isolated(bench_stages, info['images'], options,
+                                                Path(tmp) / f'{name}.docx')
+            if info['mp'] <= args.legacy_max_mp:
+                print(f'Ritaglio legacy: {name}...', file=sys.stderr)
+                results['legacy_crop'][name] = bench_legacy_crop(info['images'])
+        if not args.skip_end_to_end:
+            print('Generazione completa...', file=sys.stderr)
+            results['end_to_end'] = _isolated(bench_end_to_end, sets['names']['images'], options,
+                                              args.workers, Path(tmp) / 'e2e')
+    return results
+
+
+def _walk_numbers(data, prefix=''):
+    if isinstance(data, dict):
+        for key, value in data.items():
+            yield from _walk_numbers(value, f'{prefix}.{key}' if prefix else key)
+    elif isinstance(data, (int, float)) and not isinstance(data, bool):
+        yield prefix, data
+
+
+def compare(old_path, new_path):
+    """Stampa le variazioni dei valori numerici tra due file di risultati."""
+    old = dict(_walk_numbers(json.loads(Path(old_path).read_text(encoding='utf-8'))))
+    new = dict(_walk_numbers(json.loads(Path(new_path).read_text(encoding='utf-8'))))
+    for key in sorted(old.keys() & new.keys()):
+        if key.startswith('meta.'):
+            continue
+        a, b = old[key], new[key]
+        delta = f'{(b - a) / a * 100:+.1f}%' if a else 'n/d'
+        print(f'{key:60} {a:>14} {b:>14} {delta:>9}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark delle fasi di generazione dei report.')
+    parser.add_argument('--corpus', default=str(_DEFAULT_CORPUS), help='cartella del corpus sintetico')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(SIZES_MP), help='megapixel delle immagini')
+    parser.add_argument('--formats', nargs='+', default=list(FORMATS), choices=FORMATS)
+    parser.add_argument('--count', type=int, default=4, help='immagini per dimensione e formato')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--encoding', default='png', choices=ENCODINGS)
+    parser.add_argument('--tolerance', type=int, default=0, help='tolleranza del ritaglio (0-255)')
+    parser.add_argument('--workers', type=int, default=1, help='processi per la generazione completa')
+    parser.add_argument('--legacy-max-mp', type=int, default=1,
+                        help='dimensione massima (MP) per il confronto con il ritaglio legacy, molto lento')
+    parser.add_argument('--skip-end-to-end', action='store_true', help='salta la generazione completa')
+    parser.add_argument('--out', help='file JSON dei risultati (predefinito: stampa a video)')
+    parser.add_argument('--compare', nargs=2, metavar=('PRIMA', 'DOPO'),
+                        help='confronta due file di risultati invece di eseguire i benchmark')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return 0
+    text = json.dumps(run(args), indent=2, sort_keys=True)
+    if args.out:
+        Path(args.out).write_text(text + '\n', encoding='utf-8')
+        print(f'Risultati salvati in {args.out}')
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,135 @@
+# ReportGenerator - Benchmark del tempo di avvio
+# Creato da Alessandro Frullo
+#
+# Esempio:
+#   python benchmarks/startup_time.py --budget-ms 250 --out avvio.json
+#
+# Misura, in processi Python separati, il tempo di import dei moduli della
+# GUI con `-X importtime` e il tempo complessivo del processo, più il costo
+# di `report_engine` (caricato in background dopo la comparsa della
+# finestra). Verifica inoltre che all'avvio non vengano importati moduli
+# pesanti (python-docx, Pillow, NumPy). Con --budget-ms l'uscita è 1 se la
+# mediana supera il limite o se un modulo pesante viene importato, così la
+# CI può seguire il tempo di avvio. Il JSON si confronta con
+# `run_benchmarks.py --compare`.
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+__author__ = "Alessandro Frullo"
+
+_ROOT = Path(__file__).resolve().parent.parent
+# Modulo della GUI e moduli che non devono essere importati al suo avvio
+STARTUP_MODULE = 'concatenator_v2'
+ENGINE_MODULE = 'report_engine'
+HEAVY_MODULES = ('docx', 'PIL', 'numpy', 'lxml')
+
+
+def parse_importtime(text):
+    """{modulo: (self_us, cumulative_us)} dall'output di `-X importtime`."""
+    times = {}
+    for line in text.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3:
+            continue
+        try:
+            self_us, cumulative_us = int(parts[0]), int(parts[1])
+        except ValueError:  # riga di intestazione
+            continue
+        times[parts[2].strip()] = (self_us, cumulative_us)
+    return times
+
+
+def measure_import(module):
+    """Importa `module` in un processo nuovo: (ms di import, ms di processo, moduli importati)."""
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE='1')
+    t0 = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=_ROOT, env=env, capture_output=True, text=True)
+    wall_ms = (time.perf_counter() - t0) * 1000
+    if result.returncode != 0:
+        raise RuntimeError(f'import {module} non riuscito:\n{result.stderr.strip()}')
+    times = parse_importtime(result.stderr)
+    return times[module][1] / 1000, wall_ms, times
+
+
+def bench_module(module, runs):
+    """Mediana e minimo di `runs` import di `module` in processi separati."""
+    import_ms, wall_ms = [], []
+    modules = {}
+    for _ in range(runs):
+        imp, wall, modules = measure_import(module)
+        import_ms.append(imp)
+        wall_ms.append(wall)
+    slowest = sorted(((name, cum) for name, (_, cum) in modules.items() if name.split('.')[0] == name),
+                     key=lambda item: item[1], reverse=True)[:10]
+    return {
+        'import_ms': round(statistics.median(import_ms), 2),
+        'import_ms_min': round(min(import_ms), 2),
+        'process_ms': round(statistics.median(wall_ms), 2),
+        'heavy_modules': sorted({name.split('.')[0] for name in modules} & set(HEAVY_MODULES)),
+        'slowest_packages_ms': {name: round(cum / 1000, 2) for name, cum in slowest},
+    }
+
+
+def run(args):
+    print(f'Avvio: {STARTUP_MODULE}...', file=sys.stderr)
+    results = {
+        'meta': {
+            'python': sys.version.split()[0],
+            'platform': sys.platform,
+            'runs': args.runs,
+            'budget_ms': args.budget_ms,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'startup': bench_module(STARTUP_MODULE, args.runs),
+    }
+    print(f'Motore: {ENGINE_MODULE}...', file=sys.stderr)
+    results['engine'] = bench_module(ENGINE_MODULE, args.runs)
+    return results
+
+
+def check_budget(results, budget_ms):
+    """Messaggi di errore se l'avvio supera il budget o importa moduli pesanti."""
+    startup = results['startup']
+    problems = []
+    if budget_ms is not None and startup['import_ms'] > budget_ms:
+        problems.append(f"import di {STARTUP_MODULE}: {startup['import_ms']:.1f} ms, budget {budget_ms} ms")
+    if startup['heavy_modules']:
+        problems.append(f"moduli pesanti importati all'avvio: {', '.join(startup['heavy_modules'])}")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Misura il tempo di avvio dell'interfaccia grafica.")
+    parser.add_argument('--runs', type=int, default=5, help='processi per misura (si usa la mediana)')
+    parser.add_argument('--budget-ms', type=float, help="tempo massimo di import all'avvio (uscita 1 se superato)")
+    parser.add_argument('--out', help='file JSON dei risultati (predefinito: stampa a video)')
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if args.out:
+        Path(args.out).write_text(text + '\n', encoding='utf-8')
+        print(f'Risultati salvati in {args.out}')
+    else:
+        print(text)
+    startup, engine = results['startup'], results['engine']
+    print(f"Avvio {startup['import_ms']:.1f} ms di import ({startup['process_ms']:.0f} ms di processo), "
+          f"motore in background {engine['import_ms']:.1f} ms", file=sys.stderr)
+    problems = check_budget(results, args.budget_ms)
+    for problem in problems:
+        print(f'ERRORE: {problem}', file=sys.stderr)
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,122 @@
+# ReportGenerator - Manifest di build per la rigenerazione incrementale
+# Creato da Alessandro Frullo
+#
+# Accanto ai documenti generati viene salvato `<titolo>_build.json`, che per
+# ogni `<titolo>_<operatore>.docx` registra l'impronta degli input: percorso,
+# dimensione e data di modifica di ogni immagine, titoli e ordine dei blocchi,
+# parametri di elaborazione e versione del programma, più dimensione e data
+# del documento scritto. Se alla generazione successiva l'impronta è uguale e
+# il documento non è stato toccato, l'operatore viene saltato. Un documento
+# senza voce, o modificato dopo la registrazione, contiene blocchi che il
+# manifest non conosce: la generazione incrementale non lo ricrea.
+
+import json
+import os
+import threading
+from pathlib import Path
+
+__author__ = "Alessandro Frullo"
+
+# Da incrementare quando cambia la struttura del file.
+MANIFEST_FORMAT = 1
+
+
+def _stat(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+def load_json(path, format_version):
+    """Contenuto di un file scritto da `save_json_atomic`, o {} se manca, non è
+    leggibile o ha un formato diverso da `format_version`."""
+    try:
+        data = json.loads(Path(path).read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(data, dict) or data.get('format') != format_version:
+        return {}
+    return data
+
+
+def save_json_atomic(path, format_version, data):
+    """Scrive data (dict) con la versione di formato, prima in un file temporaneo poi sostituito."""
+    path = Path(path)
+    text = json.dumps({'format': format_version, **data}, indent=2)
+    tmp = path.with_name(path.name + '.tmp')
+    try:
+        tmp.write_text(text, encoding='utf-8')
+        os.replace(tmp, path)
+    except OSError:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def fingerprint(blocks, options, version):
+    """Impronta degli input di un documento.
+
+    blocks: lista di (titolo blocco, immagini) come in
+    `report_engine.build_operator_document`; options: `ImageOptions`.
+    Un'immagine non accessibile ha impronta None e rende l'impronta diversa
+    da quella di una generazione riuscita.
+    """
+    return {
+        'version': version,
+        'options': dict(options._asdict()),
+        'blocks': [[title, [[os.path.abspath(p), _stat(p)] for p in images]] for title, images in blocks],
+    }
+
+
+class BuildManifest:
+    """Impronte dei documenti di una generazione, salvate in un file JSON.
+
+    `is_current` e `record` possono essere chiamati da più thread; il file
+    viene scritto solo da `save`.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._documents = load_json(self.path, MANIFEST_FORMAT).get('documents') or {}
+
+    @classmethod
+    def for_output(cls, out_dir, title):
+        """Manifest dei documenti `<title>_*.docx` nella cartella out_dir."""
+        return cls(Path(out_dir) / f'{title}_build.json')
+
+    def tracks(self, doc_path):
+        """True se `doc_path` è stato scritto da una generazione registrata e non è stato modificato.
+
+        Solo un documento così contiene esattamente i blocchi della sua
+        impronta e può essere ricreato da zero senza perdere contenuto.
+        """
+        doc_path = Path(doc_path)
+        with self._lock:
+            entry = self._documents.get(doc_path.name)
+        output = _stat(doc_path)
+        return entry is not None and output is not None and entry.get('output') == output
+
+    def is_current(self, doc_path, inputs):
+        """True se `doc_path` è stato generato da questi input e non è stato modificato."""
+        with self._lock:
+            entry = self._documents.get(Path(doc_path).name)
+        return entry is not None and entry.get('inputs') == inputs and self.tracks(doc_path)
+
+    def record(self, doc_path, inputs):
+        """Registra il documento appena scritto con l'impronta dei suoi input."""
+        doc_path = Path(doc_path)
+        with self._lock:
+            self._documents[doc_path.name] = {'inputs': inputs, 'output': _stat(doc_path)}
+
+    def forget(self, doc_path):
+        """Elimina la voce del documento (da rigenerare comunque la prossima volta)."""
+        with self._lock:
+            self._documents.pop(Path(doc_path).name, None)
+
+    def save(self):
+        """Scrive il manifest (prima in un file temporaneo, poi lo sostituisce)."""
+        with self._lock:
+            documents = dict(self._documents)
+        save_json_atomic(self.path, MANIFEST_FORMAT, {'documents': documents})
@@ -1,155 +1,48 @@
 # ReportGenerator GUI Tool
 # Creato da Alessandro Frullo
 
-import io
+import multiprocessing
 import threading
+import time
 import tkinter as tk
-from functools import lru_cache
 from pathlib import Path
 from tkinter import ttk, filedialog, messagebox, simpledialog
 
-from docx import Document
-from docx.shared import Inches, Pt
-from docx.enum.section import WD_ORIENTATION
-from PIL import Image, ImageChops, ImageDraw, ImageFont
+# Solo moduli leggeri: python-docx e Pillow (report_engine) vengono importati
+# dopo la comparsa della finestra, in background (vedi `_preload_engine`).
+from folder_scan import FolderScanner
+from image_cache import ImageCache
+from image_names import OPERATORS
+from job_queue import JOB_STATES, Job, JobQueue
+from run_report import RunReport
+from thumbnail_view import ThumbnailBrowser
+from report_settings import (
+    ACCENT_BLUE, ACCENT_ORANGE, CROP_MODES, DEFAULT_WORKERS, IMAGE_EXTENSIONS, MAIN_BG, OPERATOR_OUTCOMES,
+    ENCODINGS, OUTPUT_FORMATS, TARGET_DPIS, ImageOptions, VolumeLimits,
+)
 
 __author__ = "Alessandro Frullo"
 
-OPERATORS = ['Iliad', 'TIM', 'VF', 'W3']
-ORDER = [
-    'GSM900 RXLEV', 'LTE800 RSRP', 'LTE800 QUAL', 'UMTS900 RSCP', 'UMTS900 QUAL',
-    'LTE1800 RSRP', 'LTE1800 QUAL', 'LTE2100 RSRP', 'LTE2100 QUAL', 'LTE2100 RSRP B100',
-    'LTE RSRQ B100', 'UMTS2100 RSCP', 'UMTS2100 QUAL', 'LTE2600 RSRP', 'LTE2600 QUAL',
-    'RSRQ 700', 'RSRP 700', 'RSRP 3500', 'RSRQ 3500',
-    '5G SS-RSRP', '5G SS-RSRQ'
-]
-# Versioni minuscole pre-calcolate, usate per l'ordinamento.
-_ORDER_LC = [lbl.lower() for lbl in ORDER]
+# Voce della scelta DPI che mantiene la risoluzione originale
+_DPI_ORIGINAL = 'originale'
+# Intervallo minimo (secondi) tra due aggiornamenti dell'avanzamento
+_PROGRESS_INTERVAL = 0.1
+# Attesa (ms) dopo l'avvio prima di caricare il motore in background
+_PRELOAD_DELAY_MS = 300
+# Massimo di generazioni eseguite contemporaneamente dalla coda
+_MAX_PARALLEL_JOBS = 4
 
-# Color palette
-MAIN_BG = '#f2f2f2'         # Light grey background
-ACCENT_ORANGE = '#FFA500'   # Orange accent
-ACCENT_BLUE = '#003366'     # Dark blue accent
 
-# Dimensioni layout documento (in pollici)
-SECTION_MARGIN = 0.2
-HEADING_SPACE_AFTER = 0.2
+def _preload_engine():
+    """Importa report_engine (python-docx, Pillow) mentre l'utente compila il form.
 
-
-# ---------------------------------------------------------------------------
-# Utilità immagini
-# ---------------------------------------------------------------------------
-
-def extract_label_name(image_path):
-    """Ricava l'etichetta 'OPERATORE TECNOLOGIA' dal nome del file."""
-    filename = Path(image_path).stem
-    for op in OPERATORS:
-        if op in filename:
-            tech = filename.replace('_Workbook_', '').replace(op, '').strip()
-            return f"{op} {tech}"
-    return filename
-
-
-def _crop(img, mode):
-    """Ritaglia i bordi bianchi dell'immagine.
-
-    Usa il bounding-box nativo di Pillow (implementato in C) invece di
-    iterare i pixel in Python: stesso risultato, molto più veloce.
-
-    mode: 'sides' (solo sinistra/destra), 'topbottom' (solo alto/basso)
-          o 'both' (tutti e quattro i lati).
+    Se l'import è ancora in corso alla prima generazione, quella attende il
+    suo completamento (lock degli import); un errore si ripresenta lì.
     """
-    diff = ImageChops.difference(img, Image.new('RGB', img.size, (255, 255, 255)))
-    bbox = diff.getbbox()  # (left, top, right, bottom) con right/bottom esclusivi
-    if bbox is None:
-        return img  # immagine completamente bianca: niente da ritagliare
-    left, top, right, bottom = bbox
-    w, h = img.size
-    if mode == 'sides':
-        return img.crop((left, 0, right, h))
-    if mode == 'topbottom':
-        return img.crop((0, top, w, bottom))
-    return img.crop((left, top, right, bottom))  # 'both'
-
-
-@lru_cache(maxsize=None)
-def _get_font(size=26):
-    """Carica (una sola volta) il font usato per le etichette."""
     try:
-        return ImageFont.truetype('arial.ttf', size)
-    except IOError:
-        return ImageFont.load_default()
-
-
-def _add_label(img, label):
-    """Aggiunge una banda superiore con l'etichetta racchiusa in un riquadro."""
-    font = _get_font()
-    tw, th = font.getbbox(label)[2:]
-    pad_x, pad_y = 20, 10
-    band_h = th + 2 * pad_y
-    new_w = max(img.width, tw + 2 * pad_x)
-    new_img = Image.new('RGB', (new_w, img.height + band_h), 'white')
-    draw = ImageDraw.Draw(new_img)
-    draw.rectangle([(0, 0), (new_w, band_h)], outline=ACCENT_BLUE, width=2)
-    draw.text(((new_w - tw) // 2, pad_y), label, fill=ACCENT_BLUE, font=font)
-    new_img.paste(img, (0, band_h))
-    return new_img
-
-
-def load_processed_image(path, crop_mode, add_label):
-    """Restituisce (source, (width, height)) pronto per `doc.add_picture`.
-
-    Se non serve alcuna modifica si passa direttamente il percorso originale
-    (nessuna ri-codifica). Altrimenti l'immagine elaborata resta in memoria
-    come stream PNG: niente file temporanei su disco.
-    """
-    if crop_mode == 'none' and not add_label:
-        with Image.open(path) as im:
-            return path, im.size
-
-    with Image.open(path) as src:
-        img = src.convert('RGB')
-    if crop_mode != 'none':
-        img = _crop(img, crop_mode)
-    if add_label:
-        img = _add_label(img, extract_label_name(path))
-
-    buf = io.BytesIO()
-    img.save(buf, format='PNG')
-    buf.seek(0)
-    return buf, img.size
-
-
-def sort_images_by_order(images):
-    """Ordina le immagini secondo la sequenza definita in ORDER."""
-    def key(n):
-        stem = Path(n).stem.lower()
-        for i, lbl in enumerate(_ORDER_LC):
-            if lbl in stem:
-                return i
-        return len(_ORDER_LC)
-    return sorted(images, key=key)
-
-
-def add_images_to_doc(doc, title, imgs, crop_mode, add_label):
-    """Aggiunge una sezione con titolo e tutte le immagini ordinate."""
-    sec = doc.add_section()
-    sec.top_margin = sec.bottom_margin = Inches(SECTION_MARGIN)
-    sec.left_margin = sec.right_margin = Inches(SECTION_MARGIN)
-    max_w = sec.page_width.inches - 2 * SECTION_MARGIN
-    doc.add_heading(title, level=2).paragraph_format.space_after = Inches(HEADING_SPACE_AFTER)
-
-    max_h = sec.page_height.inches - 2 * SECTION_MARGIN
-    for path in sort_images_by_order(imgs):
-        try:
-            source, (w, h) = load_processed_image(path, crop_mode, add_label)
-            if w / h > max_w / max_h:
-                final_w, final_h = max_w, max_w * h / w
-            else:
-                final_w, final_h = max_h * w / h, max_h
-            doc.add_picture(source, width=Inches(final_w), height=Inches(final_h))
-        except Exception as e:
-            print(f"Errore con {path}: {e}")
+        import report_engine  # noqa: F401
+    except Exception:
+        pass
 
 
 # ---------------------------------------------------------------------------
@@ -160,7 +53,7 @@ class DocGeneratorApp(tk.Tk):
     def __init__(self):
         super().__init__()
         self.title('ReportGenerator - Selektra Italia')
-        self.geometry('1000x810')
+        self.geometry('1000x990')
         self.configure(bg=MAIN_BG)
 
         # Styles
@@ -188,7 +81,21 @@ class DocGeneratorApp(tk.Tk):
                  font=('Arial', 13)).pack(side='left', pady=14)
 
         self.blocks = {}
+        self.cache = ImageCache()
+        self.scanner = FolderScanner()
+        self._scan_id = 0
+        self._scan_placeholder = False
+        self.queue = JobQueue(self._run_job, on_change=lambda job: self.after(0, self._on_job_changed, job))
+        self._shown_job = None
+        self._batch = []  # job accodati dall'ultima volta che la coda era vuota
+        self._browser = None  # finestra delle miniature (vedi `_show_images`)
+        # Pool di processi per le immagini, condiviso da tutti i job (vedi `_acquire_pool`)
+        self._pool_lock = threading.Lock()
+        self._image_pool = None
+        self._pool_workers = None
+        self._pool_users = 0
         self._create_widgets()
+        self.protocol('WM_DELETE_WINDOW', self._on_close)
 
     def _create_widgets(self):
         # Settings frame
@@ -201,21 +108,93 @@ class DocGeneratorApp(tk.Tk):
         ttk.Entry(frame, textvariable=self.title_var).grid(row=0, column=1, sticky='ew', padx=5)
 
         ttk.Label(frame, text='Modalità Ritaglio:').grid(row=1, column=0, sticky='w', padx=5, pady=5)
+        crop_frame = ttk.Frame(frame)
+        crop_frame.grid(row=1, column=1, sticky='w', padx=5)
         self.crop_var = tk.StringVar(value='none')
-        ttk.Combobox(frame, textvariable=self.crop_var, state='readonly',
-                     values=['none', 'sides', 'topbottom', 'both']).grid(row=1, column=1, sticky='w', padx=5)
-
+        ttk.Combobox(crop_frame, textvariable=self.crop_var, state='readonly',
+                     values=list(CROP_MODES)).pack(side='left')
+        ttk.Label(crop_frame, text='Tolleranza Bianco:').pack(side='left', padx=(15, 5))
+        self.tolerance_var = tk.IntVar(value=0)
+        ttk.Spinbox(crop_frame, textvariable=self.tolerance_var, from_=0, to=255, width=4).pack(side='left')
+        self.crop_native_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(crop_frame, text='Ritaglio non distruttivo',
+                        variable=self.crop_native_var).pack(side='left', padx=(15, 0))
+        dpi_frame = ttk.Frame(frame)
+        dpi_frame.grid(row=1, column=2, sticky='w', padx=5)
+        ttk.Label(dpi_frame, text='DPI Immagini:').pack(side='left')
+        self.dpi_var = tk.StringVar(value=_DPI_ORIGINAL)
+        ttk.Combobox(dpi_frame, textvariable=self.dpi_var, state='readonly', width=10,
+                     values=[str(d) if d else _DPI_ORIGINAL for d in TARGET_DPIS]).pack(side='left', padx=5)
+
+        ttk.Label(frame, text='Codifica Immagini:').grid(row=2, column=0, sticky='w', padx=5, pady=5)
+        enc_frame = ttk.Frame(frame)
+        enc_frame.grid(row=2, column=1, columnspan=2, sticky='w', padx=5)
+        self.encoding_var = tk.StringVar(value='png')
+        ttk.Combobox(enc_frame, textvariable=self.encoding_var, state='readonly', width=10,
+                     values=list(ENCODINGS)).pack(side='left')
+        ttk.Label(enc_frame, text='Compressione PNG:').pack(side='left', padx=(15, 5))
+        self.png_level_var = tk.IntVar(value=ImageOptions._field_defaults['png_compress_level'])
+        ttk.Spinbox(enc_frame, textvariable=self.png_level_var, from_=0, to=9, width=4).pack(side='left')
+        ttk.Label(enc_frame, text='Qualità JPEG:').pack(side='left', padx=(15, 5))
+        self.jpeg_quality_var = tk.IntVar(value=ImageOptions._field_defaults['jpeg_quality'])
+        ttk.Spinbox(enc_frame, textvariable=self.jpeg_quality_var, from_=1, to=95, width=4).pack(side='left')
+        ttk.Label(enc_frame, text='Formato Documenti:').pack(side='left', padx=(15, 5))
+        self.format_var = tk.StringVar(value='docx')
+        ttk.Combobox(enc_frame, textvariable=self.format_var, state='readonly', width=6,
+                     values=list(OUTPUT_FORMATS)).pack(side='left')
+
+        check_frame = ttk.Frame(frame)
+        check_frame.grid(row=3, column=1, columnspan=2, sticky='w', padx=5, pady=5)
         self.label_var = tk.BooleanVar()
-        ttk.Checkbutton(frame, text='Aggiungi Etichetta', variable=self.label_var).grid(row=2, column=1, sticky='w', padx=5, pady=5)
-
-        ttk.Label(frame, text='Cartella di Output:').grid(row=3, column=0, sticky='w', padx=5, pady=5)
+        ttk.Checkbutton(check_frame, text='Aggiungi Etichetta', variable=self.label_var).pack(side='left')
+        self.label_native_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(check_frame, text='Etichetta come testo Word',
+                        variable=self.label_native_var).pack(side='left', padx=(15, 0))
+        self.parallel_ops_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(check_frame, text='Genera operatori in parallelo',
+                        variable=self.parallel_ops_var).pack(side='left', padx=15)
+        self.fast_append_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(check_frame, text='Aggiunta rapida a documenti esistenti',
+                        variable=self.fast_append_var).pack(side='left')
+
+        ttk.Label(frame, text='Processi Immagini:').grid(row=4, column=0, sticky='w', padx=5, pady=5)
+        workers_frame = ttk.Frame(frame)
+        workers_frame.grid(row=4, column=1, sticky='w', padx=5)
+        self.workers_var = tk.IntVar(value=DEFAULT_WORKERS)
+        ttk.Spinbox(workers_frame, textvariable=self.workers_var, from_=1, to=max(DEFAULT_WORKERS, 64),
+                    width=5).pack(side='left')
+        self.incremental_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(workers_frame, text='Rigenera solo documenti modificati',
+                        variable=self.incremental_var).pack(side='left', padx=15)
+        cache_frame = ttk.Frame(frame)
+        cache_frame.grid(row=4, column=2, sticky='w', padx=5)
+        self.cache_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(cache_frame, text='Usa cache immagini', variable=self.cache_var).pack(side='left')
+        ttk.Button(cache_frame, text='Svuota Cache', command=self._clear_cache).pack(side='left', padx=5)
+        self.save_report_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(cache_frame, text='Salva report esecuzione',
+                        variable=self.save_report_var).pack(side='left', padx=(10, 0))
+
+        ttk.Label(frame, text='Dividi Volumi Oltre:').grid(row=5, column=0, sticky='w', padx=5, pady=5)
+        volume_frame = ttk.Frame(frame)
+        volume_frame.grid(row=5, column=1, columnspan=2, sticky='w', padx=5)
+        self.volume_mb_var = tk.IntVar(value=0)
+        self.volume_images_var = tk.IntVar(value=0)
+        self.volume_pages_var = tk.IntVar(value=0)
+        for var, text in ((self.volume_mb_var, 'MB'), (self.volume_images_var, 'immagini'),
+                          (self.volume_pages_var, 'pagine')):
+            ttk.Spinbox(volume_frame, textvariable=var, from_=0, to=100000, width=7).pack(side='left')
+            ttk.Label(volume_frame, text=text).pack(side='left', padx=(3, 15))
+        ttk.Label(volume_frame, text='(0 = nessun limite)').pack(side='left')
+
+        ttk.Label(frame, text='Cartella di Output:').grid(row=6, column=0, sticky='w', padx=5, pady=5)
         self.out_var = tk.StringVar()
-        ttk.Entry(frame, textvariable=self.out_var).grid(row=3, column=1, sticky='ew', padx=5)
-        ttk.Button(frame, text='Sfoglia...', command=self._select_output_folder).grid(row=3, column=2, padx=5)
+        ttk.Entry(frame, textvariable=self.out_var).grid(row=6, column=1, sticky='ew', padx=5)
+        ttk.Button(frame, text='Sfoglia...', command=self._select_output_folder).grid(row=6, column=2, padx=5)
 
-        ttk.Label(frame, text='Sottocartelle:').grid(row=4, column=0, sticky='nw', padx=5, pady=5)
+        ttk.Label(frame, text='Sottocartelle:').grid(row=7, column=0, sticky='nw', padx=5, pady=5)
         sub_frame = ttk.Frame(frame)
-        sub_frame.grid(row=4, column=1, columnspan=2, sticky='ew', padx=5, pady=5)
+        sub_frame.grid(row=7, column=1, columnspan=2, sticky='ew', padx=5, pady=5)
         self.subfolders_list = tk.Listbox(sub_frame, font=('Arial', 10), height=5,
                                           selectmode='browse', activestyle='none',
                                           fg=ACCENT_BLUE, bg='white', relief='flat',
@@ -247,21 +226,56 @@ class DocGeneratorApp(tk.Tk):
         btn_frame.grid(row=0, column=1, sticky='ns', padx=5)
         ttk.Button(btn_frame, text='Aggiungi Blocco', command=self._add_block).pack(fill='x', pady=5)
         ttk.Button(btn_frame, text='Rimuovi Blocco', command=self._remove_block).pack(fill='x', pady=5)
+        ttk.Button(btn_frame, text='Verifica Immagini', command=self._check_images).pack(fill='x', pady=5)
+        ttk.Button(btn_frame, text='Mostra Immagini', command=self._show_images).pack(fill='x', pady=5)
+        self.blocks_list.bind('<Double-1>', lambda e: self._show_images(self._selected_block()))
 
-        # Generate and progress frame
+        # Generate and queue frame
         gen_frame = ttk.Frame(self)
-        gen_frame.pack(fill='x', padx=15, pady=10)
+        gen_frame.pack(fill='x', padx=15, pady=(10, 0))
         self.generate_btn = ttk.Button(gen_frame, text='Genera Documenti',
                                        command=self._generate_documents, style='Primary.TButton')
         self.generate_btn.pack(side='left')
+        self.cancel_btn = ttk.Button(gen_frame, text='Annulla', command=self._cancel_generation,
+                                     state='disabled')
+        self.cancel_btn.pack(side='left', padx=(10, 0))
         self.progress = ttk.Progressbar(gen_frame, style='Horizontal.TProgressbar', orient='horizontal',
                                          mode='determinate', maximum=100)
         self.progress.pack(side='left', fill='x', expand=True, padx=10)
+        self.status_var = tk.StringVar()
+        ttk.Label(self, textvariable=self.status_var).pack(fill='x', padx=15)
+        self.ops_var = tk.StringVar()
+        ttk.Label(self, textvariable=self.ops_var).pack(fill='x', padx=15)
+
+        queue_frame = ttk.Labelframe(self, text='Coda Generazioni')
+        queue_frame.pack(fill='x', padx=15, pady=5)
+        queue_frame.columnconfigure(0, weight=1)
+        self.jobs_tree = ttk.Treeview(queue_frame, columns=('title', 'out_dir', 'state', 'progress'),
+                                      show='headings', height=4, selectmode='extended')
+        for col, text, width in (('title', 'Titolo', 180), ('out_dir', 'Cartella di Output', 380),
+                                 ('state', 'Stato', 150), ('progress', 'Immagini', 90)):
+            self.jobs_tree.heading(col, text=text)
+            self.jobs_tree.column(col, width=width, stretch=col == 'out_dir')
+        self.jobs_tree.grid(row=0, column=0, sticky='ew', padx=5)
+        self.jobs_tree.bind('<<TreeviewSelect>>', lambda e: self._show_job(self._selected_job()))
+        self.jobs_tree.bind('<Double-1>', lambda e: self._show_job_details(self._selected_job()))
+        jobs_scroll = ttk.Scrollbar(queue_frame, orient='vertical', command=self.jobs_tree.yview)
+        jobs_scroll.grid(row=0, column=1, sticky='ns')
+        self.jobs_tree.config(yscrollcommand=jobs_scroll.set)
+        queue_btns = ttk.Frame(queue_frame)
+        queue_btns.grid(row=0, column=2, sticky='n', padx=5)
+        ttk.Label(queue_btns, text='Job contemporanei:').pack(anchor='w')
+        self.max_jobs_var = tk.IntVar(value=1)
+        ttk.Spinbox(queue_btns, textvariable=self.max_jobs_var, from_=1, to=_MAX_PARALLEL_JOBS, width=5,
+                    command=self._set_max_jobs).pack(anchor='w', pady=(0, 5))
+        ttk.Button(queue_btns, text='Rimuovi Completati', command=self._clear_finished_jobs).pack(fill='x')
 
         # Footer label
         footer = ttk.Label(self, text='Creato da Alessandro Frullo', style='Footer.TLabel')
         footer.pack(side='bottom', pady=5)
 
+        self.after(_PRELOAD_DELAY_MS, lambda: threading.Thread(target=_preload_engine, daemon=True).start())
+
     def _select_output_folder(self):
         folder = filedialog.askdirectory(title='Seleziona Cartella di Output')
         if folder:
@@ -269,38 +283,58 @@ class DocGeneratorApp(tk.Tk):
             self._refresh_subfolders(folder)
 
     def _refresh_subfolders(self, folder):
+        # La scansione gira in background (vedi folder_scan): i risultati di
+        # una scansione superata da una più recente vengono ignorati.
+        self._scan_id += 1
+        scan_id = self._scan_id
         self.subfolders_list.delete(0, 'end')
-        subfolders = sorted(p for p in Path(folder).iterdir() if p.is_dir())
-        if not subfolders:
-            self.subfolders_list.insert('end', '(nessuna sottocartella trovata)')
+        self.subfolders_list.insert('end', '(ricerca in corso...)')
+        self._scan_placeholder = True
+        self.scanner.scan(
+            folder,
+            on_batch=lambda batch: self.after(0, lambda: self._add_subfolders(scan_id, batch)),
+            on_done=lambda error: self.after(0, lambda: self._on_scan_done(scan_id, error)),
+        )
+
+    def _add_subfolders(self, scan_id, batch):
+        if scan_id != self._scan_id:
             return
-        for path in subfolders:
-            try:
-                child_names = {s.name.lower() for s in path.iterdir() if s.is_dir()}
-            except PermissionError:
-                child_names = set()
-            has_4g = any('4g' in s for s in child_names)
-            has_5g = any('5g' in s for s in child_names)
-            self.subfolders_list.insert('end', path.name)
+        if self._scan_placeholder:
+            self.subfolders_list.delete(0, 'end')
+            self._scan_placeholder = False
+        for info in batch:
+            self.subfolders_list.insert('end', info.name)
             idx = self.subfolders_list.size() - 1
-            if has_4g and has_5g:
+            if info.has_4g and info.has_5g:
                 self.subfolders_list.itemconfig(idx, foreground='white', background=ACCENT_ORANGE,
                                                 selectbackground='#e09400', selectforeground='white')
-            elif has_5g:
+            elif info.has_5g:
                 self.subfolders_list.itemconfig(idx, foreground='white', background=ACCENT_BLUE,
                                                 selectbackground='#002244', selectforeground='white')
 
+    def _on_scan_done(self, scan_id, error):
+        if scan_id != self._scan_id or not self._scan_placeholder:
+            return
+        self.subfolders_list.delete(0, 'end')
+        self.subfolders_list.insert('end', f'(errore: {error})' if error else '(nessuna sottocartella trovata)')
+        self._scan_placeholder = False
+
+    def _clear_cache(self):
+        freed = self.cache.clear()
+        messagebox.showinfo('Cache', f'Cache svuotata: {freed / 1024 ** 2:.1f} MB liberati')
+
     def _add_block(self):
         title = simpledialog.askstring('Titolo Blocco', 'Inserisci il titolo del blocco:')
         if not title:
             return
         files = filedialog.askopenfilenames(
             title=f'Seleziona immagini per: {title}',
-            filetypes=[('Images', '*.jpg;*.png;*.jpeg;*.bmp;*.gif')],
+            filetypes=[('Images', ';'.join(f'*{ext}' for ext in IMAGE_EXTENSIONS))],
         )
         if files:
             self.blocks[title] = list(files)
             self.blocks_list.insert('end', title)
+            self._refresh_browser()
 
     def _remove_block(self):
         sel = self.blocks_list.curselection()
@@ -309,12 +343,92 @@ class DocGeneratorApp(tk.Tk):
         title = self.blocks_list.get(sel)
         del self.blocks[title]
         self.blocks_list.delete(sel)
+        self._refresh_browser()
+
+    def _selected_block(self):
+        sel = self.blocks_list.curselection()
+        return self.blocks_list.get(sel[0]) if sel else None
+
+    def _show_images(self, title=None):
+        """Apre (o porta in primo piano) la finestra con le miniature dei blocchi."""
+        if not self.blocks:
+            messagebox.showerror('Errore', 'Aggiungi almeno un blocco')
+            return
+        if self._browser is None or not self._browser.winfo_exists():
+            self._browser = ThumbnailBrowser(self, self.blocks)
+        else:
+            self._browser.lift()
+        if title is not None:
+            self._browser.update_idletasks()
+            self._browser.show_block(title)
+
+    def _refresh_browser(self):
+        if self._browser is not None and self._browser.winfo_exists():
+            self._browser.set_blocks(self.blocks)
+
+    @staticmethod
+    def _get_int(var, default, lo, hi=None):
+        """Legge un intero da una variabile Tk, limitato a [lo, hi]."""
+        try:
+            value = int(var.get())
+        except (tk.TclError, ValueError):
+            return default
+        return max(lo, value if hi is None else min(hi, value))
+
+    def _image_options(self):
+        dpi = self.dpi_var.get()
+        return ImageOptions(
+            crop_mode=self.crop_var.get(),
+            add_label=self.label_var.get(),
+            target_dpi=int(dpi) if dpi != _DPI_ORIGINAL else None,
+            encoding=self.encoding_var.get(),
+            png_compress_level=self._get_int(self.png_level_var, 6, 0, 9),
+            jpeg_quality=self._get_int(self.jpeg_quality_var, 85, 1, 95),
+            crop_tolerance=self._get_int(self.tolerance_var, 0, 0, 255),
+            crop_native=self.crop_native_var.get(),
+            label_native=self.label_native_var.get(),
+        )
+
+    def _run_preflight(self, blocks, options, on_done):
+        """Verifica le immagini in background (vedi `preflight`); on_done(esito) sul thread Tk."""
+        self.status_var.set('Verifica delle immagini in corso...')
+
+        def run():
+            try:
+                from preflight import run_preflight
+                result = run_preflight(blocks, options)
+            except Exception as e:
+                result = e
+            self.after(0, on_done, result)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def _check_images(self):
+        if not self.blocks:
+            messagebox.showerror('Errore', 'Aggiungi almeno un blocco')
+            return
+        workers = self._get_int(self.workers_var, DEFAULT_WORKERS, 1)
+
+        def done(result):
+            self.status_var.set('')
+            if isinstance(result, Exception):
+                messagebox.showerror('Errore', f'Verifica non riuscita: {result}')
+                return
+            show = messagebox.showwarning if result.issues else messagebox.showinfo
+            show('Verifica Immagini', result.summary(workers))
+
+        self._run_preflight({t: list(imgs) for t, imgs in self.blocks.items()}, self._image_options(), done)
 
     def _generate_documents(self):
         title = self.title_var.get().strip().replace(' ', '_')
         out_dir = Path(self.out_var.get() or Path.cwd())
-        crop_mode = self.crop_var.get()
-        add_label = self.label_var.get()
+        options = self._image_options()
+        workers = self._get_int(self.workers_var, DEFAULT_WORKERS, 1)
+        volume_limits = VolumeLimits(
+            max_bytes=self._get_int(self.volume_mb_var, 0, 0) * 1024 ** 2 or None,
+            max_images=self._get_int(self.volume_images_var, 0, 0) or None,
+            max_pages=self._get_int(self.volume_pages_var, 0, 0) or None,
+        )
         if not title:
             messagebox.showerror('Errore', 'Titolo obbligatorio')
             return
@@ -322,71 +436,241 @@ class DocGeneratorApp(tk.Tk):
             messagebox.showerror('Errore', 'Aggiungi almeno un blocco')
             return
 
-        # Disable UI and reset progress
-        self.generate_btn.config(state='disabled')
-        self.progress['value'] = 0
-
-        # Run generation in background thread
-        threading.Thread(
-            target=self._run_generation,
-            args=(title, out_dir, crop_mode, add_label),
-            daemon=True,
-        ).start()
-
-    def _run_generation(self, title, out_dir, crop_mode, add_label):
+        # Il job contiene una copia dei blocchi e delle impostazioni: si può
+        # preparare e accodare la campagna successiva mentre questa è in corso.
+        job = Job(title, out_dir, self.blocks, options, settings={
+            'workers': workers,
+            'parallel_ops': self.parallel_ops_var.get(),
+            'cache': self.cache if self.cache_var.get() else None,
+            'fast_append': self.fast_append_var.get(),
+            'save_report': self.save_report_var.get(),
+            'incremental': self.incremental_var.get(),
+            'output_format': self.format_var.get(),
+            'volume_limits': volume_limits,
+        })
+
+        # Prima di accodare si controllano le immagini: file illeggibili o
+        # senza operatore emergono subito, non a metà generazione.
+        def preflight_done(result):
+            self.status_var.set('')
+            if isinstance(result, Exception):
+                print(f'Verifica delle immagini non riuscita: {result}')
+            elif result.errors or any(i.kind == 'no_operator' for i in result.issues):
+                if not messagebox.askyesno('Verifica Immagini', f'{result.summary(workers)}\n\n'
+                                           'Generare comunque? Le immagini non valide verranno escluse '
+                                           'dai documenti.'):
+                    return
+                invalid = {issue.path for issue in result.errors}
+                job.blocks = {name: [p for p in images if p not in invalid]
+                              for name, images in job.blocks.items()}
+                job.blocks = {name: images for name, images in job.blocks.items() if images}
+            self._submit_job(job)
+
+        self._run_preflight(job.blocks, options, preflight_done)
+
+    def _submit_job(self, job):
+        self.jobs_tree.insert('', 'end', iid=str(job.id))
+        self._set_max_jobs()
+        if self.queue.idle:
+            self._batch = []
+        self._batch.append(job)
+        if self._shown_job is None or self._shown_job.finished:
+            self._shown_job = job
+        self.queue.submit(job)
+
+    def _acquire_pool(self, workers):
+        """Pool di processi per le immagini, creato al primo job e condiviso dai successivi.
+
+        I job in esecuzione insieme usano lo stesso pool, quindi i processi
+        non superano mai `workers`; un numero di processi diverso viene
+        applicato quando il pool non è in uso. Va rilasciato con `_release_pool`.
+        """
+        from report_engine import create_image_pool
+        with self._pool_lock:
+            if self._pool_users == 0 and workers != self._pool_workers:
+                if self._image_pool is not None:
+                    self._image_pool.shutdown(wait=False)
+                self._image_pool = create_image_pool(workers)
+                self._pool_workers = workers
+            self._pool_users += 1
+            return self._image_pool
+
+    def _release_pool(self):
+        with self._pool_lock:
+            self._pool_users -= 1
+
+    def _on_close(self):
+        for job in self.queue.jobs:
+            if not job.finished:
+                self.queue.cancel(job)
+        with self._pool_lock:
+            if self._image_pool is not None:
+                self._image_pool.shutdown(wait=False, cancel_futures=True)
+                self._image_pool = None
+        self.destroy()
+
+    def _run_job(self, job):
+        """Esegue un job della coda (in un thread della coda): restituisce (errori, riepilogo)."""
+        from report_engine import generate_reports
+        settings = job.settings
+        done = {}
+        report = RunReport()
+        start = time.perf_counter()
+        last_update = [0.0]
+
+        def operator_done(op, error, outcome):
+            done[op] = outcome
+            job.operators[op] = f'errore - {error}' if error else OPERATOR_OUTCOMES[outcome]
+            self.after(0, self._on_job_changed, job)
+
+        def progress(count, total):
+            # Chiamata da più thread per ogni immagine: gli aggiornamenti della
+            # GUI vengono limitati per non intasare la coda degli eventi Tk.
+            job.progress = (count, total)
+            now = time.perf_counter()
+            if count < total and now - last_update[0] < _PROGRESS_INTERVAL:
+                return
+            last_update[0] = now
+            self.after(0, self._on_progress, job, count, total, now - start)
+
+        pool = self._acquire_pool(settings['workers'])
         try:
-            out_dir.mkdir(parents=True, exist_ok=True)
-            ops = {op: out_dir / f'{title}_{op}.docx' for op in OPERATORS}
-            # Stem in minuscolo pre-calcolato una sola volta per ogni immagine.
-            stems = {p: Path(p).stem.lower() for pics in self.blocks.values() for p in pics}
-            total = len(OPERATORS)
-
-            for i, op in enumerate(OPERATORS):
-                op_lc = op.lower()
-                # Per ogni blocco, le immagini che appartengono a questo operatore.
-                blocks_for_op = [
-                    (blk, [p for p in pics if op_lc in stems[p]])
-                    for blk, pics in self.blocks.items()
-                ]
-                blocks_for_op = [(blk, rel) for blk, rel in blocks_for_op if rel]
-                if not blocks_for_op:
-                    self.after(0, lambda v=int((i + 1) / total * 100): self._set_progress(v))
-                    continue
-
-                path = ops[op]
-                exists = path.exists()
-                doc = Document(str(path)) if exists else Document()
-                if not exists:
-                    style = doc.styles['Normal']
-                    style.font.name = 'Arial'
-                    style.font.size = Pt(12)
-                    sec0 = doc.sections[0]
-                    sec0.orientation = WD_ORIENTATION.LANDSCAPE
-                    sec0.page_width, sec0.page_height = sec0.page_height, sec0.page_width
-
-                for blk, rel in blocks_for_op:
-                    add_images_to_doc(doc, blk, rel, crop_mode, add_label)
-                doc.save(str(path))
-                self.after(0, lambda v=int((i + 1) / total * 100): self._set_progress(v))
-
-            self.after(0, lambda: self._on_complete(out_dir))
-        except Exception as e:
-            self.after(0, lambda err=e: self._on_error(err))
-
-    def _set_progress(self, value):
-        self.progress['value'] = value
-
-    def _on_complete(self, out_dir):
-        self.progress['value'] = 100
-        self.generate_btn.config(state='normal')
-        messagebox.showinfo('Successo', f'Documenti creati in: {out_dir}')
-
-    def _on_error(self, error):
-        self.progress['value'] = 0
-        self.generate_btn.config(state='normal')
-        messagebox.showerror('Errore', f'Generazione non riuscita: {error}')
+            errors = generate_reports(job.title, job.out_dir, job.blocks, job.options,
+                                      image_pool=pool, parallel_ops=settings['parallel_ops'],
+                                      on_operator_done=operator_done, cache=settings['cache'],
+                                      fast_append=settings['fast_append'], report=report,
+                                      incremental=settings['incremental'], on_progress=progress,
+                                      cancel=job.cancel, output_format=settings['output_format'],
+                                      volume_limits=settings['volume_limits'])
+        finally:
+            self._release_pool()
+        report.finish()
+        if settings['save_report']:
+            for suffix in ('json', 'csv'):
+                report.write(job.out_dir / f'{job.title}_report.{suffix}')
+        summary = report.summary()
+        if settings['incremental']:
+            built = [op for op in OPERATORS if done.get(op) == 'built']
+            skipped = [op for op in OPERATORS if done.get(op) == 'skipped']
+            removed = [op for op in OPERATORS if done.get(op) == 'removed']
+            summary = (f"Rigenerati: {', '.join(built) or 'nessuno'}\n"
+                       f"Invariati (saltati): {', '.join(skipped) or 'nessuno'}\n"
+                       f"Eliminati (senza immagini): {', '.join(removed) or 'nessuno'}\n\n{summary}")
+        return errors, summary
+
+    def _selected_job(self):
+        selection = self.jobs_tree.selection()
+        if not selection:
+            return None
+        return next((job for job in self.queue.jobs if str(job.id) == selection[0]), None)
+
+    def _set_max_jobs(self):
+        self.queue.set_max_workers(self._get_int(self.max_jobs_var, 1, 1, _MAX_PARALLEL_JOBS))
+
+    def _clear_finished_jobs(self):
+        self.queue.clear_finished()
+        remaining = {str(job.id) for job in self.queue.jobs}
+        for iid in self.jobs_tree.get_children():
+            if iid not in remaining:
+                self.jobs_tree.delete(iid)
+        if self._shown_job is not None and str(self._shown_job.id) not in remaining:
+            self._show_job(None)
+
+    def _cancel_generation(self):
+        selection = set(self.jobs_tree.selection())
+        jobs = [job for job in self.queue.jobs if str(job.id) in selection and not job.finished]
+        if not jobs and self._shown_job is not None and not self._shown_job.finished:
+            jobs = [self._shown_job]
+        for job in jobs:
+            self.queue.cancel(job)
+            self._on_job_changed(job)
+
+    def _job_state_text(self, job):
+        if job.state == 'running' and job.cancel.is_set():
+            return 'annullamento in corso...'
+        if job.state == 'errors':
+            return f'{JOB_STATES[job.state]} ({len(job.errors)})'
+        return JOB_STATES[job.state]
+
+    def _on_job_changed(self, job):
+        """Aggiorna la riga del job e, se è quello mostrato, la barra di avanzamento."""
+        iid = str(job.id)
+        if self.jobs_tree.exists(iid):
+            count, total = job.progress
+            self.jobs_tree.item(iid, values=(job.title, str(job.out_dir), self._job_state_text(job),
+                                             f'{count}/{total}' if total else ''))
+        if job.state == 'running' and (self._shown_job is None or self._shown_job.finished):
+            self._shown_job = job
+        if job is self._shown_job:
+            self._show_job(job)
+        self.cancel_btn.config(state='normal' if any(not j.finished for j in self.queue.jobs) else 'disabled')
+        if job.finished and self.queue.idle:
+            self._on_queue_done()
+
+    def _on_progress(self, job, count, total, elapsed):
+        if job.cancel.is_set():
+            return
+        self._on_job_changed(job)
+        if job is not self._shown_job:
+            return
+        rate = count / elapsed if elapsed > 0 else 0
+        text = f'{job.title}: {count}/{total} immagini · {rate:.1f} img/s'
+        if rate and count < total:
+            eta = int((total - count) / rate)
+            text += f' · tempo rimanente {eta // 60}:{eta % 60:02d}'
+        self.status_var.set(text)
+
+    def _show_job(self, job):
+        """Mostra nella barra di avanzamento lo stato del job (None = nessuno)."""
+        self._shown_job = job
+        if job is None:
+            self.progress['value'] = 0
+            self.status_var.set('')
+            self.ops_var.set('')
+            return
+        count, total = job.progress
+        if job.state in ('done', 'errors'):
+            self.progress['value'] = 100
+        else:
+            self.progress['value'] = count / total * 100 if total else 0
+        if job.state == 'running' and not job.cancel.is_set() and total:
+            text = f'{job.title}: {count}/{total} immagini'
+        else:
+            text = f'{job.title}: {self._job_state_text(job)}'
+        self.status_var.set(text)
+        self.ops_var.set(' · '.join(f'{o}: {t}' for o, t in job.operators.items()))
+
+    def _show_job_details(self, job):
+        if job is None or not job.finished:
+            return
+        if job.state == 'failed':
+            messagebox.showerror('Errore', f'Generazione non riuscita: {job.error}')
+        elif job.state == 'cancelled':
+            messagebox.showinfo('Annullato', 'Generazione annullata: i documenti non completati '
+                                             'non sono stati modificati.')
+        elif job.errors:
+            details = '\n'.join(f'{op}: {err}' for op, err in job.errors.items())
+            messagebox.showwarning('Attenzione', f'Documenti creati in: {job.out_dir}\n\n'
+                                                 f'Operatori non generati:\n{details}\n\n{job.summary}')
+        else:
+            messagebox.showinfo('Successo', f'Documenti creati in: {job.out_dir}\n\n{job.summary}')
+
+    def _on_queue_done(self):
+        """Riepilogo al termine di tutti i job accodati."""
+        jobs, self._batch = self._batch, []
+        if not jobs:
+            return
+        if len(jobs) == 1:
+            self._show_job_details(jobs[0])
+            return
+        lines = [f'{job.title}: {self._job_state_text(job)}' for job in jobs]
+        problems = any(job.state in ('errors', 'failed') for job in jobs)
+        show = messagebox.showwarning if problems else messagebox.showinfo
+        show('Coda completata', '\n'.join(lines) + '\n\nDoppio clic su un job per i dettagli.')
 
 
 if __name__ == '__main__':
+    # Necessario per il pool di processi nell'eseguibile PyInstaller.
+    multiprocessing.freeze_support()
     app = DocGeneratorApp()
     app.mainloop()
@@ -0,0 +1,307 @@
+# ReportGenerator - Operazioni a livello di pacchetto .docx (zip)
+# Creato da Alessandro Frullo
+#
+# Aggiunta rapida di nuovi blocchi a un documento esistente: invece di
+# caricarlo con python-docx (parsing di tutto l'XML e caricamento in memoria
+# di ogni immagine) e risalvarlo (ricompressione di tutto), il contenuto
+# nuovo viene costruito in un documento vuoto e innestato nel pacchetto zip
+# esistente. I membri non modificati vengono copiati come byte compressi
+# grezzi, senza decompressione: il costo dipende solo dal contenuto nuovo.
+# Un'immagine già presente nel pacchetto (stessi byte) riusa la parte
+# esistente, come farebbe python-docx ricaricando il documento.
+#
+# Scrittura in streaming di un documento nuovo: ogni immagine viene scritta
+# nello zip appena inserita e la sua copia in memoria viene liberata, così la
+# memoria non cresce con il numero di immagini. Le immagini (PNG/JPEG, già
+# compresse) sono memorizzate senza compressione; solo le parti XML vengono
+# compresse.
+
+import copy
+import os
+import re
+import struct
+import time
+import zipfile
+import zlib
+from pathlib import Path
+
+from docx.opc.packuri import CONTENT_TYPES_URI, PACKAGE_URI
+from docx.opc.pkgwriter import _ContentTypesItem
+from docx.parts.image import ImagePart
+
+__author__ = "Alessandro Frullo"
+
+_DOCUMENT = 'word/document.xml'
+_DOCUMENT_RELS = 'word/_rels/document.xml.rels'
+_CONTENT_TYPES = '[Content_Types].xml'
+_STYLES = 'word/styles.xml'
+_IMAGE_RELTYPE = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/image'
+
+# Intestazione locale di un membro zip (APPNOTE 4.3.7), 30 byte.
+_LOCAL_HEADER = struct.Struct('<4s5H3L2H')
+_LOCAL_SIGNATURE = b'PK\x03\x04'
+
+_BODY_END = re.compile(r'</w:sectPr>\s*</w:body>\s*</w:document>\s*$')
+_REL_ID = re.compile(r'\bId="rId(\d+)"')
+_DOCPR_ID = re.compile(r'(<wp:docPr\b[^>]*?\bid=")(\d+)(")')
+_EMBED = re.compile(r'(\br:(?:embed|link|id)=")(rId\d+)(")')
+_MEDIA_NUM = re.compile(r'^word/media/image(\d+)\.')
+_IMAGE_REL = re.compile(r'<Relationship\b(?=[^>]*\bType="' + re.escape(_IMAGE_RELTYPE) + r'")'
+                        r'(?=[^>]*\bId="(rId\d+)")(?=[^>]*\bTarget="([^"]+)")[^>]*>')
+
+
+class AppendNotSupported(ValueError):
+    """Il documento esistente non ha la struttura attesa per l'aggiunta rapida."""
+
+
+def copy_member_raw(src_fp, zout, info):
+    """Copia il membro `info` nello zip `zout` senza decomprimerlo.
+
+    src_fp è il file (aperto in binario) dello zip di origine. I dati
+    compressi vengono letti e riscritti così come sono; CRC e dimensioni
+    provengono dalla directory centrale di origine.
+    """
+    src_fp.seek(info.header_offset)
+    fields = _LOCAL_HEADER.unpack(src_fp.read(_LOCAL_HEADER.size))
+    if fields[0] != _LOCAL_SIGNATURE:
+        raise zipfile.BadZipFile(f'intestazione locale non valida per {info.filename}')
+    name_len, extra_len = fields[-2], fields[-1]
+    src_fp.seek(name_len + extra_len, os.SEEK_CUR)
+    raw = src_fp.read(info.compress_size)
+
+    out = copy.copy(info)
+    # Senza data descriptor: CRC e dimensioni vanno nell'intestazione locale.
+    out.flag_bits &= ~0x08
+    out.header_offset = zout.fp.tell()
+    zip64 = max(out.file_size, out.compress_size) > zipfile.ZIP64_LIMIT
+    zout.fp.write(out.FileHeader(zip64))
+    zout.fp.write(raw)
+    zout.filelist.append(out)
+    zout.NameToInfo[out.filename] = out
+    zout.start_dir = zout.fp.tell()
+    zout._didModify = True
+
+
+def _body_fragment(doc):
+    """Restituisce (contenuto, sectPr finale) del corpo di un documento nuovo.
+
+    Il primo paragrafo del documento nuovo contiene solo l'interruzione della
+    sezione iniziale vuota e viene scartato: al suo posto l'aggiunta inserisce
+    l'interruzione dell'ultima sezione del documento esistente.
+    """
+    xml = doc.part.blob.decode('utf-8')
+    start = xml.index('<w:body>') + len('<w:body>')
+    end = xml.rindex('</w:body>')
+    body = xml[start:end]
+    first_break = '</w:sectPr></w:pPr></w:p>'
+    if not body.startswith('<w:p><w:pPr><w:sectPr'):
+        raise AppendNotSupported('struttura inattesa del documento nuovo')
+    body = body[body.index(first_break) + len(first_break):]
+    final = body.rindex('<w:sectPr')
+    return body[:final], body[final:]
+
+
+class DocxAppender:
+    """Aggiunge il contenuto di un documento nuovo a un .docx esistente.
+
+    La validazione avviene alla creazione: se il documento esistente non è
+    compatibile (ad esempio manca lo stile dei titoli o l'XML ha una forma
+    inattesa) viene sollevato `AppendNotSupported`, prima di qualunque
+    elaborazione, e il chiamante può ripiegare sul percorso completo.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        try:
+            with zipfile.ZipFile(self.path) as zin:
+                self._document = zin.read(_DOCUMENT).decode('utf-8')
+                self._rels = zin.read(_DOCUMENT_RELS).decode('utf-8')
+                self._content_types = zin.read(_CONTENT_TYPES).decode('utf-8')
+                styles = zin.read(_STYLES).decode('utf-8')
+                self._names = zin.namelist()
+                # Media esistenti per CRC e dimensione (dalla directory
+                # centrale, senza leggerli): un'immagine uguale riusa la parte.
+                self._media = {}
+                for info in zin.infolist():
+                    if info.filename.startswith('word/media/'):
+                        self._media.setdefault((info.CRC, info.file_size), []).append(info.filename)
+        except (KeyError, zipfile.BadZipFile, UnicodeDecodeError) as e:
+            raise AppendNotSupported(str(e))
+
+        body_start = self._document.find('<w:body')
+        if body_start < 0:
+            raise AppendNotSupported('corpo del documento non trovato')
+        root = self._document[:body_start]
+        if 'w:styleId="Heading2"' not in styles:
+            raise AppendNotSupported('stile Heading2 assente')
+        for prefix in ('w', 'r', 'wp'):
+            if f'xmlns:{prefix}=' not in root:
+                raise AppendNotSupported(f'namespace {prefix} non dichiarato')
+        self._sect_start = self._document.rfind('<w:sectPr')
+        if self._sect_start < 0 or not _BODY_END.search(self._document):
+            raise AppendNotSupported('sectPr finale del corpo non trovato')
+
+    def _existing_image(self, blob, rels):
+        """rId di un media esistente con gli stessi byte di `blob`, o None."""
+        names = self._media.get((zlib.crc32(blob), len(blob)))
+        if not names:
+            return None
+        with zipfile.ZipFile(self.path) as zin:
+            for name in names:
+                rid = rels.get(name)
+                if rid is not None and zin.read(name) == blob:
+                    return rid
+        return None
+
+    def append(self, doc):
+        """Innesta nel file il corpo di `doc` (creato con `new_document`).
+
+        Il file viene riscritto in una copia temporanea e sostituito solo a
+        scrittura completata.
+        """
+        content, new_final = _body_fragment(doc)
+        existing = self._document
+        sect_end = existing.index('</w:sectPr>', self._sect_start) + len('</w:sectPr>')
+        last_sect = existing[self._sect_start:sect_end]
+
+        # Nuovi rId e nomi dei media, senza collisioni con quelli esistenti.
+        next_rid = max(map(int, _REL_ID.findall(self._rels)), default=0) + 1
+        next_media = max((int(m.group(1)) for m in map(_MEDIA_NUM.match, self._names) if m), default=0) + 1
+        rid_map = {}
+        media = []
+        rel_xml = []
+        image_rels = {target[1:] if target.startswith('/') else 'word/' + target: rid
+                      for rid, target in _IMAGE_REL.findall(self._rels)}
+        for rel in doc.part.rels.values():
+            if rel.reltype != _IMAGE_RELTYPE or rel.is_external:
+                continue
+            part = rel.target_part
+            existing_rid = self._existing_image(part.blob, image_rels)
+            if existing_rid is not None:
+                # Immagine già nel documento (es. blocco ripetuto): niente nuova copia.
+                rid_map[rel.rId] = existing_rid
+                continue
+            name = f'word/media/image{next_media}.{part.partname.ext}'
+            new_rid = f'rId{next_rid}'
+            rid_map[rel.rId] = new_rid
+            media.append((name, part.blob, part.partname.ext, part.content_type))
+            rel_xml.append(f'<Relationship Id="{new_rid}" Type="{_IMAGE_RELTYPE}" '
+                           f'Target="{name[len("word/"):]}"/>')
+            next_media += 1
+            next_rid += 1
+
+        def remap_rid(m):
+            if m.group(2) not in rid_map:
+                raise AppendNotSupported(f'relazione non gestita: {m.group(2)}')
+            return m.group(1) + rid_map[m.group(2)] + m.group(3)
+
+        content = _EMBED.sub(remap_rid, content)
+        doc_pr_base = max(map(int, (m.group(2) for m in _DOCPR_ID.finditer(existing))), default=0)
+        content = _DOCPR_ID.sub(lambda m: f'{m.group(1)}{int(m.group(2)) + doc_pr_base}{m.group(3)}', content)
+
+        document = (existing[:self._sect_start]
+                    + f'<w:p><w:pPr>{last_sect}</w:pPr></w:p>'
+                    + content + new_final + '</w:body></w:document>')
+        rels = self._rels.replace('</Relationships>', ''.join(rel_xml) + '</Relationships>')
+        content_types = self._content_types
+        for _, _, ext, content_type in media:
+            if f'Extension="{ext}"' not in content_types:
+                content_types = content_types.replace(
+                    '</Types>', f'<Default Extension="{ext}" ContentType="{content_type}"/></Types>')
+
+        replaced = {_DOCUMENT: document, _DOCUMENT_RELS: rels, _CONTENT_TYPES: content_types}
+        tmp = self.path.with_name(self.path.name + '.tmp')
+        try:
+            with open(self.path, 'rb') as src_fp, zipfile.ZipFile(src_fp) as zin, \
+                    zipfile.ZipFile(tmp, 'w', zipfile.ZIP_DEFLATED) as zout:
+                for info in zin.infolist():
+                    if info.filename in replaced:
+                        zout.writestr(info.filename, replaced[info.filename].encode('utf-8'))
+                    else:
+                        copy_member_raw(src_fp, zout, info)
+                for name, blob, _, _ in media:
+                    zout.writestr(_stored_info(name), blob)
+            os.replace(tmp, self.path)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+
+
+def _stored_info(name):
+    """ZipInfo per un membro memorizzato senza compressione (dati già compressi)."""
+    info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+    info.compress_type = zipfile.ZIP_STORED
+    return info
+
+
+class _StreamedImagePart(ImagePart):
+    """Parte immagine già scritta nello zip: il contenuto non resta in memoria.
+
+    L'impronta SHA1 viene conservata, così python-docx continua a riusare la
+    stessa parte per immagini identiche.
+    """
+
+    @property
+    def blob(self):
+        return b''
+
+    @property
+    def sha1(self):
+        return self._sha1
+
+
+class StreamingDocxWriter:
+    """Scrive in streaming il documento nuovo `doc` nel file `path`.
+
+    Dopo ogni `add_picture` si chiama `flush_media`: le immagini nuove vengono
+    scritte nello zip e liberate. `close` aggiunge le parti XML e sostituisce
+    il file di destinazione solo a scrittura completata; `abort` scarta il
+    file temporaneo lasciando intatto quello esistente.
+    """
+
+    def __init__(self, path, doc):
+        self.path = Path(path)
+        self.doc = doc
+        self._tmp = self.path.with_name(self.path.name + '.tmp')
+        self._zip = zipfile.ZipFile(self._tmp, 'w', zipfile.ZIP_DEFLATED)
+
+    def flush_media(self):
+        """Scrive nello zip le immagini aggiunte dall'ultima chiamata."""
+        for rel in self.doc.part.rels.values():
+            if rel.reltype != _IMAGE_RELTYPE or rel.is_external:
+                continue
+            part = rel.target_part
+            if isinstance(part, _StreamedImagePart) or not isinstance(part, ImagePart):
+                continue
+            self._zip.writestr(_stored_info(part.partname.membername), part.blob)
+            part._sha1 = part.sha1
+            part._blob = None
+            if part._image is not None:  # resta l'intestazione (dimensioni, dpi)
+                part._image._blob = b''
+            part.__class__ = _StreamedImagePart
+
+    def close(self):
+        """Completa il pacchetto e lo sostituisce al file di destinazione."""
+        try:
+            self.flush_media()
+            package = self.doc.part.package
+            parts = list(package.iter_parts())
+            for part in parts:
+                part.before_marshal()
+            self._zip.writestr(CONTENT_TYPES_URI.membername, _ContentTypesItem.from_parts(parts).blob)
+            self._zip.writestr(PACKAGE_URI.rels_uri.membername, package.rels.xml)
+            for part in parts:
+                if not isinstance(part, _StreamedImagePart):
+                    self._zip.writestr(part.partname.membername, part.blob)
+                if len(part.rels):
+                    self._zip.writestr(part.partname.rels_uri.membername, part.rels.xml)
+            self._zip.close()
+            os.replace(self._tmp, self.path)
+        except BaseException:
+            self.abort()
+            raise
+
+    def abort(self):
+        """Scarta il documento in scrittura."""
+        self._zip.close()
+        self._tmp.unlink(missing_ok=True)
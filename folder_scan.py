@@ -0,0 +1,149 @@
+# ReportGenerator - Scansione delle sottocartelle in background
+# Creato da Alessandro Frullo
+#
+# Elenca le sottocartelle di una cartella di campagna e, per ognuna, se
+# contiene cartelle 4G e/o 5G. La scansione usa os.scandir (il tipo di ogni
+# voce arriva con l'elenco, senza una stat per file), gira in un thread
+# separato, consegna i risultati a blocchi e può essere annullata. I
+# risultati vengono memorizzati in base alla data di modifica delle cartelle:
+# tornare su una cartella invariata richiede una sola stat. Una cartella 4G/5G
+# creata dentro una sottocartella esistente non cambia la data della cartella
+# principale e compare quando questa viene modificata (o al riavvio); nelle
+# nuove scansioni si rileggono solo le sottocartelle con data diversa.
+
+import os
+import threading
+from typing import NamedTuple
+
+__author__ = "Alessandro Frullo"
+
+# Sottocartelle consegnate per ogni blocco
+SCAN_BATCH_SIZE = 50
+
+
+class SubfolderInfo(NamedTuple):
+    """Una sottocartella della cartella scansionata."""
+    name: str
+    has_4g: bool
+    has_5g: bool
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _is_dir(entry):
+    try:
+        return entry.is_dir()
+    except OSError:
+        return False
+
+
+def probe_subfolder(path, name):
+    """Cerca tra le cartelle figlie di `path` quelle con '4g' o '5g' nel nome."""
+    has_4g = has_5g = False
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                if not _is_dir(entry):
+                    continue
+                lower = entry.name.lower()
+                has_4g = has_4g or '4g' in lower
+                has_5g = has_5g or '5g' in lower
+                if has_4g and has_5g:
+                    break
+    except OSError:  # es. PermissionError: nessuna informazione sulle figlie
+        pass
+    return SubfolderInfo(name, has_4g, has_5g)
+
+
+def technology_folders(path):
+    """Cartelle figlie di `path` con '4g' o '5g' nel nome: lista ordinata di (nome, percorso)."""
+    try:
+        with os.scandir(path) as it:
+            return sorted((e.name, e.path) for e in it
+                          if _is_dir(e) and ('4g' in e.name.lower() or '5g' in e.name.lower()))
+    except OSError:
+        return []
+
+
+class FolderScanner:
+    """Scansioni in background, una alla volta, con cache per data di modifica.
+
+    Le callback vengono chiamate dal thread di scansione: un'interfaccia Tk
+    deve riportarle sul thread principale (ad esempio con `after`).
+    """
+
+    def __init__(self, batch_size=SCAN_BATCH_SIZE):
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()
+        # {cartella: (mtime, risultato)} e {sottocartella: (mtime, SubfolderInfo)}
+        self._folders = {}
+        self._subfolders = {}
+
+    def scan(self, folder, on_batch, on_done=None):
+        """Avvia la scansione di `folder`, annullando quella in corso.
+
+        on_batch(lista di `SubfolderInfo`) riceve le sottocartelle in ordine
+        alfabetico, a blocchi; on_done(errore o None) viene chiamata alla fine,
+        ma non se la scansione è stata annullata.
+        """
+        self.cancel()
+        cancel = self._cancel = threading.Event()
+        threading.Thread(target=self._run, args=(os.path.abspath(folder), cancel, on_batch, on_done),
+                         daemon=True).start()
+
+    def cancel(self):
+        """Annulla la scansione in corso (nessuna callback successiva)."""
+        self._cancel.set()
+
+    def _run(self, folder, cancel, on_batch, on_done):
+        error = None
+        try:
+            self._scan(folder, cancel, on_batch)
+        except OSError as e:
+            error = e
+        if on_done is not None and not cancel.is_set():
+            on_done(error)
+
+    def _scan(self, folder, cancel, on_batch):
+        mtime = _mtime(folder)
+        with self._lock:
+            cached = self._folders.get(folder)
+        if cached is not None and mtime is not None and cached[0] == mtime:
+            for i in range(0, len(cached[1]), self.batch_size):
+                if cancel.is_set():
+                    return
+                on_batch(cached[1][i:i + self.batch_size])
+            return
+
+        with os.scandir(folder) as it:
+            subdirs = sorted((e.name, e.path) for e in it if _is_dir(e))
+        result = []
+        batch = []
+        for name, path in subdirs:
+            if cancel.is_set():
+                return
+            sub_mtime = _mtime(path)
+            with self._lock:
+                hit = self._subfolders.get(path)
+            if hit is not None and sub_mtime is not None and hit[0] == sub_mtime:
+                info = hit[1]
+            else:
+                info = probe_subfolder(path, name)
+                with self._lock:
+                    self._subfolders[path] = (sub_mtime, info)
+            result.append(info)
+            batch.append(info)
+            if len(batch) >= self.batch_size:
+                on_batch(batch)
+                batch = []
+        if batch and not cancel.is_set():
+            on_batch(batch)
+        if mtime is not None:
+            with self._lock:
+                self._folders[folder] = (mtime, result)
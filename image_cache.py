@@ -0,0 +1,175 @@
+# ReportGenerator - Cache persistente delle immagini elaborate
+# Creato da Alessandro Frullo
+#
+# Le immagini ritagliate/etichettate vengono salvate su disco già codificate,
+# insieme alle dimensioni (e all'eventuale ritaglio Word), così una nuova generazione con gli stessi input
+# non deve ripetere decodifica, ritaglio e codifica. La chiave dipende da
+# percorso, dimensione e data di modifica del file sorgente più i parametri
+# di elaborazione; le voci meno usate di recente vengono eliminate quando la
+# cache supera la dimensione massima.
+
+import hashlib
+import os
+import struct
+import threading
+import time
+from pathlib import Path
+
+__author__ = "Alessandro Frullo"
+
+# Da incrementare quando cambia il formato delle voci o l'elaborazione.
+CACHE_VERSION = 2
+DEFAULT_CACHE_SIZE = 2 * 1024 ** 3  # 2 GB
+
+_MAGIC = b'RGC2'
+# magic, larghezza, altezza, ritaglio Word left/top/right/bottom (-1 = nessuno)
+_HEADER = struct.Struct('<4sII4i')
+_SUFFIX = '.img'
+
+
+def default_cache_dir():
+    """Cartella predefinita della cache, nella posizione standard del sistema."""
+    if os.name == 'nt':
+        base = os.environ.get('LOCALAPPDATA') or Path.home() / 'AppData' / 'Local'
+        return Path(base) / 'ReportGenerator' / 'cache'
+    base = os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache'
+    return Path(base) / 'reportgenerator'
+
+
+class ImageCache:
+    """Cache su disco con chiave di contenuto ed eliminazione LRU.
+
+    L'ultimo accesso a una voce è la data di modifica del suo file, aggiornata
+    a ogni lettura. È sicura per l'uso da più thread dello stesso processo.
+    """
+
+    def __init__(self, root=None, max_bytes=DEFAULT_CACHE_SIZE):
+        self.root = Path(root) if root else default_cache_dir()
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._index = None  # {chiave: [byte, ultimo accesso]}, caricato al primo uso
+        self._total = 0
+
+    def key(self, path, *params):
+        """Chiave per il file `path` elaborato con `params`.
+
+        Restituisce None se il file non è accessibile.
+        """
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        raw = '|'.join(map(str, (CACHE_VERSION, os.path.abspath(path), st.st_size, st.st_mtime_ns) + params))
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _entry_path(self, key):
+        return self.root / key[:2] / (key + _SUFFIX)
+
+    def _load_index(self):
+        if self._index is not None:
+            return
+        self._index = {}
+        self._total = 0
+        if not self.root.is_dir():
+            return
+        for sub in os.scandir(self.root):
+            if not sub.is_dir():
+                continue
+            for entry in os.scandir(sub.path):
+                if entry.name.endswith(_SUFFIX):
+                    st = entry.stat()
+                    self._index[entry.name[:-len(_SUFFIX)]] = [st.st_size, st.st_mtime]
+                    self._total += st.st_size
+
+    def get(self, key):
+        """Restituisce (dati codificati, (larghezza, altezza), src_rect) o None.
+
+        src_rect è il ritaglio Word associato alla voce, o None.
+        """
+        if key is None:
+            return None
+        entry = self._entry_path(key)
+        try:
+            with open(entry, 'rb') as f:
+                blob = f.read()
+            os.utime(entry)
+        except OSError:
+            return None
+        if len(blob) < _HEADER.size:
+            return None
+        magic, w, h, *src_rect = _HEADER.unpack_from(blob)
+        if magic != _MAGIC:
+            return None
+        with self._lock:
+            self._load_index()
+            if key in self._index:
+                self._index[key][1] = time.time()
+        return blob[_HEADER.size:], (w, h), (tuple(src_rect) if src_rect[0] >= 0 else None)
+
+    def put(self, key, data, size, src_rect=None):
+        """Salva una voce ed elimina le meno recenti se si supera il limite."""
+        if key is None or len(data) + _HEADER.size > self.max_bytes:
+            return
+        entry = self._entry_path(key)
+        tmp = entry.with_name(f'{entry.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+        try:
+            entry.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp, 'wb') as f:
+                f.write(_HEADER.pack(_MAGIC, *size, *(src_rect or (-1, -1, -1, -1))))
+                f.write(data)
+            os.replace(tmp, entry)
+        except OSError:
+            tmp.unlink(missing_ok=True)
+            return
+        nbytes = len(data) + _HEADER.size
+        with self._lock:
+            self._load_index()
+            old = self._index.get(key)
+            if old is not None:
+                self._total -= old[0]
+            self._index[key] = [nbytes, time.time()]
+            self._total += nbytes
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Si scende al 90% del limite per non ripetere l'eliminazione a ogni put.
+        target = self.max_bytes * 0.9
+        for key, (nbytes, _) in sorted(self._index.items(), key=lambda kv: kv[1][1]):
+            if self._total <= target:
+                break
+            try:
+                self._entry_path(key).unlink()
+            except FileNotFoundError:
+                pass
+            except OSError:
+                continue
+            del self._index[key]
+            self._total -= nbytes
+
+    @property
+    def total_bytes(self):
+        """Spazio occupato dalla cache, in byte."""
+        with self._lock:
+            self._load_index()
+            return self._total
+
+    def clear(self):
+        """Elimina tutte le voci della cache. Restituisce i byte liberati."""
+        with self._lock:
+            self._load_index()
+            freed = self._total
+            for key in list(self._index):
+                try:
+                    self._entry_path(key).unlink()
+                except OSError:
+                    pass
+            for sub in (os.scandir(self.root) if self.root.is_dir() else ()):
+                if sub.is_dir():
+                    try:
+                        os.rmdir(sub.path)
+                    except OSError:
+                        pass
+            self._index = {}
+            self._total = 0
+            return freed
@@ -0,0 +1,118 @@
+# ReportGenerator - Classificazione delle immagini dal nome file
+# Creato da Alessandro Frullo
+#
+# Operatore, tecnologia, banda, metrica e posizione in ORDER vengono ricavati
+# dal nome del file con espressioni regolari compilate una sola volta; il
+# risultato di ogni file è memorizzato e riusato da etichette, ordinamento e
+# suddivisione per operatore.
+
+import re
+from functools import lru_cache
+from pathlib import Path
+from typing import NamedTuple, Optional, Tuple
+
+__author__ = "Alessandro Frullo"
+
+OPERATORS = ['Iliad', 'TIM', 'VF', 'W3']
+ORDER = [
+    'GSM900 RXLEV', 'LTE800 RSRP', 'LTE800 QUAL', 'UMTS900 RSCP', 'UMTS900 QUAL',
+    'LTE1800 RSRP', 'LTE1800 QUAL', 'LTE2100 RSRP', 'LTE2100 QUAL', 'LTE2100 RSRP B100',
+    'LTE RSRQ B100', 'UMTS2100 RSCP', 'UMTS2100 QUAL', 'LTE2600 RSRP', 'LTE2600 QUAL',
+    'RSRQ 700', 'RSRP 700', 'RSRP 3500', 'RSRQ 3500',
+    '5G SS-RSRP', '5G SS-RSRQ'
+]
+
+
+def _lookahead(words):
+    # Il lookahead trova ogni occorrenza, anche sovrapposta; a parità di
+    # posizione vince l'alternativa elencata per prima (indice minore).
+    return re.compile('(?=(' + '|'.join(map(re.escape, words)) + '))')
+
+
+# Assegnazione agli operatori: ricerca senza distinzione maiuscole/minuscole.
+_OPERATOR_ANY = _lookahead([op.lower() for op in OPERATORS])
+# Etichetta: primo operatore (nell'ordine di OPERATORS) presente così com'è.
+_OPERATOR_EXACT = _lookahead(OPERATORS)
+_ORDER_ANY = _lookahead([lbl.lower() for lbl in ORDER])
+_ORDER_INDEX = {lbl.lower(): i for i, lbl in enumerate(ORDER)}
+_TECH_TOKEN = re.compile(r'(GSM|UMTS|LTE|5G)(\d*)')
+
+
+class ImageInfo(NamedTuple):
+    """Dati ricavati dal nome di un'immagine."""
+    operator: Optional[str]      # operatore dell'etichetta (None se assente)
+    operators: Tuple[str, ...]   # tutti gli operatori a cui l'immagine appartiene
+    order: int                   # posizione in ORDER (len(ORDER) se non trovata)
+    technology: Optional[str]    # es. 'LTE', '5G'
+    band: Optional[str]          # es. '800', '3500'
+    metric: Optional[str]        # es. 'RSRP', 'SS-RSRQ'
+    label: str                   # testo dell'etichetta 'OPERATORE TECNOLOGIA'
+
+
+def _split_order_label(label):
+    """Scompone una voce di ORDER in (tecnologia, banda, metrica)."""
+    tech = band = None
+    metric = []
+    for tok in label.split():
+        m = _TECH_TOKEN.fullmatch(tok)
+        if m:
+            tech, band = m.group(1), m.group(2) or band
+        elif tok.isdigit():
+            band = tok
+        else:
+            metric.append(tok)
+    return tech, band, ' '.join(metric) or None
+
+
+_ORDER_FIELDS = [_split_order_label(lbl) for lbl in ORDER] + [(None, None, None)]
+
+
+@lru_cache(maxsize=65536)
+def _parse_stem(stem):
+    stem_lc = stem.lower()
+    found = {m.group(1) for m in _OPERATOR_ANY.finditer(stem_lc)}
+    operators = tuple(op for op in OPERATORS if op.lower() in found)
+    exact = {m.group(1) for m in _OPERATOR_EXACT.finditer(stem)}
+    operator = next((op for op in OPERATORS if op in exact), None)
+    order = min((_ORDER_INDEX[m.group(1)] for m in _ORDER_ANY.finditer(stem_lc)), default=len(ORDER))
+
+    if operator is not None:
+        tech = stem.replace('_Workbook_', '').replace(operator, '').strip()
+        label = f"{operator} {tech}"
+    else:
+        label = stem
+    return ImageInfo(operator or (operators[0] if operators else None), operators, order,
+                     *_ORDER_FIELDS[order], label)
+
+
+def parse_image_name(image_path):
+    """Restituisce l'`ImageInfo` del file (risultato memorizzato per nome)."""
+    return _parse_stem(Path(image_path).stem)
+
+
+def extract_label_name(image_path):
+    """Ricava l'etichetta 'OPERATORE TECNOLOGIA' dal nome del file."""
+    return parse_image_name(image_path).label
+
+
+def sort_images_by_order(images):
+    """Ordina le immagini secondo la sequenza definita in ORDER."""
+    return sorted(images, key=lambda p: parse_image_name(p).order)
+
+
+def partition_by_operator(blocks):
+    """Suddivide i blocchi per operatore con un solo passaggio sulle immagini.
+
+    blocks: dict {titolo blocco: [immagini]}. Restituisce un dict
+    {operatore: [(titolo blocco, immagini dell'operatore ordinate)]} che
+    contiene solo i blocchi con almeno un'immagine per quell'operatore.
+    """
+    result = {op: [] for op in OPERATORS}
+    for blk, pics in blocks.items():
+        groups = {}
+        for p in pics:
+            for op in parse_image_name(p).operators:
+                groups.setdefault(op, []).append(p)
+        for op, rel in groups.items():
+            result[op].append((blk, sort_images_by_order(rel)))
+    return result
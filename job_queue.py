@@ -0,0 +1,177 @@
+# ReportGenerator - Coda delle generazioni
+# Creato da Alessandro Frullo
+#
+# Ogni richiesta di generazione diventa un `Job` con una copia dei parametri
+# (titolo, blocchi, opzioni, cartella di output) presa al momento
+# dell'inserimento: l'utente può modificare i blocchi e accodare la campagna
+# successiva mentre la precedente è in esecuzione. `JobQueue` esegue i job in
+# ordine di inserimento, al massimo `max_workers` alla volta; due job che
+# scrivono gli stessi `<titolo>_<operatore>.*` non vengono mai eseguiti
+# insieme e partono nell'ordine in cui sono stati accodati.
+
+import itertools
+import os
+import threading
+from pathlib import Path
+
+from build_manifest import BuildManifest
+from image_names import OPERATORS
+from report_settings import OUTPUT_FORMATS, GenerationCancelled
+
+__author__ = "Alessandro Frullo"
+
+# Stati di un job, con il testo mostrato
+JOB_STATES = {
+    'queued': 'in coda',
+    'running': 'in esecuzione',
+    'done': 'completato',
+    'errors': 'completato con errori',
+    'failed': 'errore',
+    'cancelled': 'annullato',
+}
+FINAL_STATES = ('done', 'errors', 'failed', 'cancelled')
+
+_job_ids = itertools.count(1)
+
+
+class Job:
+    """Una generazione accodata.
+
+    blocks: {titolo blocco: immagini}, copiato all'inserimento; settings:
+    parametri aggiuntivi per chi esegue il job (processi, cache, ...).
+    Lo stato viene aggiornato da `JobQueue`; `progress` e `operators` da chi
+    esegue il job.
+    """
+
+    def __init__(self, title, out_dir, blocks, options, settings=None):
+        self.id = next(_job_ids)
+        self.title = title
+        self.out_dir = Path(out_dir)
+        self.blocks = {name: list(images) for name, images in blocks.items()}
+        self.options = options
+        self.settings = dict(settings or {})
+        self.state = 'queued'
+        self.cancel = threading.Event()
+        self.progress = (0, 0)   # immagini (completate, totali)
+        self.operators = {}      # {operatore: testo dell'esito}
+        self.errors = {}         # {operatore: errore} di una generazione completata
+        self.summary = ''
+        self.error = None        # eccezione di una generazione fallita
+        names = [f'{title}_{op}.{fmt}' for op in OPERATORS for fmt in OUTPUT_FORMATS]
+        # Documenti (Word o PDF) scritti dal job, più il manifest di build che condividono.
+        self.targets = frozenset(
+            [os.path.normcase(os.path.abspath(self.out_dir / name)) for name in names]
+            + [os.path.normcase(os.path.abspath(BuildManifest.for_output(self.out_dir, title).path))]
+        )
+
+    @property
+    def finished(self):
+        return self.state in FINAL_STATES
+
+    def conflicts_with(self, other):
+        """True se i due job scrivono almeno un file in comune."""
+        return not self.targets.isdisjoint(other.targets)
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.title!r} {self.state}>'
+
+
+class JobQueue:
+    """Esegue i job accodati con al massimo `max_workers` thread.
+
+    run_job(job) esegue la generazione e restituisce (errori per operatore,
+    riepilogo); per un annullamento solleva `GenerationCancelled`.
+    on_change(job) viene chiamata, dal thread che ha cambiato lo stato, a
+    ogni inserimento, avvio e fine di un job: un'interfaccia Tk deve
+    riportarla sul thread principale.
+    """
+
+    def __init__(self, run_job, max_workers=1, on_change=None):
+        self._run_job = run_job
+        self._on_change = on_change
+        self._max_workers = max(1, max_workers)
+        self._lock = threading.Lock()
+        self._jobs = []
+        self._running = []
+
+    @property
+    def jobs(self):
+        """Tutti i job, in ordine di inserimento."""
+        with self._lock:
+            return list(self._jobs)
+
+    @property
+    def idle(self):
+        """True se nessun job è in coda o in esecuzione."""
+        with self._lock:
+            return all(job.finished for job in self._jobs)
+
+    def set_max_workers(self, max_workers):
+        """Cambia il numero di job contemporanei (vale per i prossimi avvii)."""
+        with self._lock:
+            self._max_workers = max(1, max_workers)
+        self._dispatch()
+
+    def submit(self, job):
+        """Accoda `job` e lo avvia appena possibile."""
+        with self._lock:
+            self._jobs.append(job)
+        self._notify(job)
+        self._dispatch()
+        return job
+
+    def cancel(self, job):
+        """Annulla un job in coda o chiede l'interruzione di uno in esecuzione."""
+        with self._lock:
+            queued = job.state == 'queued'
+            if queued:
+                job.state = 'cancelled'
+        job.cancel.set()
+        if queued:
+            self._notify(job)
+            self._dispatch()
+
+    def clear_finished(self):
+        """Toglie dall'elenco i job terminati."""
+        with self._lock:
+            self._jobs = [job for job in self._jobs if not job.finished]
+
+    def _dispatch(self):
+        started = []
+        with self._lock:
+            # Un job attende se scrive file di un job in esecuzione o di uno
+            # accodato prima di lui, così l'ordine tra gli stessi file è rispettato.
+            blocking = list(self._running)
+            for job in self._jobs:
+                if len(self._running) >= self._max_workers:
+                    break
+                if job.state != 'queued':
+                    continue
+                if not any(job.conflicts_with(other) for other in blocking):
+                    job.state = 'running'
+                    self._running.append(job)
+                    started.append(job)
+                blocking.append(job)
+        for job in started:
+            threading.Thread(target=self._run, args=(job,), daemon=True).start()
+            self._notify(job)
+
+    def _run(self, job):
+        try:
+            errors, summary = self._run_job(job)
+            job.errors, job.summary = errors or {}, summary
+            state = 'errors' if job.errors else 'done'
+        except GenerationCancelled:
+            state = 'cancelled'
+        except Exception as e:
+            job.error = e
+            state = 'failed'
+        with self._lock:
+            job.state = state
+            self._running.remove(job)
+        self._notify(job)
+        self._dispatch()
+
+    def _notify(self, job):
+        if self._on_change is not None:
+            self._on_change(job)
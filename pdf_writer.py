@@ -0,0 +1,309 @@
+# ReportGenerator - Scrittura diretta dei report in PDF
+# Creato da Alessandro Frullo
+#
+# Scrittore PDF minimale, senza Word né altre suite da ufficio: pagine con
+# titoli dei blocchi, immagini adattate alla pagina ed etichette. Il file
+# viene scritto in streaming: ogni immagine finisce nel file appena aggiunta
+# e ogni pagina appena completata, quindi la memoria non cresce con il numero
+# di immagini. I JPEG vengono inseriti così come sono (DCTDecode) e i PNG a 8
+# bit senza trasparenza riusando i dati compressi originali (FlateDecode con
+# predittori PNG); gli altri formati vengono decodificati con Pillow e
+# compressi con zlib. I testi usano Helvetica-Bold (font standard PDF, non
+# incorporato) con codifica WinAnsi.
+
+import io
+import os
+import struct
+import zlib
+from pathlib import Path
+
+from PIL import Image
+
+__author__ = "Alessandro Frullo"
+
+# Pagina orizzontale (in punti) come quella dei documenti Word generati
+PAGE_SIZE = (792, 612)
+HEADING_FONT_SIZE = 13
+CAPTION_FONT_SIZE = 12
+
+_PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# Tipi colore PNG (senza alfa) utilizzabili così come sono: componenti per pixel
+_PNG_COLORS = {0: 1, 2: 3, 3: 1}
+_FONTS = {'F1': 'Helvetica-Bold'}
+
+# Larghezze (millesimi di em) di Helvetica-Bold per i caratteri 32-126, per
+# centrare le etichette; gli altri caratteri usano _DEFAULT_WIDTH.
+_BOLD_WIDTHS = (
+    278, 333, 474, 556, 556, 889, 722, 238, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 333, 333, 584, 584, 584, 611,
+    975, 722, 722, 722, 722, 667, 611, 778, 722, 278, 556, 722, 611, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 333, 278, 333, 584, 556,
+    333, 556, 611, 556, 611, 556, 333, 611, 611, 278, 278, 556, 278, 889, 611, 611,
+    611, 611, 389, 556, 333, 611, 556, 778, 556, 556, 500, 389, 280, 389, 584,
+)
+_DEFAULT_WIDTH = 556
+
+
+def _text_width(text, size):
+    """Larghezza in punti di `text` in Helvetica-Bold."""
+    return sum(_BOLD_WIDTHS[ord(c) - 32] if 32 <= ord(c) < 127 else _DEFAULT_WIDTH for c in text) * size / 1000
+
+
+def _pdf_string(text):
+    """Stringa PDF letterale in codifica WinAnsi."""
+    data = text.encode('cp1252', errors='replace')
+    return b'(' + data.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)') + b')'
+
+
+def _num(value):
+    return f'{value:.2f}'.rstrip('0').rstrip('.')
+
+
+def _rgb(color):
+    """'#RRGGBB' -> componenti 0-1 per gli operatori rg/RG."""
+    color = color.lstrip('#')
+    return ' '.join(_num(int(color[i:i + 2], 16) / 255) for i in (0, 2, 4))
+
+
+def _read_source(source):
+    """Byte di un'immagine da percorso, BytesIO o bytes."""
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    if hasattr(source, 'getvalue'):
+        return source.getvalue()
+    return Path(source).read_bytes()
+
+
+def _png_passthrough(data):
+    """(voci del dizionario, dati) di un PNG inseribile senza decodifica, o None.
+
+    Vale per PNG non interlacciati a 8 bit in scala di grigi o RGB e per PNG
+    con palette, senza trasparenza: i dati IDAT sono già uno stream zlib con
+    i predittori PNG, che il PDF sa decodificare.
+    """
+    if not data.startswith(_PNG_SIGNATURE):
+        return None
+    pos = len(_PNG_SIGNATURE)
+    header = palette = None
+    idat = []
+    while pos + 8 <= len(data):
+        length, kind = struct.unpack('>I4s', data[pos:pos + 8])
+        chunk = data[pos + 8:pos + 8 + length]
+        pos += 12 + length
+        if kind == b'IHDR':
+            header = struct.unpack('>IIBBBBB', chunk)
+        elif kind == b'PLTE':
+            palette = chunk
+        elif kind == b'tRNS':
+            return None
+        elif kind == b'IDAT':
+            idat.append(chunk)
+        elif kind == b'IEND':
+            break
+    if header is None or not idat:
+        return None
+    width, height, depth, color, _, _, interlace = header
+    if color not in _PNG_COLORS or interlace or (depth != 8 and color != 3):
+        return None
+    if color == 3:
+        if palette is None:
+            return None
+        space = f'[/Indexed /DeviceRGB {len(palette) // 3 - 1} <{palette.hex()}>]'
+    else:
+        space = '/DeviceGray' if color == 0 else '/DeviceRGB'
+    params = (f'/DecodeParms << /Predictor 15 /Colors {_PNG_COLORS[color]} '
+              f'/BitsPerComponent {depth} /Columns {width} >>')
+    return (f'/Width {width} /Height {height} /ColorSpace {space} /BitsPerComponent {depth} '
+            f'/Filter /FlateDecode {params}'), b''.join(idat)
+
+
+def _image_xobject(data):
+    """(voci del dizionario, dati dello stream) dell'immagine per il PDF."""
+    passthrough = _png_passthrough(data)
+    if passthrough is not None:
+        return passthrough
+    with Image.open(io.BytesIO(data)) as img:
+        if img.format == 'JPEG' and img.mode in ('L', 'RGB', 'CMYK'):
+            space = {'L': '/DeviceGray', 'RGB': '/DeviceRGB', 'CMYK': '/DeviceCMYK'}[img.mode]
+            # I JPEG CMYK di Adobe sono memorizzati invertiti.
+            decode = ' /Decode [1 0 1 0 1 0 1 0]' if img.mode == 'CMYK' and 'adobe' in img.info else ''
+            return (f'/Width {img.width} /Height {img.height} /ColorSpace {space} '
+                    f'/BitsPerComponent 8 /Filter /DCTDecode{decode}'), data
+        if img.mode in ('RGBA', 'LA', 'PA') or 'transparency' in img.info:
+            rgba = img.convert('RGBA')
+            img = Image.new('RGB', img.size, 'white')
+            img.paste(rgba, mask=rgba.getchannel('A'))
+        elif img.mode not in ('L', 'RGB', 'CMYK'):
+            img = img.convert('L' if img.mode in ('1', 'I', 'I;16', 'F') else 'RGB')
+        space = {'L': '/DeviceGray', 'RGB': '/DeviceRGB', 'CMYK': '/DeviceCMYK'}[img.mode]
+        return (f'/Width {img.width} /Height {img.height} /ColorSpace {space} '
+                f'/BitsPerComponent 8 /Filter /FlateDecode'), zlib.compress(img.tobytes(), 6)
+
+
+class PdfDocument:
+    """Documento PDF scritto in streaming nel file `path`.
+
+    Il contenuto scorre dall'alto come in Word: un'immagine che non entra
+    nello spazio rimasto va alla pagina successiva. Le misure sono in punti.
+    Il file viene scritto accanto come `.tmp` e sostituisce `path` solo in
+    `close`; `abort` lo scarta lasciando intatto quello esistente.
+    """
+
+    def __init__(self, path, page_size=PAGE_SIZE, margin=36, title=None, accent='#000000'):
+        self.path = Path(path)
+        self.page_width, self.page_height = page_size
+        self.margin = margin
+        self.accent = accent
+        self._tmp = self.path.with_name(self.path.name + '.tmp')
+        self._file = open(self._tmp, 'wb')
+        self._offsets = {}
+        self._next_id = 3          # 1 = catalogo, 2 = albero delle pagine
+        self._pages = []
+        self._images = {}          # {nome risorsa: oggetto} della pagina corrente
+        self._ops = None           # operatori della pagina corrente (None = nessuna pagina)
+        self._y = 0.0
+        self._file.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        self._fonts = {}
+        for name, base in _FONTS.items():
+            self._fonts[name] = self._write_object(
+                f'<< /Type /Font /Subtype /Type1 /BaseFont /{base} /Encoding /WinAnsiEncoding >>'.encode())
+        self._info = self._write_object(
+            b'<< /Producer (ReportGenerator)' + (b' /Title ' + _pdf_string(title) if title else b'') + b' >>')
+
+    @property
+    def content_width(self):
+        return self.page_width - 2 * self.margin
+
+    @property
+    def content_height(self):
+        return self.page_height - 2 * self.margin
+
+    def _write_object(self, body, obj_id=None):
+        if obj_id is None:
+            obj_id = self._next_id
+            self._next_id += 1
+        self._offsets[obj_id] = self._file.tell()
+        self._file.write(f'{obj_id} 0 obj\n'.encode() + body + b'\nendobj\n')
+        return obj_id
+
+    def _write_stream(self, entries, data):
+        """Scrive un oggetto stream; entries: voci del dizionario, senza /Length."""
+        obj_id = self._next_id
+        self._next_id += 1
+        self._offsets[obj_id] = self._file.tell()
+        out = self._file
+        out.write(f'{obj_id} 0 obj\n<< {entries} /Length {len(data)} >>\nstream\n'.encode())
+        out.write(data)
+        out.write(b'\nendstream\nendobj\n')
+        return obj_id
+
+    def new_page(self):
+        """Inizia una nuova pagina (nessun effetto se quella corrente è vuota)."""
+        if self._ops is not None and not self._ops:
+            return
+        self._finish_page()
+        self._ops = []
+        self._images = {}
+        self._y = self.page_height - self.margin
+
+    def _ensure_space(self, height):
+        """Passa alla pagina successiva se `height` non entra nello spazio rimasto."""
+        if self._ops is None or (self._ops and self._y - height < self.margin - 0.01):
+            self._finish_page()
+            self._ops = []
+            self._images = {}
+            self._y = self.page_height - self.margin
+
+    def add_heading(self, text, size=HEADING_FONT_SIZE, space_after=0):
+        """Titolo in grassetto, allineato a sinistra."""
+        line = size * 1.2
+        self._ensure_space(line)
+        baseline = self._y - size
+        self._ops.append(f'BT /F1 {size} Tf {_rgb(self.accent)} rg {_num(self.margin)} {_num(baseline)} Td '
+                         .encode() + _pdf_string(text) + b' Tj ET')
+        self._y -= line + space_after
+
+    def add_caption(self, text, line, border, padding, space_after, size=CAPTION_FONT_SIZE):
+        """Etichetta centrata in un riquadro bordato largo quanto la pagina."""
+        height = line + 2 * padding
+        self._ensure_space(height + border * 2 + space_after)
+        top = self._y - border
+        x, w = self.margin, self.content_width
+        baseline = top - padding - (line + size * 0.7) / 2
+        text_x = x + (w - _text_width(text, size)) / 2
+        color = _rgb(self.accent)
+        self._ops.append(f'{color} RG {_num(border)} w {_num(x)} {_num(top - height)} {_num(w)} '
+                         f'{_num(height)} re S'.encode())
+        self._ops.append(f'BT /F1 {size} Tf {color} rg {_num(text_x)} {_num(baseline)} Td '
+                         .encode() + _pdf_string(text) + b' Tj ET')
+        self._y -= height + 2 * border + space_after
+
+    def add_image(self, source, width, height, src_rect=None):
+        """Inserisce un'immagine di `width` x `height` punti.
+
+        source: percorso, BytesIO o bytes dell'immagine; viene scritta subito
+        nel file. src_rect: ritaglio (sinistra, alto, destra, basso) in
+        millesimi di punto percentuale, come in Word, applicato con un
+        tracciato di ritaglio senza modificare l'immagine.
+        """
+        entries, data = _image_xobject(_read_source(source))
+        self._ensure_space(height)
+        obj_id = self._write_stream(f'/Type /XObject /Subtype /Image {entries}', data)
+        name = f'Im{len(self._images) + 1}'
+        self._images[name] = obj_id
+        x, y = self.margin, self._y - height
+        if src_rect is None:
+            self._ops.append(f'q {_num(width)} 0 0 {_num(height)} {_num(x)} {_num(y)} cm /{name} Do Q'.encode())
+        else:
+            left, top, right, bottom = (v / 100000 for v in src_rect)
+            full_w = width / max(1 - left - right, 1e-6)
+            full_h = height / max(1 - top - bottom, 1e-6)
+            self._ops.append(
+                f'q {_num(x)} {_num(y)} {_num(width)} {_num(height)} re W n '
+                f'{_num(full_w)} 0 0 {_num(full_h)} {_num(x - full_w * left)} {_num(y - full_h * bottom)} cm '
+                f'/{name} Do Q'.encode())
+        self._y = y
+
+    def fits(self, height):
+        """True se `height` punti entrano nello spazio rimasto della pagina corrente."""
+        return self._ops is not None and (not self._ops or self._y - height >= self.margin - 0.01)
+
+    def _finish_page(self):
+        if self._ops is None:
+            return
+        content = zlib.compress(b'\n'.join(self._ops), 6)
+        content_id = self._write_stream('/Filter /FlateDecode', content)
+        fonts = ' '.join(f'/{n} {i} 0 R' for n, i in self._fonts.items())
+        images = ' '.join(f'/{n} {i} 0 R' for n, i in self._images.items())
+        page = (f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {_num(self.page_width)} {_num(self.page_height)}] '
+                f'/Resources << /Font << {fonts} >> /XObject << {images} >> >> /Contents {content_id} 0 R >>')
+        self._pages.append(self._write_object(page.encode()))
+        self._ops = None
+
+    def close(self):
+        """Completa il PDF e lo sostituisce al file di destinazione."""
+        try:
+            self._finish_page()
+            if not self._pages:  # un PDF deve avere almeno una pagina
+                self._ops = []
+                self._finish_page()
+            kids = ' '.join(f'{i} 0 R' for i in self._pages)
+            self._write_object(f'<< /Type /Pages /Kids [{kids}] /Count {len(self._pages)} >>'.encode(), obj_id=2)
+            self._write_object(b'<< /Type /Catalog /Pages 2 0 R >>', obj_id=1)
+            xref = self._file.tell()
+            size = self._next_id
+            lines = [f'xref\n0 {size}\n', '0000000000 65535 f \n']
+            lines += [f'{self._offsets[i]:010d} 00000 n \n' for i in range(1, size)]
+            lines.append(f'trailer\n<< /Size {size} /Root 1 0 R /Info {self._info} 0 R >>\n'
+                         f'startxref\n{xref}\n%%EOF\n')
+            self._file.write(''.join(lines).encode())
+            self._file.close()
+            os.replace(self._tmp, self.path)
+        except BaseException:
+            self.abort()
+            raise
+
+    def abort(self):
+        """Scarta il PDF in scrittura."""
+        self._file.close()
+        self._tmp.unlink(missing_ok=True)
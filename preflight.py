@@ -0,0 +1,245 @@
+# ReportGenerator - Verifica preliminare delle immagini
+# Creato da Alessandro Frullo
+#
+# Prima della generazione ogni immagine selezionata viene controllata in
+# parallelo leggendo solo l'intestazione (`Image.open` non decodifica i
+# pixel) e la coda del file: file non leggibili o troncati, dimensioni da
+# "decompression bomb", operatori non riconosciuti e metriche fuori da ORDER
+# emergono in pochi secondi invece che a metà di una generazione lunga.
+# Dagli stessi dati si stimano pixel totali, dimensione dei documenti,
+# durata e memoria necessaria, utili per scegliere processi e limiti.
+
+import os
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple, Optional, Tuple
+
+from PIL import Image
+
+from image_names import ORDER, parse_image_name
+from report_engine import MAX_PENDING_IMAGES, PDF_PAGE_SIZE, SECTION_MARGIN, embeddable_as_is, image_area
+from report_settings import DEFAULT_WORKERS, ImageOptions
+
+__author__ = "Alessandro Frullo"
+
+# Thread per la lettura delle intestazioni (lavoro di I/O, anche su rete)
+PREFLIGHT_THREADS = 16
+
+# Tipi di problema, con il testo mostrato; i primi impediscono l'inserimento
+# dell'immagine, gli altri la lasciano fuori dai documenti o in fondo al blocco.
+ISSUE_KINDS = {
+    'unreadable': 'non leggibile',
+    'truncated': 'file troncato',
+    'bomb': 'dimensioni eccessive (decompression bomb)',
+    'large': 'molto grande, elaborazione lenta',
+    'no_eoi': 'marcatore finale JPEG non trovato, file forse troncato',
+    'no_operator': 'operatore non riconosciuto, esclusa dai documenti',
+    'no_order': 'metrica non presente in ORDER, messa in fondo al blocco',
+}
+ERROR_KINDS = ('unreadable', 'truncated', 'bomb')
+
+# Velocità indicative (PC desktop, un processo): elaborazione completa per
+# megapixel dell'originale e inserimento di un originale così com'è per MB.
+_PROCESS_S_PER_MPX = 0.2
+_COPY_S_PER_MB = 0.015
+# Marcatore finale, byte letti dalla fine del file e problema se manca. Dopo
+# la fine di un JPEG le fotocamere possono aggiungere dati (anteprime, MPO):
+# si cerca in una coda ampia e l'assenza è solo un avviso.
+_END_MARKERS = {
+    'JPEG': (b'\xff\xd9', 64 * 1024, 'no_eoi'),
+    'MPO': (b'\xff\xd9', 64 * 1024, 'no_eoi'),
+    'PNG': (b'IEND', 64, 'truncated'),
+}
+
+
+class ImageProbe(NamedTuple):
+    """Intestazione di un'immagine."""
+    path: str
+    bytes: Optional[int]                  # dimensione del file
+    format: Optional[str]                 # formato riconosciuto da Pillow
+    size: Optional[Tuple[int, int]]       # dimensioni in pixel
+    kind: Optional[str] = None            # problema del file (chiave di ISSUE_KINDS) o None
+    detail: str = ''
+
+
+class PreflightIssue(NamedTuple):
+    """Un problema trovato dalla verifica."""
+    block: str
+    path: str
+    kind: str      # chiave di ISSUE_KINDS
+    detail: str = ''
+
+
+def _end_issue(path, fmt):
+    """Problema (chiave di ISSUE_KINDS) se un JPEG o PNG non termina con il marcatore finale, o None."""
+    if fmt not in _END_MARKERS:
+        return None
+    marker, tail, kind = _END_MARKERS[fmt]
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - tail))
+        return kind if marker not in f.read() else None
+
+
+def probe_image(path):
+    """Legge intestazione e dimensione di `path` senza decodificare i pixel."""
+    try:
+        nbytes = os.path.getsize(path)
+    except OSError as e:
+        return ImageProbe(path, None, None, None, 'unreadable', str(e))
+    try:
+        with Image.open(path) as img:
+            fmt, size = img.format, img.size
+    except Image.DecompressionBombError as e:
+        return ImageProbe(path, nbytes, None, None, 'bomb', str(e))
+    except Exception as e:
+        return ImageProbe(path, nbytes, None, None, 'unreadable', str(e))
+    try:
+        kind = _end_issue(path, fmt)
+    except OSError as e:
+        return ImageProbe(path, nbytes, fmt, size, 'unreadable', str(e))
+    if kind is not None:
+        return ImageProbe(path, nbytes, fmt, size, kind)
+    # Oltre MAX_IMAGE_PIXELS Pillow elabora l'immagine ma segnala il rischio.
+    if Image.MAX_IMAGE_PIXELS and size[0] * size[1] > Image.MAX_IMAGE_PIXELS:
+        return ImageProbe(path, nbytes, fmt, size, 'large', f'{size[0] * size[1] / 1e6:.0f} megapixel')
+    return ImageProbe(path, nbytes, fmt, size)
+
+
+class PreflightResult:
+    """Esito della verifica: problemi trovati e stime della generazione."""
+
+    def __init__(self, probes, issues, output_bytes, process_mpx, copy_mb):
+        self.probes = probes              # {percorso: ImageProbe}
+        self.issues = issues              # [PreflightIssue]
+        self.output_bytes = output_bytes  # dimensione stimata dei documenti
+        self._process_mpx = process_mpx
+        self._copy_mb = copy_mb
+
+    @property
+    def errors(self):
+        """Problemi che impediscono l'inserimento delle immagini."""
+        return [i for i in self.issues if i.kind in ERROR_KINDS]
+
+    @property
+    def warnings(self):
+        return [i for i in self.issues if i.kind not in ERROR_KINDS]
+
+    @property
+    def total_bytes(self):
+        return sum(p.bytes or 0 for p in self.probes.values())
+
+    @property
+    def total_pixels(self):
+        return sum(p.size[0] * p.size[1] for p in self.probes.values() if p.size)
+
+    @property
+    def largest(self):
+        """`ImageProbe` con più pixel, o None."""
+        sized = [p for p in self.probes.values() if p.size]
+        return max(sized, key=lambda p: p.size[0] * p.size[1]) if sized else None
+
+    def estimated_seconds(self, workers=DEFAULT_WORKERS):
+        """Durata stimata della generazione con `workers` processi."""
+        return self._process_mpx * _PROCESS_S_PER_MPX / max(1, workers) + self._copy_mb * _COPY_S_PER_MB
+
+    def memory_per_worker(self):
+        """Memoria (byte) per decodificare ed elaborare l'immagine più grande."""
+        largest = self.largest
+        # Originale decodificato più una copia (ritaglio/etichetta), fino a 4 byte per pixel.
+        return 2 * 4 * largest.size[0] * largest.size[1] if largest else 0
+
+    def estimated_memory(self, workers=DEFAULT_WORKERS):
+        """Memoria di picco stimata: processi più risultati in attesa di inserimento."""
+        count = len(self.probes)
+        average = self.output_bytes / count if count else 0
+        return max(1, workers) * self.memory_per_worker() + min(count, MAX_PENDING_IMAGES) * average
+
+    def workers_for_memory(self, max_bytes):
+        """Processi che stanno in `max_bytes` elaborando l'immagine più grande (almeno 1)."""
+        per_worker = self.memory_per_worker()
+        return max(1, int(max_bytes // per_worker)) if per_worker else DEFAULT_WORKERS
+
+    def summary(self, workers=DEFAULT_WORKERS, max_issues=20):
+        """Testo con stime e problemi (al massimo max_issues elencati)."""
+        largest = self.largest
+        lines = [
+            f'Immagini: {len(self.probes)} ({self.total_bytes / 1024 ** 2:.1f} MB, '
+            f'{self.total_pixels / 1e6:.0f} megapixel)',
+            f'Documenti stimati: {self.output_bytes / 1024 ** 2:.1f} MB',
+            f"Durata stimata con {workers} {'processo' if workers == 1 else 'processi'}: "
+            f'{self.estimated_seconds(workers):.0f} s',
+            f'Memoria stimata: {self.estimated_memory(workers) / 1024 ** 2:.0f} MB',
+        ]
+        if largest is not None:
+            lines.append(f'Immagine più grande: {os.path.basename(largest.path)} '
+                         f'({largest.size[0]}x{largest.size[1]})')
+        if self.issues:
+            lines.append('')
+            lines.append(f'Problemi: {len(self.errors)} errori, {len(self.warnings)} avvisi')
+            for issue in (self.errors + self.warnings)[:max_issues]:
+                detail = f' ({issue.detail})' if issue.detail else ''
+                lines.append(f'  [{issue.block}] {os.path.basename(issue.path)}: {ISSUE_KINDS[issue.kind]}{detail}')
+            if len(self.issues) > max_issues:
+                lines.append(f'  ... e altri {len(self.issues) - max_issues}')
+        return '\n'.join(lines)
+
+
+def _estimate(probe, options, target_px):
+    """(byte nel documento, megapixel da elaborare, MB inseriti così come sono)."""
+    if probe.size is None:
+        return 0, 0.0, 0.0
+    if embeddable_as_is(probe.format, probe.size, options, target_px) and (
+            options.crop_mode == 'none' or options.crop_native):
+        return probe.bytes, 0.0, probe.bytes / 1024 ** 2
+    w, h = probe.size
+    # Un'immagine ridimensionata occupa circa quanto l'originale in proporzione ai pixel.
+    scale = min(target_px[0] / w, target_px[1] / h, 1.0) if target_px is not None else 1.0
+    return probe.bytes * scale * scale, w * h / 1e6, 0.0
+
+
+def run_preflight(blocks, options=None, threads=PREFLIGHT_THREADS, cancel=None):
+    """Verifica le immagini dei blocchi ({titolo: immagini}) e restituisce un `PreflightResult`.
+
+    options (`ImageOptions`, opzionale) serve per le stime: senza, le
+    immagini sono considerate inserite così come sono. Ogni file viene
+    letto una sola volta anche se compare in più blocchi. Impostando
+    l'evento `cancel` le intestazioni non ancora lette vengono saltate.
+    """
+    first_block = {}
+    for title, images in blocks.items():
+        for path in images:
+            first_block.setdefault(path, title)
+
+    def probe(path):
+        if cancel is not None and cancel.is_set():
+            return None
+        return probe_image(path)
+
+    # Le immagini molto grandi sono già segnalate come problemi: niente avvisi di Pillow.
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', Image.DecompressionBombWarning)
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            probes = {p.path: p for p in pool.map(probe, first_block) if p is not None}
+
+    issues = []
+    options = options or ImageOptions()
+    page = (PDF_PAGE_SIZE[0] / 72 - 2 * SECTION_MARGIN, PDF_PAGE_SIZE[1] / 72 - 2 * SECTION_MARGIN)
+    _, target_px = image_area(page, options)
+    output_bytes = process_mpx = copy_mb = 0
+    for path, probe in probes.items():
+        block = first_block[path]
+        if probe.kind is not None:
+            issues.append(PreflightIssue(block, path, probe.kind, probe.detail))
+        info = parse_image_name(path)
+        if not info.operators:
+            issues.append(PreflightIssue(block, path, 'no_operator'))
+        elif info.order == len(ORDER):
+            issues.append(PreflightIssue(block, path, 'no_order'))
+        if info.operators and probe.kind not in ERROR_KINDS:
+            nbytes, mpx, mb = _estimate(probe, options, target_px)
+            # Un'immagine di più operatori finisce in più documenti.
+            output_bytes += nbytes * len(info.operators)
+            process_mpx += mpx * len(info.operators)
+            copy_mb += mb * len(info.operators)
+    return PreflightResult(probes, issues, output_bytes, process_mpx, copy_mb)
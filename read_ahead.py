@@ -0,0 +1,103 @@
+# ReportGenerator - Lettura anticipata delle immagini
+# Creato da Alessandro Frullo
+#
+# Le immagini stanno spesso su condivisioni di rete (SMB/NFS): aprirle solo
+# quando tocca a loro lascia il thread di generazione fermo sulla latenza di
+# ogni file. `ReadAhead` legge in memoria, su alcuni thread di I/O, i file
+# che verranno elaborati subito dopo, nello stesso ordine in cui verranno
+# usati, finché i byte letti e non ancora consumati restano entro un
+# budget: la memoria occupata è limitata e la velocità dipende dalla CPU
+# invece che dai tempi di risposta della rete.
+
+import itertools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+__author__ = "Alessandro Frullo"
+
+DEFAULT_READ_AHEAD_BYTES = 64 * 1024 ** 2  # 64 MB per documento in generazione
+READ_AHEAD_THREADS = 4
+
+
+class ReadAhead:
+    """Legge i file in anticipo su thread di I/O, entro `max_bytes` in memoria.
+
+    submit(path, then) restituisce un Future con (dati, risultato di
+    then(dati)): dati sono i byte del file, o None se non è stato letto
+    (file non accessibile o più grande dell'intero budget: chi lo usa lo
+    apre dal percorso). I file vanno consumati nell'ordine di `submit` e i
+    loro byte restituiti con `release` dopo l'uso; il budget viene assegnato
+    nello stesso ordine, quindi il prossimo file da consumare non resta mai
+    in attesa di quelli successivi.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_READ_AHEAD_BYTES, threads=READ_AHEAD_THREADS):
+        self.max_bytes = max_bytes
+        self._pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='read-ahead')
+        self._cond = threading.Condition()
+        self._buffered = 0
+        self._tickets = itertools.count()
+        self._next = 0
+        self._closed = False
+
+    def submit(self, path, then=None):
+        """Accoda la lettura di `path`; then(dati), se indicato, viene eseguita sul thread di I/O."""
+        return self._pool.submit(self._read, path, next(self._tickets), then)
+
+    def _read(self, path, ticket, then):
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = None
+        wanted = size is not None and size <= self.max_bytes
+        with self._cond:
+            while not self._closed and not (
+                    self._next == ticket and (not wanted or self._buffered + size <= self.max_bytes)):
+                self._cond.wait()
+            if self._closed:
+                return None, None
+            self._next += 1
+            if wanted:
+                self._buffered += size
+            self._cond.notify_all()
+        data = None
+        if wanted:
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+            except OSError:
+                pass
+            # Il file può essere cambiato dopo la lettura della dimensione.
+            self._adjust((len(data) if data is not None else 0) - size)
+        if then is None or self._closed:
+            return data, None
+        try:
+            return data, then(data)
+        except BaseException:
+            self.release(data)
+            raise
+
+    def _adjust(self, delta):
+        if delta:
+            with self._cond:
+                self._buffered += delta
+                self._cond.notify_all()
+
+    def release(self, data):
+        """Restituisce al budget i byte di un file già usato (None: nulla da restituire)."""
+        if data is not None:
+            self._adjust(-len(data))
+
+    @property
+    def buffered_bytes(self):
+        """Byte letti e non ancora restituiti."""
+        with self._cond:
+            return self._buffered
+
+    def close(self):
+        """Ferma le letture in attesa; quelle in corso terminano il file corrente."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._pool.shutdown(wait=False)
@@ -0,0 +1,312 @@
+# ReportGenerator - Modalità batch (senza interfaccia grafica)
+# Creato da Alessandro Frullo
+#
+# Esempio:
+#   python report_batch.py campagna_roma.json campagna_milano.yaml --workers 16
+#
+# Ogni manifest descrive un report:
+#   {
+#     "title": "Campagna Roma",
+#     "output_dir": "report/roma",
+#     "crop_mode": "both",
+#     "crop_tolerance": 12,
+#     "crop_native": false,
+#     "add_label": true,
+#     "label_native": true,
+#     "target_dpi": 200,
+#     "encoding": "palette",
+#     "output_format": "docx",
+#     "max_volume_mb": 150,
+#     "blocks": [
+#       {"title": "Drive Test 4G", "images": ["roma/4G", "roma/extra/*.png"]},
+#       {"title": "Drive Test 5G", "images": ["roma/5G"]}
+#     ]
+#   }
+# "blocks" può anche essere un dict {titolo: [cartelle o glob]}. I percorsi
+# relativi sono risolti rispetto alla cartella del manifest. Un file può
+# contenere anche una lista di manifest.
+
+import argparse
+import glob
+import json
+import multiprocessing
+import sys
+import textwrap
+from pathlib import Path
+
+from image_cache import DEFAULT_CACHE_SIZE, ImageCache
+from preflight import run_preflight
+from read_ahead import DEFAULT_READ_AHEAD_BYTES
+from run_report import RunReport
+from report_engine import create_image_pool, generate_reports
+from report_settings import (
+    CROP_MODES, DEFAULT_WORKERS, ENCODINGS, IMAGE_EXTENSIONS, OPERATOR_OUTCOMES, OUTPUT_FORMATS, ImageOptions,
+    VolumeLimits,
+)
+
+__author__ = "Alessandro Frullo"
+
+
+class ManifestError(ValueError):
+    """Manifest non valido o non leggibile."""
+
+
+def _read_manifest_file(path):
+    """Legge un file JSON o YAML e restituisce una lista di manifest."""
+    text = path.read_text(encoding='utf-8')
+    if path.suffix.lower() in ('.yaml', '.yml'):
+        try:
+            import yaml
+        except ImportError:
+            raise ManifestError(f'{path}: per i manifest YAML serve il pacchetto PyYAML')
+        data = yaml.safe_load(text)
+    else:
+        data = json.loads(text)
+    return data if isinstance(data, list) else [data]
+
+
+def expand_images(patterns, base_dir):
+    """Espande cartelle e glob in una lista di immagini, senza duplicati."""
+    if isinstance(patterns, str):
+        patterns = [patterns]
+    images = []
+    seen = set()
+    for pattern in patterns:
+        pattern = str(base_dir / Path(pattern).expanduser())
+        if Path(pattern).is_dir():
+            matches = sorted(str(p) for p in Path(pattern).iterdir() if p.is_file())
+        else:
+            matches = sorted(glob.glob(pattern, recursive=True))
+        for match in matches:
+            if Path(match).suffix.lower() in IMAGE_EXTENSIONS and match not in seen:
+                seen.add(match)
+                images.append(match)
+    return images
+
+
+def _is_int(value, lo, hi=None):
+    """True se value è un intero (non bool né float) compreso tra lo e hi."""
+    return (isinstance(value, int) and not isinstance(value, bool)
+            and value >= lo and (hi is None or value <= hi))
+
+
+def load_settings(data, base_dir):
+    """Valida titolo, cartella di output e opzioni di un manifest (tutto tranne i blocchi)."""
+    if not isinstance(data, dict):
+        raise ManifestError('il manifest deve essere un oggetto')
+    title = str(data.get('title') or '').strip().replace(' ', '_')
+    if not title:
+        raise ManifestError('titolo obbligatorio')
+    crop_mode = data.get('crop_mode', 'none')
+    if crop_mode not in CROP_MODES:
+        raise ManifestError(f"crop_mode non valido: {crop_mode!r} (ammessi: {', '.join(CROP_MODES)})")
+    crop_tolerance = data.get('crop_tolerance', 0)
+    if not _is_int(crop_tolerance, 0, 255):
+        raise ManifestError(f'crop_tolerance non valido: {crop_tolerance!r} (0-255)')
+    target_dpi = data.get('target_dpi')
+    if target_dpi is not None and not _is_int(target_dpi, 1):
+        raise ManifestError(f'target_dpi non valido: {target_dpi!r}')
+    encoding = data.get('encoding', 'png')
+    if encoding not in ENCODINGS:
+        raise ManifestError(f"encoding non valido: {encoding!r} (ammessi: {', '.join(ENCODINGS)})")
+    defaults = ImageOptions._field_defaults
+    png_level = data.get('png_compress_level', defaults['png_compress_level'])
+    if not _is_int(png_level, 0, 9):
+        raise ManifestError(f'png_compress_level non valido: {png_level!r} (0-9)')
+    jpeg_quality = data.get('jpeg_quality', defaults['jpeg_quality'])
+    if not _is_int(jpeg_quality, 1, 95):
+        raise ManifestError(f'jpeg_quality non valido: {jpeg_quality!r} (1-95)')
+    output_format = data.get('output_format', 'docx')
+    if output_format not in OUTPUT_FORMATS:
+        raise ManifestError(f"output_format non valido: {output_format!r} "
+                            f"(ammessi: {', '.join(OUTPUT_FORMATS)})")
+    volume_limits = {}
+    for key in ('max_volume_mb', 'max_volume_images', 'max_volume_pages'):
+        value = data.get(key)
+        if value is not None and not _is_int(value, 1):
+            raise ManifestError(f'{key} non valido: {value!r}')
+        volume_limits[key] = value
+
+    return {
+        'title': title,
+        'out_dir': base_dir / Path(data.get('output_dir') or '.').expanduser(),
+        'output_format': output_format,
+        'volume_limits': VolumeLimits(
+            max_bytes=volume_limits['max_volume_mb'] * 1024 ** 2 if volume_limits['max_volume_mb'] else None,
+            max_images=volume_limits['max_volume_images'],
+            max_pages=volume_limits['max_volume_pages'],
+        ),
+        'options': ImageOptions(
+            crop_mode=crop_mode,
+            add_label=bool(data.get('add_label', False)),
+            target_dpi=target_dpi,
+            encoding=encoding,
+            png_compress_level=png_level,
+            jpeg_quality=jpeg_quality,
+            crop_tolerance=crop_tolerance,
+            crop_native=bool(data.get('crop_native', False)),
+            label_native=bool(data.get('label_native', False)),
+        ),
+    }
+
+
+def load_manifest(data, base_dir):
+    """Valida un manifest e restituisce i parametri per `generate_reports`."""
+    job = load_settings(data, base_dir)
+    raw_blocks = data.get('blocks') or []
+    if isinstance(raw_blocks, dict):
+        raw_blocks = [{'title': t, 'images': imgs} for t, imgs in raw_blocks.items()]
+    blocks = {}
+    if not isinstance(raw_blocks, list):
+        raise ManifestError('blocks deve essere una lista o un oggetto')
+    for blk in raw_blocks:
+        if not isinstance(blk, dict):
+            raise ManifestError('ogni blocco deve essere un oggetto con titolo e immagini')
+        blk_title = str(blk.get('title') or '').strip()
+        if not blk_title:
+            raise ManifestError('ogni blocco deve avere un titolo')
+        images = expand_images(blk.get('images') or [], base_dir)
+        if not images:
+            print(f"Attenzione: nessuna immagine per il blocco '{blk_title}'")
+            continue
+        blocks[blk_title] = images
+    if not blocks:
+        raise ManifestError('aggiungi almeno un blocco con immagini')
+    job['blocks'] = blocks
+    return job
+
+
+def _print_operator_done(op, error, outcome):
+    print(f'  {op}: errore - {error}' if error else f'  {op}: {OPERATOR_OUTCOMES[outcome]}')
+
+
+def run_batch(manifest_paths, workers=DEFAULT_WORKERS, parallel_ops=True, cache=None,
+              fast_append=True, report=None, incremental=False, streaming=True,
+              read_ahead=DEFAULT_READ_AHEAD_BYTES, preflight='check'):
+    """Genera i report di tutti i manifest con un unico pool di processi.
+
+    `cache` (`ImageCache`, opzionale) è condivisa tra tutti i manifest.
+    fast_append: aggiunta rapida ai documenti esistenti (vedi
+    `report_engine.build_operator_document`).
+    report: `RunReport` opzionale, comune a tutti i manifest.
+    incremental: rigenera solo i documenti con input modificati (vedi
+    `report_engine.generate_reports`).
+    streaming: scrittura in streaming dei documenti nuovi (vedi
+    `report_engine.build_operator_document`).
+    read_ahead: byte di immagini letti in anticipo per documento (vedi
+    `report_engine.generate_reports`).
+    preflight: 'check' verifica le immagini (vedi `preflight`) e ne stampa
+    l'esito prima di generare, 'only' verifica senza generare (un report con
+    immagini non valide conta come fallito), None non verifica.
+    Un manifest non valido o un report che fallisce (per esempio con la
+    cartella di output non scrivibile) viene segnalato e non interrompe i
+    successivi. Restituisce il numero di report con almeno un errore.
+    """
+    failed = 0
+    pool = create_image_pool(workers) if preflight != 'only' else None
+    try:
+        for manifest_path in manifest_paths:
+            manifest_path = Path(manifest_path)
+            try:
+                manifests = _read_manifest_file(manifest_path)
+            except (OSError, ValueError) as e:
+                print(f'Errore con {manifest_path}: {e}')
+                failed += 1
+                continue
+
+            # Un report non valido o fallito non ferma i successivi.
+            for number, data in enumerate(manifests, 1):
+                name = f'{manifest_path} (report {number})' if len(manifests) > 1 else str(manifest_path)
+                try:
+                    job = load_manifest(data, manifest_path.parent)
+                except (OSError, ValueError) as e:
+                    print(f'Errore con {name}: {e}')
+                    failed += 1
+                    continue
+                try:
+                    if preflight is not None:
+                        result = run_preflight(job['blocks'], job['options'])
+                        print(f"Verifica '{job['title']}':")
+                        print(textwrap.indent(result.summary(workers), '  '))
+                        if preflight == 'only':
+                            failed += bool(result.errors)
+                            continue
+                    print(f"Generazione '{job['title']}' in {job['out_dir']}...")
+                    errors = generate_reports(
+                        job['title'], job['out_dir'], job['blocks'], job['options'],
+                        image_pool=pool, parallel_ops=parallel_ops,
+                        on_operator_done=_print_operator_done, cache=cache, fast_append=fast_append,
+                        report=report, incremental=incremental, streaming=streaming,
+                        output_format=job['output_format'], volume_limits=job['volume_limits'],
+                        read_ahead=read_ahead,
+                    )
+                except Exception as e:
+                    # Es. cartella di output non scrivibile: si passa al report successivo.
+                    print(f"Errore con '{job['title']}': {e}")
+                    failed += 1
+                    continue
+                if errors:
+                    failed += 1
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Genera i report Word da uno o più manifest JSON/YAML.')
+    parser.add_argument('manifests', nargs='*', help='file manifest (.json, .yaml, .yml)')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f'processi per le immagini (predefinito: {DEFAULT_WORKERS}, 1 = seriale)')
+    parser.add_argument('--serial-ops', action='store_true',
+                        help='genera gli operatori uno alla volta invece che in parallelo')
+    parser.add_argument('--incremental', action='store_true',
+                        help='rigenera da zero solo i documenti con input modificati, salta gli altri')
+    parser.add_argument('--full-rewrite', action='store_true',
+                        help='aggiorna i documenti esistenti caricandoli e risalvandoli per intero')
+    parser.add_argument('--no-streaming', action='store_true',
+                        help='tiene in memoria le immagini dei documenti nuovi fino al salvataggio')
+    parser.add_argument('--read-ahead', type=int, default=DEFAULT_READ_AHEAD_BYTES // 1024 ** 2, metavar='MB',
+                        help='MB di immagini letti in anticipo per documento, utile su condivisioni '
+                             'di rete (predefinito: %(default)s, 0 = disattivata)')
+    parser.add_argument('--preflight', action='store_true',
+                        help='verifica solo le immagini (intestazioni, nomi, stime) senza generare i report')
+    parser.add_argument('--no-preflight', action='store_true',
+                        help='non verificare le immagini prima della generazione')
+    parser.add_argument('--no-cache', action='store_true', help='non usare la cache delle immagini elaborate')
+    parser.add_argument('--cache-dir', help='cartella della cache (predefinita: cartella cache utente)')
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE // 1024 ** 2,
+                        help='dimensione massima della cache in MB (predefinito: %(default)s)')
+    parser.add_argument('--clear-cache', action='store_true', help='svuota la cache prima di iniziare')
+    parser.add_argument('--report', action='append', default=[], metavar='FILE',
+                        help='salva il report di esecuzione (.json o .csv, ripetibile)')
+    args = parser.parse_args(argv)
+    if not args.manifests and not args.clear_cache:
+        parser.error('indica almeno un manifest')
+
+    cache = ImageCache(args.cache_dir, max_bytes=args.cache_size * 1024 ** 2)
+    if args.clear_cache:
+        freed = cache.clear()
+        print(f'Cache svuotata: {freed / 1024 ** 2:.1f} MB liberati ({cache.root})')
+    if not args.manifests:
+        return 0
+
+    report = RunReport() if args.report else None
+    failed = run_batch(args.manifests, workers=max(1, args.workers), parallel_ops=not args.serial_ops,
+                       cache=None if args.no_cache else cache, fast_append=not args.full_rewrite,
+                       report=report, incremental=args.incremental, streaming=not args.no_streaming,
+                       read_ahead=max(0, args.read_ahead) * 1024 ** 2,
+                       preflight='only' if args.preflight else None if args.no_preflight else 'check')
+    if report is not None:
+        report.finish()
+        print(report.summary())
+        for path in args.report:
+            report.write(path)
+            print(f'Report salvato in {path}')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    # Necessario per il pool di processi nell'eseguibile PyInstaller.
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,1015 @@
+# ReportGenerator - Motore di generazione
+# Creato da Alessandro Frullo
+#
+# Logica di elaborazione immagini e costruzione dei documenti Word, senza
+# dipendenze da tkinter: usata sia dalla GUI (concatenator_v2.py) sia dalla
+# modalità batch (report_batch.py).
+
+import io
+import math
+import multiprocessing
+import os
+import threading
+import time
+import weakref
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from pathlib import Path
+from typing import NamedTuple, Optional, Tuple
+
+from docx import Document
+from docx.shared import Inches, Pt, RGBColor
+from docx.enum.section import WD_ORIENTATION
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+from docx.oxml import OxmlElement
+from docx.oxml.ns import qn
+from PIL import Image, ImageChops, ImageDraw, ImageFont
+
+try:
+    import numpy as np
+except ImportError:  # NumPy è opzionale: senza si usa Pillow
+    np = None
+
+from build_manifest import BuildManifest, fingerprint
+from docx_package import AppendNotSupported, DocxAppender, StreamingDocxWriter
+from image_names import OPERATORS, extract_label_name, partition_by_operator, sort_images_by_order
+from pdf_writer import PAGE_SIZE as PDF_PAGE_SIZE, PdfDocument
+from read_ahead import DEFAULT_READ_AHEAD_BYTES, ReadAhead
+from report_settings import ACCENT_BLUE, DEFAULT_WORKERS, GenerationCancelled, VolumeLimits
+from volume_split import (
+    VolumeIndex, VolumeUsage, estimate_usage, existing_volumes, plan_volumes, remove_stale_volumes, volume_path,
+)
+
+__author__ = "Alessandro Frullo"
+__version__ = "2.1.0"
+
+# Formati che Word accetta così come sono: gli altri (es. WebP) vanno sempre
+# ricodificati.
+_EMBEDDABLE_FORMATS = ('JPEG', 'PNG', 'BMP', 'GIF', 'TIFF')
+# Formati con compressione lossy: ricodificati in JPEG (vedi `_encode`).
+_LOSSY_FORMATS = ('JPEG', 'MPO', 'WEBP')
+
+# Dimensioni layout documento (in pollici)
+SECTION_MARGIN = 0.2
+HEADING_SPACE_AFTER = 0.2
+
+# Lato minimo (in pixel) della versione campionata usata per il ritaglio
+_BBOX_COARSE_SIDE = 256
+
+# Font delle etichette (con ripiego sul font predefinito di Pillow)
+LABEL_FONT = 'arial.ttf'
+LABEL_FONT_SIZE = 26
+# Etichette come paragrafo Word: interlinea esatta, bordo e spazio in punti.
+# L'altezza totale viene sottratta allo spazio disponibile per l'immagine.
+CAPTION_LINE = 14
+CAPTION_BORDER = 1.5
+CAPTION_PADDING = 2
+CAPTION_SPACE_AFTER = 4
+CAPTION_HEIGHT = (CAPTION_LINE + CAPTION_SPACE_AFTER + 2 * (CAPTION_BORDER + CAPTION_PADDING)) / 72
+
+# Immagini in elaborazione contemporaneamente per ogni pool: limita la
+# memoria occupata dai risultati non ancora inseriti nel documento.
+MAX_PENDING_IMAGES = 64
+
+
+class ProcessedImage(NamedTuple):
+    """Risultato dell'elaborazione di un'immagine, pronto per `add_picture`."""
+    source: object           # percorso originale, BytesIO o (tra processi) bytes
+    size: Tuple[int, int]    # dimensioni in pixel dopo ritaglio ed etichetta
+    # Ritaglio Word (left, top, right, bottom) in millesimi di punto
+    # percentuale dell'originale, o None se l'immagine va inserita intera.
+    src_rect: Optional[Tuple[int, int, int, int]] = None
+    # Durata delle fasi, dimensioni originali ed esito della cache (vedi
+    # `load_processed_image` e `run_report`); None se non misurati.
+    stats: Optional[dict] = None
+
+
+# ---------------------------------------------------------------------------
+# Utilità immagini
+# ---------------------------------------------------------------------------
+
+def _mask_bbox(img, threshold):
+    """Bounding-box dei pixel non bianchi (un canale < threshold), o None."""
+    if np is not None:
+        mask = np.asarray(img) < threshold
+        # Righe: basta un canale qualsiasi, senza ridurre prima per pixel.
+        rows = np.flatnonzero(mask.reshape(mask.shape[0], -1).any(axis=1))
+        if rows.size == 0:
+            return None
+        cols = mask[rows[0]:rows[-1] + 1].any(axis=0)
+        cols = np.flatnonzero(cols.any(axis=1) if cols.ndim == 2 else cols)
+        return int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1
+    if img.mode != 'L':
+        # Canale minimo: un pixel è "bianco" solo se lo sono tutti i canali.
+        r, g, b = img.split()[:3]
+        img = ImageChops.darker(ImageChops.darker(r, g), b)
+    return img.point([255 if v < threshold else 0 for v in range(256)]).getbbox()
+
+
+def find_content_bbox(img, tolerance=0):
+    """Bounding-box del contenuto non bianco: (left, top, right, bottom) o None.
+
+    Un pixel è sfondo se tutti i canali valgono almeno 255 - tolerance, così
+    il rumore JPEG vicino al bianco non impedisce il ritaglio. Il box viene
+    prima cercato su una versione campionata dell'immagine e poi rifinito a
+    piena risoluzione solo nelle fasce dei bordi: nessun buffer aggiuntivo
+    grande quanto l'immagine. Il risultato è esatto, come una scansione
+    completa. Usa NumPy se disponibile, altrimenti Pillow.
+    """
+    threshold = 255 - tolerance
+    w, h = img.size
+    step = min(w, h) // _BBOX_COARSE_SIDE
+    if step < 2:
+        return _mask_bbox(img, threshold)
+    cw, ch = -(-w // step), -(-h // step)
+    coarse = _mask_bbox(img.resize((cw, ch), Image.NEAREST), threshold)
+    if coarse is None:
+        # Contenuto sottile sfuggito al campionamento: scansione completa.
+        return _mask_bbox(img, threshold)
+
+    # Ogni campione (i, j) proviene dalla cella [i*sx, (i+1)*sx) x [j*sy, (j+1)*sy):
+    # il bordo vero sta tra il bordo dell'immagine e la cella del campione.
+    sx, sy = w / cw, h / ch
+    cl, ct, cr, cb = coarse
+    strip = _mask_bbox(img.crop((0, 0, w, min(h, math.ceil((ct + 1) * sy)))), threshold)
+    if strip is None:
+        return _mask_bbox(img, threshold)
+    top = strip[1]
+    y0 = max(top, math.floor((cb - 1) * sy))
+    strip = _mask_bbox(img.crop((0, y0, w, h)), threshold)
+    if strip is None:
+        return _mask_bbox(img, threshold)
+    bottom = y0 + strip[3]
+    left = _mask_bbox(img.crop((0, top, min(w, math.ceil((cl + 1) * sx)), bottom)), threshold)
+    x0 = math.floor((cr - 1) * sx)
+    right = _mask_bbox(img.crop((x0, top, w, bottom)), threshold)
+    if left is None or right is None:
+        return _mask_bbox(img, threshold)
+    return left[0], top, x0 + right[2], bottom
+
+
+def _crop_box(img, mode, tolerance=0):
+    """Box da ritagliare secondo `mode`, o None se non c'è niente da togliere.
+
+    mode: 'sides' (solo sinistra/destra), 'topbottom' (solo alto/basso)
+          o 'both' (tutti e quattro i lati).
+    """
+    bbox = find_content_bbox(img, tolerance)  # right/bottom esclusivi
+    if bbox is None:
+        return None  # immagine completamente bianca: niente da ritagliare
+    left, top, right, bottom = bbox
+    w, h = img.size
+    if mode == 'sides':
+        box = (left, 0, right, h)
+    elif mode == 'topbottom':
+        box = (0, top, w, bottom)
+    else:  # 'both'
+        box = bbox
+    return None if box == (0, 0, w, h) else box
+
+
+def crop_image(img, mode, tolerance=0):
+    """Ritaglia i bordi bianchi (o quasi bianchi, vedi `find_content_bbox`)."""
+    box = _crop_box(img, mode, tolerance)
+    return img if box is None else img.crop(box)
+
+
+@lru_cache(maxsize=None)
+def _get_font(size=LABEL_FONT_SIZE):
+    """Carica (una sola volta) il font usato per le etichette."""
+    try:
+        return ImageFont.truetype(LABEL_FONT, size)
+    except IOError:
+        return ImageFont.load_default()
+
+
+def _add_label(img, label):
+    """Aggiunge una banda superiore con l'etichetta racchiusa in un riquadro."""
+    font = _get_font()
+    tw, th = font.getbbox(label)[2:]
+    pad_x, pad_y = 20, 10
+    band_h = th + 2 * pad_y
+    new_w = max(img.width, tw + 2 * pad_x)
+    new_img = Image.new('RGB', (new_w, img.height + band_h), 'white')
+    draw = ImageDraw.Draw(new_img)
+    draw.rectangle([(0, 0), (new_w, band_h)], outline=ACCENT_BLUE, width=2)
+    draw.text(((new_w - tw) // 2, pad_y), label, fill=ACCENT_BLUE, font=font)
+    new_img.paste(img, (0, band_h))
+    return new_img
+
+
+def _fit_size(size, box):
+    """Dimensioni di `size` ridotte (mai ingrandite) per stare in `box`."""
+    w, h = size
+    scale = min(box[0] / w, box[1] / h, 1.0)
+    return max(1, round(w * scale)), max(1, round(h * scale))
+
+
+def _encode(img, options, source_format, resized=False):
+    """Codifica l'immagine elaborata secondo `options.encoding`.
+
+    Con resized (risoluzione `options.target_dpi`) anche 'png' si comporta
+    come 'auto': una foto JPEG ridotta e salvata in PNG senza perdite
+    occuperebbe più dell'originale.
+    """
+    encoding = options.encoding
+    if encoding == 'auto' or (encoding == 'png' and resized):
+        encoding = 'jpeg' if source_format in _LOSSY_FORMATS else 'png'
+    buf = io.BytesIO()
+    if encoding == 'jpeg':
+        if img.mode not in ('L', 'RGB'):
+            img = img.convert('RGB')
+        img.save(buf, format='JPEG', quality=options.jpeg_quality)
+    else:
+        if encoding == 'palette' and img.mode == 'RGB':
+            # Senza dithering le tinte piatte di mappe e legende restano pulite.
+            img = img.quantize(256, method=Image.Quantize.FASTOCTREE, dither=Image.Dither.NONE)
+        img.save(buf, format='PNG', compress_level=options.png_compress_level)
+    buf.seek(0)
+    return buf
+
+
+def load_processed_image(path, options, target_px=None, stats=None, data=None):
+    """Restituisce il `ProcessedImage` pronto per `doc.add_picture`.
+
+    Se non serve alcuna modifica si passa direttamente il percorso originale
+    (nessuna ri-codifica). Altrimenti l'immagine elaborata resta in memoria,
+    codificata secondo `options.encoding`: niente file temporanei su disco.
+    Con `options.crop_native` il ritaglio, se è l'unica modifica, viene
+    restituito come `src_rect` e l'originale non viene ricodificato.
+
+    target_px: (larghezza, altezza) massime in pixel dell'immagine finale,
+    cioè lo spazio sulla pagina alla risoluzione `options.target_dpi`. Le
+    immagini più grandi vengono ridimensionate; i JPEG sono decodificati
+    direttamente a risoluzione ridotta (draft), senza decodifica completa.
+
+    stats: dict opzionale in cui vengono registrati le dimensioni originali
+    ('source_size') e la durata in secondi delle fasi eseguite ('open',
+    'crop', 'label', 'resize', 'encode').
+
+    data: byte del file già letti (vedi `read_ahead`), usati al posto del
+    percorso per aprire l'immagine; source resta comunque il percorso quando
+    l'originale va inserito così com'è.
+    """
+    crop_mode = options.crop_mode
+    add_label = _burns_label(options)
+    stats = {} if stats is None else stats
+    last = time.perf_counter()
+
+    def mark(stage):
+        nonlocal last
+        now = time.perf_counter()
+        stats[stage] = now - last
+        last = now
+
+    with Image.open(io.BytesIO(data) if data is not None else path) as src:
+        fmt = src.format
+        stats['source_size'] = src.size
+        fits = target_px is None or _fit_size(src.size, target_px) == src.size
+        as_is = embeddable_as_is(fmt, src.size, options, target_px)
+        if crop_mode == 'none' and as_is:
+            mark('open')
+            return ProcessedImage(path, src.size)
+        if options.crop_native and as_is:
+            probe = src if src.mode in ('L', 'RGB') else src.convert('RGB')
+            mark('open')
+            box = _crop_box(probe, crop_mode, options.crop_tolerance)
+            mark('crop')
+            if box is None:
+                return ProcessedImage(path, src.size)
+            return ProcessedImage(path, (box[2] - box[0], box[3] - box[1]), _src_rect(box, src.size))
+        if not fits and fmt == 'JPEG':
+            # Col ritaglio il contenuto utile è più piccolo dell'immagine: si
+            # chiede allora l'intero box per non scendere sotto i DPI richiesti.
+            src.draft(src.mode, target_px if crop_mode != 'none' else _fit_size(src.size, target_px))
+        if options.encoding == 'auto' and src.mode in ('L', 'RGB'):
+            img = src.copy()
+        else:
+            img = src.convert('RGB')
+    mark('open')
+    if crop_mode != 'none':
+        img = crop_image(img, crop_mode, options.crop_tolerance)
+        mark('crop')
+    if add_label:
+        img = _add_label(img, extract_label_name(path))
+        mark('label')
+    if target_px is not None:
+        img.thumbnail(target_px, Image.LANCZOS, reducing_gap=3.0)
+        mark('resize')
+    encoded = _encode(img, options, fmt, resized=target_px is not None)
+    mark('encode')
+    return ProcessedImage(encoded, img.size)
+
+
+def embeddable_as_is(fmt, size, options, target_px=None):
+    """True se un'immagine `fmt` di `size` pixel può essere inserita senza ricodifica.
+
+    Vale quando non va ridimensionata né etichettata e il formato è accettato
+    da Word; l'eventuale ritaglio resta da applicare (o da rendere come
+    ritaglio Word con `options.crop_native`).
+    """
+    fits = target_px is None or _fit_size(size, target_px) == size
+    return fits and not _burns_label(options) and fmt in _EMBEDDABLE_FORMATS
+
+
+def image_area(box, options):
+    """Spazio per un'immagine in una pagina di `box` (pollici): (box, target_px).
+
+    Dall'altezza si toglie l'etichetta Word; target_px è lo spazio in pixel
+    a `options.target_dpi`, o None per mantenere la risoluzione originale.
+    """
+    max_w, max_h = box
+    if options.add_label and options.label_native:
+        max_h -= CAPTION_HEIGHT
+    target_px = None
+    if options.target_dpi:
+        target_px = (round(max_w * options.target_dpi), round(max_h * options.target_dpi))
+    return (max_w, max_h), target_px
+
+
+def _src_rect(box, size):
+    """Converte un box in pixel nei margini di a:srcRect (1/1000 di %)."""
+    left, top, right, bottom = box
+    w, h = size
+    return (round(left * 100000 / w), round(top * 100000 / h),
+            round((w - right) * 100000 / w), round((h - bottom) * 100000 / h))
+
+
+def process_image(path, options, target_px=None, data=None):
+    """Variante di `load_processed_image` eseguibile in un processo separato.
+
+    Nel `ProcessedImage` restituito source è il percorso originale (nessuna
+    ri-codifica) oppure i byte dell'immagine elaborata: a differenza di un
+    BytesIO, i byte attraversano il confine tra processi. stats contiene le
+    misure di `load_processed_image`.
+    """
+    stats = {}
+    result = load_processed_image(path, options, target_px, stats, data)._replace(stats=stats)
+    if isinstance(result.source, io.BytesIO):
+        return result._replace(source=result.source.getvalue())
+    return result
+
+
+def create_image_pool(workers=DEFAULT_WORKERS):
+    """Crea il pool di processi per le immagini (None = elaborazione seriale).
+
+    Si usa sempre 'spawn': il fork di un processo con Tk e thread attivi non è
+    sicuro, ed è comunque l'unico metodo disponibile su Windows.
+    """
+    if workers <= 1:
+        return None
+    return ProcessPoolExecutor(max_workers=workers,
+                               mp_context=multiprocessing.get_context('spawn'))
+
+
+def _burns_label(options):
+    """True se l'etichetta va disegnata sull'immagine."""
+    return options.add_label and not options.label_native
+
+
+def _cache_params(options, target_px):
+    """Parametri di elaborazione che entrano nella chiave della cache."""
+    font = _get_font() if _burns_label(options) else None
+    return tuple(options) + (target_px, getattr(font, 'path', 'default') if font else '', LABEL_FONT_SIZE)
+
+
+# {parte immagine: nome del primo originale inserito dai byte} (vedi `_name_picture`)
+_source_names = weakref.WeakKeyDictionary()
+
+
+class _SourceBytes(io.BytesIO):
+    """Byte di un originale letto in anticipo: nel documento l'immagine mantiene il nome del file."""
+
+    def __init__(self, data, path):
+        super().__init__(data)
+        self.name = os.path.basename(path)
+
+
+def _as_is_image(path, data, options, target_px):
+    """`ProcessedImage` dell'originale se i byte letti vanno inseriti così come sono, altrimenti None.
+
+    Legge solo l'intestazione da `data`: un'immagine che non richiede
+    elaborazione non viene inviata ai processi (i suoi byte non
+    attraversano il confine tra processi). Gli errori di lettura emergono
+    poi nell'elaborazione.
+    """
+    if options.crop_mode != 'none':
+        return None
+    start = time.perf_counter()
+    try:
+        with Image.open(io.BytesIO(data)) as src:
+            fmt, size = src.format, src.size
+    except Exception:
+        return None
+    if not embeddable_as_is(fmt, size, options, target_px):
+        return None
+    return ProcessedImage(path, size, stats={'source_size': size, 'open': time.perf_counter() - start})
+
+
+def _iter_processed(paths, options, executor=None, cache=None, target_px=None, cancel=None,
+                    read_ahead=DEFAULT_READ_AHEAD_BYTES):
+    """Genera (path, `ProcessedImage`, error) nello stesso ordine di `paths`.
+
+    Con un executor le immagini vengono elaborate in parallelo, mantenendo al
+    massimo MAX_PENDING_IMAGES risultati in sospeso; senza, in modo seriale.
+    Con una `ImageCache` le immagini già elaborate in precedenza con gli
+    stessi parametri vengono lette dalla cache invece di essere rielaborate.
+    Se l'evento `cancel` viene impostato le immagini in attesa vengono
+    annullate e si solleva `GenerationCancelled` (quelle già avviate nei
+    processi terminano l'immagine corrente).
+
+    read_ahead: byte che possono essere letti in anticipo (vedi
+    `read_ahead.ReadAhead`, 0 = nessuna lettura anticipata). I file in
+    sospeso vengono letti su thread di I/O e passati già in memoria
+    all'elaborazione e, se inseriti così come sono, al documento; con un
+    executor ai processi vanno solo i file da elaborare.
+    """
+    # Senza ritaglio, etichetta né ridimensionamento l'originale viene usato
+    # così com'è: la cache serve solo quando c'è un'elaborazione (il ritaglio
+    # non distruttivo memorizza solo il box, senza dati).
+    burn_label = _burns_label(options)
+    use_cache = cache is not None and (options.crop_mode != 'none' or burn_label
+                                       or target_px is not None)
+    params = _cache_params(options, target_px) if use_cache else ()
+    reader = ReadAhead(read_ahead) if read_ahead else None
+    paths = iter(paths)
+    pending = deque()
+
+    def submit_next():
+        path = next(paths, None)
+        if path is None:
+            return
+        key = hit = job = read = None
+        if use_cache:
+            key = cache.key(path, *params, extract_label_name(path) if burn_label else '')
+            hit = cache.get(key)
+        if reader is not None and (hit is None or not hit[0]):
+            # Servono i byte del file: per elaborarlo o per inserire l'originale.
+            if hit is None and executor is not None:
+                def then(data, path=path):
+                    ready = _as_is_image(path, data, options, target_px) if data is not None else None
+                    return ready or executor.submit(process_image, path, options, target_px, data)
+            else:
+                then = None
+            read = reader.submit(path, then)
+        elif hit is None and executor is not None:
+            job = executor.submit(process_image, path, options, target_px)
+        pending.append((path, key, hit, job, read))
+
+    for _ in range(MAX_PENDING_IMAGES if executor is not None or reader is not None else 1):
+        submit_next()
+    try:
+        while pending:
+            if cancel is not None and cancel.is_set():
+                raise GenerationCancelled()
+            path, key, hit, job, read = pending.popleft()
+            submit_next()
+            data = ready = None
+            try:
+                if read is not None:
+                    data, chained = read.result()
+                    if isinstance(chained, ProcessedImage):
+                        ready = chained
+                    elif chained is not None:
+                        job = chained
+                if hit is not None:
+                    cached, size, src_rect = hit
+                    # Voce senza dati: si usa l'originale (ritaglio non distruttivo).
+                    result = ProcessedImage(cached or path, size, src_rect, {'cache': 'hit'})
+                elif ready is not None:
+                    result = ready
+                elif job is not None:
+                    result = job.result()
+                else:
+                    result = process_image(path, options, target_px, data)
+            except Exception as e:
+                if reader is not None:
+                    reader.release(data)
+                yield path, None, e
+                continue
+            if key is not None and hit is None:
+                cached = result.source if isinstance(result.source, bytes) else b''
+                cache.put(key, cached, result.size, result.src_rect)
+                result.stats['cache'] = 'miss'
+            if isinstance(result.source, bytes):
+                result = result._replace(source=io.BytesIO(result.source))
+            elif data is not None and not isinstance(result.source, io.BytesIO):
+                # Originale inserito così com'è: niente seconda lettura dalla rete.
+                result = result._replace(source=_SourceBytes(data, path))
+            yield path, result, None
+            if reader is not None:
+                reader.release(data)
+    finally:
+        # Interruzione (annullamento o errore del chiamante): le immagini in
+        # attesa non vengono più lette né elaborate.
+        if reader is not None:
+            reader.close()
+        for _, _, _, job, read in pending:
+            if read is not None and not read.cancel() and read.done() and read.exception() is None:
+                job = read.result()[1]
+            if isinstance(job, Future):
+                job.cancel()
+
+
+def add_images_to_doc(doc, title, imgs, options, executor=None, cache=None, report=None,
+                      on_image=None, cancel=None, read_ahead=DEFAULT_READ_AHEAD_BYTES):
+    """Aggiunge una sezione con titolo e tutte le immagini ordinate.
+
+    Se viene passato un `executor` (vedi `create_image_pool`) le immagini sono
+    elaborate in parallelo; l'inserimento nel documento resta sequenziale e
+    nello stesso ordine, quindi il risultato è identico a quello seriale.
+    `cache` è una `ImageCache` opzionale per le immagini già elaborate.
+    `report` (`run_report.DocumentReport`, opzionale) registra ogni immagine.
+    on_image(), se indicato, viene chiamato dopo ogni immagine (inserita o
+    fallita); cancel è un `threading.Event` che interrompe l'elaborazione
+    con `GenerationCancelled`. read_ahead: byte di immagini che possono
+    essere letti in anticipo (0 = nessuno), vedi `_iter_processed`.
+    """
+    sec = doc.add_section()
+    sec.top_margin = sec.bottom_margin = Inches(SECTION_MARGIN)
+    sec.left_margin = sec.right_margin = Inches(SECTION_MARGIN)
+    max_w = sec.page_width.inches - 2 * SECTION_MARGIN
+    doc.add_heading(title, level=2).paragraph_format.space_after = Inches(HEADING_SPACE_AFTER)
+    max_h = sec.page_height.inches - 2 * SECTION_MARGIN
+    caption = options.add_label and options.label_native
+
+    def insert(path, item, box):
+        return _insert_picture(doc, path, item, box, caption)
+
+    _add_images(title, imgs, options, (max_w, max_h), insert, executor, cache, report, on_image, cancel,
+                read_ahead)
+
+
+def add_images_to_pdf(pdf, title, imgs, options, executor=None, cache=None, report=None,
+                      on_image=None, cancel=None, read_ahead=DEFAULT_READ_AHEAD_BYTES):
+    """Come `add_images_to_doc`, ma su un `pdf_writer.PdfDocument`.
+
+    Il blocco inizia su una pagina nuova con il titolo; ogni immagine è
+    adattata allo spazio della pagina e, se non entra in quello rimasto, va
+    alla pagina successiva come in Word.
+    """
+    pdf.new_page()
+    pdf.add_heading(title, space_after=HEADING_SPACE_AFTER * 72)
+    caption = options.add_label and options.label_native
+
+    def insert(path, item, box):
+        try:
+            w, h = _fit_box(item.size, box)
+            label = CAPTION_HEIGHT * 72 if caption else 0
+            if not pdf.fits(label + h * 72):
+                pdf.new_page()
+            if caption:
+                pdf.add_caption(extract_label_name(path), CAPTION_LINE, CAPTION_BORDER, CAPTION_PADDING,
+                                CAPTION_SPACE_AFTER)
+            pdf.add_image(item.source, w * 72, h * 72, item.src_rect)
+        except Exception as e:
+            return e
+        return None
+
+    box = (pdf.content_width / 72, pdf.content_height / 72)
+    _add_images(title, imgs, options, box, insert, executor, cache, report, on_image, cancel, read_ahead)
+
+
+def _add_images(title, imgs, options, box, insert, executor, cache, report, on_image, cancel, read_ahead):
+    """Elabora le immagini del blocco in ordine e le passa a insert(path, item, box).
+
+    box: spazio di una pagina in pollici, da cui si sottrae l'etichetta Word;
+    insert restituisce l'errore o None.
+    """
+    box, target_px = image_area(box, options)
+    processed = _iter_processed(sort_images_by_order(imgs), options, executor, cache, target_px, cancel,
+                                read_ahead)
+    for path, item, error in processed:
+        start = time.perf_counter()
+        if error is None:
+            error = insert(path, item, box)
+        if error is not None:
+            print(f"Errore con {path}: {error}")
+        if report is not None:
+            report.image(title, path, item, error, None if error else time.perf_counter() - start)
+        if on_image is not None:
+            on_image()
+
+
+def _insert_picture(doc, path, item, box, caption):
+    """Inserisce l'immagine adattata a `box` (pollici); restituisce l'errore o None."""
+    label = _add_caption(doc, extract_label_name(path)) if caption else None
+    try:
+        final_w, final_h = _fit_box(item.size, box)
+        shape = doc.add_picture(item.source, width=Inches(final_w), height=Inches(final_h))
+        if isinstance(item.source, _SourceBytes):
+            _name_picture(doc, shape, item.source.name)
+        if item.src_rect is not None:
+            _set_src_rect(shape, item.src_rect)
+    except Exception as e:
+        if label is not None:
+            label._p.getparent().remove(label._p)
+        return e
+    return None
+
+
+def _name_picture(doc, shape, name):
+    """Dà all'immagine inserita dai byte il nome che avrebbe inserendola dal percorso.
+
+    python-docx usa il nome del file con cui è stata creata la parte
+    immagine (condivisa dalle immagini con gli stessi byte), "image.<ext>"
+    se creata da byte: in quel caso vale il nome del primo file inserito.
+    """
+    pic = shape._inline.graphic.graphicData.pic
+    part = doc.part.related_parts[pic.blipFill.blip.embed]
+    if part.filename == f'image.{part.partname.ext}':
+        name = _source_names.setdefault(part, name)
+    else:
+        name = part.filename
+    pic.nvPicPr.cNvPr.name = name
+
+
+def _fit_box(size, box):
+    """Dimensioni (pollici) dell'immagine di `size` pixel adattata a `box`."""
+    w, h = size
+    max_w, max_h = box
+    if w / h > max_w / max_h:
+        return max_w, max_w * h / w
+    return max_h * w / h, max_h
+
+
+def _add_caption(doc, text):
+    """Aggiunge l'etichetta come paragrafo bordato, unito all'immagine seguente.
+
+    Solo formattazione diretta, nessuno stile nuovo: il documento resta
+    compatibile con l'aggiunta rapida (vedi `docx_package`).
+    """
+    color = ACCENT_BLUE.lstrip('#')
+    par = doc.add_paragraph()
+    borders = OxmlElement('w:pBdr')
+    for side in ('top', 'left', 'bottom', 'right'):
+        edge = OxmlElement(f'w:{side}')
+        edge.set(qn('w:val'), 'single')
+        edge.set(qn('w:sz'), str(round(CAPTION_BORDER * 8)))  # ottavi di punto
+        edge.set(qn('w:space'), str(CAPTION_PADDING))
+        edge.set(qn('w:color'), color)
+        borders.append(edge)
+    par._p.get_or_add_pPr().append(borders)
+    fmt = par.paragraph_format
+    fmt.keep_with_next = True
+    fmt.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    fmt.space_before = Pt(0)
+    fmt.space_after = Pt(CAPTION_SPACE_AFTER)
+    fmt.line_spacing = Pt(CAPTION_LINE)
+    run = par.add_run(text)
+    run.bold = True
+    run.font.color.rgb = RGBColor.from_string(color)
+    return par
+
+
+def _set_src_rect(shape, src_rect):
+    """Applica il ritaglio Word (a:srcRect) all'immagine inserita."""
+    rect = OxmlElement('a:srcRect')
+    for attr, value in zip(('l', 't', 'r', 'b'), src_rect):
+        if value:
+            rect.set(attr, str(value))
+    shape._inline.graphic.graphicData.pic.blipFill.blip.addnext(rect)
+
+
+def new_document():
+    """Crea un documento vuoto con stile Arial 12 e pagina orizzontale."""
+    doc = Document()
+    style = doc.styles['Normal']
+    style.font.name = 'Arial'
+    style.font.size = Pt(12)
+    sec0 = doc.sections[0]
+    sec0.orientation = WD_ORIENTATION.LANDSCAPE
+    sec0.page_width, sec0.page_height = sec0.page_height, sec0.page_width
+    return doc
+
+
+def build_operator_document(path, blocks, options, executor=None, cache=None, fast_append=True,
+                            report=None, rebuild=False, on_image=None, cancel=None, streaming=True,
+                            read_ahead=DEFAULT_READ_AHEAD_BYTES):
+    """Crea (o aggiorna, se esiste) il documento di un operatore e lo salva.
+
+    blocks: lista di (titolo blocco, immagini dell'operatore). Se è vuota il
+    documento non viene toccato. Restituisce True se il file è stato scritto.
+
+    Con fast_append, se il documento esiste i nuovi blocchi vengono costruiti
+    in un documento vuoto e innestati nel pacchetto esistente (vedi
+    `docx_package.DocxAppender`) senza caricarlo né ricomprimerlo; se il
+    documento non è compatibile si ripiega sul caricamento completo.
+    `report` (`run_report.DocumentReport`, opzionale) registra immagini e
+    salvataggio. Con rebuild il documento viene ricreato da zero anche se
+    esiste già. on_image, cancel e read_ahead: vedi `add_images_to_doc`.
+
+    Con streaming, quando il documento viene creato da zero, le immagini
+    vengono scritte nel file man mano che sono inserite (vedi
+    `docx_package.StreamingDocxWriter`) invece di restare tutte in memoria
+    fino al salvataggio.
+
+    Il file viene completato solo alla fine e per sostituzione di una copia
+    temporanea: un errore o un annullamento lasciano intatto il documento
+    esistente.
+    """
+    if not blocks:
+        return False
+    path = Path(path)
+    if cancel is not None and cancel.is_set():
+        raise GenerationCancelled()
+    appender = None
+    if fast_append and not rebuild and path.exists():
+        try:
+            appender = DocxAppender(path)
+        except AppendNotSupported as e:
+            print(f"Aggiunta rapida non disponibile per {path.name}: {e}")
+    fresh = appender is None and (rebuild or not path.exists())
+    doc = new_document() if appender is not None or fresh else Document(str(path))
+    writer = StreamingDocxWriter(path, doc) if streaming and fresh else None
+    if writer is not None:
+        def image_done():
+            writer.flush_media()
+            if on_image is not None:
+                on_image()
+    else:
+        image_done = on_image
+    try:
+        for blk, rel in blocks:
+            add_images_to_doc(doc, blk, rel, options, executor=executor, cache=cache, report=report,
+                              on_image=image_done, cancel=cancel, read_ahead=read_ahead)
+        if cancel is not None and cancel.is_set():
+            raise GenerationCancelled()
+    except BaseException:
+        if writer is not None:
+            writer.abort()
+        raise
+    start = time.perf_counter()
+    if writer is not None:
+        writer.close()
+    elif appender is not None:
+        appender.append(doc)
+    else:
+        _save_atomic(doc, path)
+    if report is not None:
+        report.saved(path, time.perf_counter() - start)
+    return True
+
+
+def _save_atomic(doc, path):
+    """Salva `doc` in una copia temporanea che sostituisce `path` solo a scrittura completata."""
+    tmp = path.with_name(path.name + '.tmp')
+    try:
+        doc.save(str(tmp))
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def build_operator_pdf(path, blocks, options, executor=None, cache=None, report=None,
+                       on_image=None, cancel=None, read_ahead=DEFAULT_READ_AHEAD_BYTES):
+    """Crea il PDF di un operatore, sempre da zero, con gli stessi blocchi del documento Word.
+
+    Il PDF viene scritto in streaming (vedi `pdf_writer.PdfDocument`) e
+    sostituisce quello esistente solo a scrittura completata. Argomenti e
+    valore restituito come in `build_operator_document`.
+    """
+    if not blocks:
+        return False
+    path = Path(path)
+    if cancel is not None and cancel.is_set():
+        raise GenerationCancelled()
+    pdf = PdfDocument(path, PDF_PAGE_SIZE, margin=SECTION_MARGIN * 72, title=path.stem, accent=ACCENT_BLUE)
+    try:
+        for blk, rel in blocks:
+            add_images_to_pdf(pdf, blk, rel, options, executor=executor, cache=cache, report=report,
+                              on_image=on_image, cancel=cancel, read_ahead=read_ahead)
+        if cancel is not None and cancel.is_set():
+            raise GenerationCancelled()
+    except BaseException:
+        pdf.abort()
+        raise
+    start = time.perf_counter()
+    pdf.close()
+    if report is not None:
+        report.saved(path, time.perf_counter() - start)
+    return True
+
+
+def _plan_operator(out_dir, title, op, blocks, limits, suffix, index, append):
+    """Volumi da scrivere per un operatore: lista di (percorso, blocchi, `VolumeUsage`).
+
+    Con append i blocchi vanno nell'ultimo volume esistente, il cui contenuto
+    viene letto dall'indice (o stimato dal file) e poi nei volumi successivi.
+    Un operatore senza blocchi ha un solo volume vuoto (documento non toccato).
+    """
+    if not blocks:
+        return [(volume_path(out_dir, title, op, 1, suffix), [], VolumeUsage())]
+    first, used = 1, VolumeUsage()
+    if append:
+        numbers = existing_volumes(out_dir, title, op, suffix)
+        if numbers:
+            first = numbers[-1]
+            last = volume_path(out_dir, title, op, first, suffix)
+            used = (index.usage(op, last.name) if index is not None else None) or estimate_usage(last)
+    return [(volume_path(out_dir, title, op, first + i, suffix), vol_blocks, usage)
+            for i, (vol_blocks, usage) in enumerate(plan_volumes(blocks, limits, used)) if vol_blocks]
+
+
+def _remove_documents(paths, manifest):
+    """Elimina i documenti di un operatore rimasto senza blocchi e le loro voci nel manifest."""
+    for path in paths:
+        path.unlink(missing_ok=True)
+        manifest.forget(path)
+
+
+def generate_reports(title, out_dir, blocks, options, image_pool=None, parallel_ops=True,
+                     on_operator_done=None, cache=None, fast_append=True, report=None,
+                     incremental=False, on_progress=None, cancel=None, streaming=True,
+                     output_format='docx', volume_limits=None, read_ahead=DEFAULT_READ_AHEAD_BYTES):
+    """Genera (o aggiorna) i documenti `<title>_<operatore>.docx` in out_dir.
+
+    Con output_format 'pdf' vengono invece creati `<title>_<operatore>.pdf`
+    (vedi `build_operator_pdf`): un PDF contiene sempre solo i blocchi
+    indicati e viene ricreato a ogni generazione.
+
+    volume_limits (`VolumeLimits`, opzionale): un documento che supererebbe
+    i limiti prosegue in `<title>_<operatore>_vol2`, `_vol3`, ... (vedi
+    `volume_split`); l'indice dei blocchi per volume viene salvato in
+    `<title>_volumes.json`. I nuovi blocchi si aggiungono all'ultimo volume
+    esistente; quando i documenti vengono ricreati da zero (incremental o
+    PDF) i volumi non più necessari vengono eliminati. Nelle callback e
+    negli errori i volumi di un operatore contano come un unico documento.
+
+    options: `ImageOptions` per l'elaborazione delle immagini.
+    image_pool: executor per le immagini (vedi `create_image_pool`), può
+    essere condiviso tra più generazioni, così come `cache` (`ImageCache`).
+    on_operator_done(op, error, outcome), se indicato, viene chiamato al
+    termine di ogni operatore, dal thread che esegue la generazione; outcome
+    è una chiave di OPERATOR_OUTCOMES. fast_append, streaming: vedi
+    `build_operator_document`.
+    read_ahead: byte di immagini letti in anticipo per ogni documento in
+    generazione, utile quando le immagini stanno su una condivisione di rete
+    (vedi `read_ahead`; 0 = nessuna lettura anticipata).
+    report: `run_report.RunReport` opzionale in cui registrare durate e
+    dimensioni di ogni immagine e documento.
+
+    Con incremental i documenti rispecchiano esattamente i blocchi indicati:
+    le impronte degli input sono salvate in `<title>_build.json` (vedi
+    `build_manifest`), un documento con input invariati viene saltato e uno
+    con input diversi viene ricreato da zero invece di essere aggiornato; i
+    documenti di un operatore rimasto senza blocchi vengono eliminati
+    (esito 'removed'). Solo i documenti registrati nel manifest e non
+    modificati in seguito vengono ricreati o eliminati: se un operatore ha
+    altri documenti Word esistenti (per esempio creati aggiungendo blocchi)
+    non viene toccato e fallisce con `FileExistsError`.
+
+    on_progress(fatte, totale), se indicato, viene chiamato dopo ogni
+    immagine inserita o fallita (da più thread). Impostando l'evento `cancel`
+    la generazione si ferma entro un'immagine per processo: i documenti non
+    completati restano come erano e alla fine viene sollevato
+    `GenerationCancelled`.
+
+    Restituisce {operatore: eccezione} per gli operatori non generati: un
+    operatore fallito non interrompe gli altri.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    by_op = partition_by_operator(blocks)
+    errors = {}
+    manifest = BuildManifest.for_output(out_dir, title) if incremental else None
+
+    limits = volume_limits or VolumeLimits()
+    rebuild = manifest is not None or output_format == 'pdf'
+    index = VolumeIndex.for_output(out_dir, title)
+    use_index = any(limits) or index.path.exists()
+
+    plans = {}      # {operatore: [(percorso, blocchi, VolumeUsage)]}
+    results = {}    # {operatore: esiti dei volumi completati}
+    remaining = {}  # {operatore: volumi ancora in generazione}
+    inputs = {}
+
+    def volume_done(op, path, outcome):
+        results[op].append(outcome)
+        if use_index and outcome in ('built', 'skipped'):
+            for vol_path, vol_blocks, usage in plans[op]:
+                if vol_path == path:
+                    index.record(op, path.name, [t for t, _ in vol_blocks], usage, append=not rebuild)
+        remaining[op] -= 1
+        if remaining[op] == 0:
+            operator_done(op)
+
+    def operator_done(op):
+        outcomes = results[op]
+        if op in errors:
+            outcome = 'failed'
+        elif 'cancelled' in outcomes:
+            outcome = 'cancelled'
+        else:
+            outcome = next((o for o in ('built', 'skipped', 'removed') if o in outcomes), 'empty')
+        if rebuild and outcome in ('built', 'skipped'):
+            for stale in remove_stale_volumes(out_dir, title, op, output_format, keep=len(plans[op])):
+                if manifest is not None:
+                    manifest.forget(stale)
+        if on_operator_done is not None:
+            on_operator_done(op, errors.get(op), outcome)
+
+    todo = []
+    for op in OPERATORS:
+        results[op] = []
+        if manifest is not None:
+            existing = [volume_path(out_dir, title, op, n, output_format)
+                        for n in existing_volumes(out_dir, title, op, output_format)]
+            tracked = [p for p in existing if manifest.tracks(p)]
+            if output_format == 'docx' and len(tracked) < len(existing):
+                # Ricrearli da zero cancellerebbe blocchi che il manifest non conosce.
+                names = ', '.join(p.name for p in existing if p not in tracked)
+                errors[op] = FileExistsError(
+                    f'documenti non creati dalla rigenerazione incrementale o modificati in seguito ({names}): '
+                    'generare senza rigenerazione incrementale o eliminarli')
+                plans[op] = []
+                operator_done(op)
+                continue
+            if tracked and not by_op[op]:
+                plans[op] = []
+                try:
+                    _remove_documents(tracked, manifest)
+                except OSError as e:
+                    errors[op] = e
+                else:
+                    results[op].append('removed')
+                    if use_index:
+                        index.reset(op)
+                operator_done(op)
+                continue
+        plans[op] = _plan_operator(out_dir, title, op, by_op[op], limits, output_format,
+                                   index if use_index else None, append=not rebuild)
+        if use_index and rebuild and by_op[op]:
+            index.reset(op)
+        remaining[op] = len(plans[op])
+        for path, vol_blocks, _ in plans[op]:
+            if manifest is not None:
+                inputs[path] = fingerprint(vol_blocks, options, __version__)
+                if vol_blocks and manifest.is_current(path, inputs[path]):
+                    volume_done(op, path, 'skipped')
+                    continue
+            todo.append((op, path, vol_blocks))
+
+    total = sum(len(rel) for _, _, vol_blocks in todo for _, rel in vol_blocks)
+    progress = [0]
+    progress_lock = threading.Lock()
+
+    def image_done():
+        with progress_lock:
+            progress[0] += 1
+            count = progress[0]
+        on_progress(count, total)
+
+    jobs = {}
+    doc_reports = {}
+    # Un thread per operatore: i documenti non condividono stato, quindi
+    # costruzione e salvataggio possono sovrapporsi.
+    with ThreadPoolExecutor(max_workers=len(OPERATORS) if parallel_ops else 1) as op_pool:
+        for op, path, vol_blocks in todo:
+            if report is not None:
+                doc_reports[path] = report.document(op, path)
+            on_image = image_done if on_progress is not None else None
+            if output_format == 'pdf':
+                job = op_pool.submit(build_operator_pdf, path, vol_blocks, options, image_pool, cache,
+                                     doc_reports.get(path), on_image=on_image, cancel=cancel,
+                                     read_ahead=read_ahead)
+            else:
+                job = op_pool.submit(build_operator_document, path, vol_blocks, options, image_pool, cache,
+                                     fast_append, doc_reports.get(path), rebuild=manifest is not None,
+                                     on_image=on_image, cancel=cancel, streaming=streaming,
+                                     read_ahead=read_ahead)
+            jobs[job] = (op, path)
+
+        for future in as_completed(jobs):
+            op, path = jobs[future]
+            written = False
+            try:
+                written = future.result()
+            except GenerationCancelled:
+                volume_done(op, path, 'cancelled')
+                continue
+            except Exception as e:
+                errors[op] = e
+                if path in doc_reports:
+                    doc_reports[path].failed(e)
+            if manifest is not None:
+                if written:
+                    manifest.record(path, inputs[path])
+                else:
+                    manifest.forget(path)
+            volume_done(op, path, 'failed' if op in errors else 'built' if written else 'empty')
+    if use_index:
+        try:
+            index.save()
+        except OSError as e:
+            print(f"Impossibile salvare {index.path.name}: {e}")
+    if manifest is not None:
+        try:
+            manifest.save()
+        except OSError as e:
+            print(f"Impossibile salvare {manifest.path.name}: {e}")
+    if cancel is not None and cancel.is_set():
+        raise GenerationCancelled()
+    return errors
@@ -0,0 +1,85 @@
+# ReportGenerator - Impostazioni e tipi condivisi
+# Creato da Alessandro Frullo
+#
+# Costanti, opzioni ed eccezioni di `report_engine` che servono anche
+# all'interfaccia, in un modulo che importa solo la libreria standard: la GUI
+# può costruire la finestra senza caricare python-docx e Pillow, che vengono
+# importati in background o alla prima generazione. `report_engine` li
+# riesporta, quindi chi usa già il motore non deve cambiare import.
+
+import os
+from typing import NamedTuple, Optional
+
+__author__ = "Alessandro Frullo"
+
+# Estensioni delle immagini accettate (selezione file e cartelle)
+IMAGE_EXTENSIONS = ('.jpg', '.png', '.jpeg', '.bmp', '.gif', '.webp')
+CROP_MODES = ('none', 'sides', 'topbottom', 'both')
+# Risoluzioni proposte per le immagini inserite (None = risoluzione originale)
+TARGET_DPIS = (None, 150, 200, 300)
+# Codifica delle immagini elaborate:
+#   'png'     PNG RGB, livello di compressione configurabile (predefinito);
+#             con una risoluzione target le sorgenti JPEG/WebP ridotte
+#             restano JPEG, come con 'auto'
+#   'palette' PNG con palette adattiva a 256 colori: ideale per mappe a tinte
+#             piatte, file molto più piccoli
+#   'jpeg'    JPEG con qualità configurabile: per catture fotografiche
+#   'auto'    mantiene il modo colore sorgente (L/RGB); JPEG per sorgenti
+#             JPEG/WebP, PNG per tutte le altre
+ENCODINGS = ('png', 'palette', 'jpeg', 'auto')
+# Formato dei documenti generati: Word (aggiornabile) o PDF (sempre ricreato)
+OUTPUT_FORMATS = ('docx', 'pdf')
+
+# Color palette
+MAIN_BG = '#f2f2f2'         # Light grey background
+ACCENT_ORANGE = '#FFA500'   # Orange accent
+ACCENT_BLUE = '#003366'     # Dark blue accent
+
+# Esito di ogni operatore in `generate_reports`, con il testo mostrato
+OPERATOR_OUTCOMES = {
+    'built': 'completato',
+    'skipped': 'invariato, saltato',   # generazione incrementale
+    'empty': 'nessuna immagine',
+    'removed': 'nessuna immagine, documento eliminato',  # generazione incrementale
+    'failed': 'errore',
+    'cancelled': 'annullato',
+}
+
+# Processi per l'elaborazione parallela delle immagini
+DEFAULT_WORKERS = os.cpu_count() or 1
+
+
+class GenerationCancelled(Exception):
+    """Generazione interrotta su richiesta (vedi il parametro `cancel`)."""
+
+
+class ImageOptions(NamedTuple):
+    """Parametri di elaborazione delle immagini di una generazione."""
+    crop_mode: str = 'none'
+    add_label: bool = False
+    # Risoluzione di stampa: le immagini più grandi dello spazio che occupano
+    # sulla pagina vengono ridimensionate a questi DPI (None = originale).
+    target_dpi: Optional[int] = None
+    encoding: str = 'png'
+    # 0 (nessuna compressione, veloce) - 9 (massima, lenta); 6 è il default zlib.
+    png_compress_level: int = 6
+    jpeg_quality: int = 85
+    # Tolleranza sul bianco per il ritaglio (0 = solo bianco puro, max 255).
+    crop_tolerance: int = 0
+    # Ritaglio non distruttivo: l'originale viene inserito senza ricodifica e
+    # il ritaglio è applicato da Word (a:srcRect) invece che sui pixel.
+    crop_native: bool = False
+    # Etichetta come paragrafo Word sopra l'immagine invece che disegnata sui
+    # pixel: l'immagine può restare l'originale e il testo è ricercabile.
+    label_native: bool = False
+
+
+class VolumeLimits(NamedTuple):
+    """Limiti oltre i quali un documento prosegue in un nuovo volume (None = nessun limite).
+
+    Vedi `volume_split`: i byte sono quelli dei file immagine sorgente e le
+    pagine sono stimate, una per immagine e una per titolo di blocco.
+    """
+    max_bytes: Optional[int] = None
+    max_images: Optional[int] = None
+    max_pages: Optional[int] = None
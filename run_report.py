@@ -0,0 +1,168 @@
+# ReportGenerator - Report di esecuzione
+# Creato da Alessandro Frullo
+#
+# Raccoglie, per ogni immagine, la durata delle fasi (apertura, ritaglio,
+# etichetta, ridimensionamento, codifica, inserimento), byte in ingresso e in
+# uscita, dimensioni in pixel, esito della cache ed eventuali errori, più il
+# tempo di salvataggio di ogni documento. Il report si salva in JSON o CSV e
+# ha un riepilogo testuale con i file più lenti.
+
+import csv
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+__author__ = "Alessandro Frullo"
+
+# Fasi misurate per ogni immagine (in secondi), nell'ordine di esecuzione
+IMAGE_STAGES = ('open', 'crop', 'label', 'resize', 'encode', 'insert')
+IMAGE_FIELDS = (
+    'operator', 'document', 'block', 'file', 'input_bytes', 'output_bytes',
+    'source_width', 'source_height', 'width', 'height', 'cache',
+) + tuple(f'{s}_s' for s in IMAGE_STAGES) + ('total_s', 'error')
+
+
+class RunReport:
+    """Report di una o più generazioni; sicuro per l'uso da più thread.
+
+    Si passa a `report_engine.generate_reports`, che registra un
+    `DocumentReport` per ogni documento generato.
+    """
+
+    def __init__(self):
+        self.images = []     # un dict per immagine, chiavi IMAGE_FIELDS
+        self.documents = []  # un dict per documento salvato o fallito
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+        self._elapsed = None
+
+    def document(self, operator, path):
+        """Restituisce il `DocumentReport` per il documento `path`."""
+        return DocumentReport(self, operator, Path(path).name)
+
+    def _add(self, table, record):
+        with self._lock:
+            table.append(record)
+
+    def finish(self):
+        """Fissa la durata complessiva (altrimenti misurata fino a ora)."""
+        self._elapsed = time.perf_counter() - self._start
+
+    @property
+    def elapsed(self):
+        return self._elapsed if self._elapsed is not None else time.perf_counter() - self._start
+
+    def slowest(self, n=10):
+        """Le `n` immagini con la durata totale più alta."""
+        with self._lock:
+            return sorted(self.images, key=lambda r: r['total_s'], reverse=True)[:n]
+
+    def totals(self):
+        """Totali della generazione: immagini, errori, cache, byte e secondi per fase."""
+        with self._lock:
+            images, documents = list(self.images), list(self.documents)
+        stages = {s: round(sum(r[f'{s}_s'] or 0 for r in images), 4) for s in IMAGE_STAGES}
+        stages['save'] = round(sum(d['save_s'] or 0 for d in documents), 4)
+        return {
+            'images': len(images),
+            'errors': sum(1 for r in images if r['error']),
+            'cache_hits': sum(1 for r in images if r['cache'] == 'hit'),
+            'cache_misses': sum(1 for r in images if r['cache'] == 'miss'),
+            'input_bytes': sum(r['input_bytes'] or 0 for r in images),
+            'output_bytes': sum(d['output_bytes'] or 0 for d in documents),
+            'elapsed_s': round(self.elapsed, 4),
+            'stage_seconds': stages,
+        }
+
+    def summary(self, n=5):
+        """Riepilogo testuale: totali e le `n` immagini più lente."""
+        t = self.totals()
+        rate = t['images'] / t['elapsed_s'] if t['elapsed_s'] else 0
+        lines = [f"{t['images']} immagini in {t['elapsed_s']:.1f} s ({rate:.1f} img/s), "
+                 f"{t['errors']} errori"]
+        if t['cache_hits'] or t['cache_misses']:
+            lines.append(f"Cache: {t['cache_hits']} lette, {t['cache_misses']} elaborate")
+        slowest = [r for r in self.slowest(n) if r['total_s']]
+        if slowest:
+            lines.append('Immagini più lente:')
+            for r in slowest:
+                size = f", {r['source_width']}x{r['source_height']}" if r['source_width'] else ''
+                mb = (r['input_bytes'] or 0) / 1024 ** 2
+                lines.append(f"  {r['total_s']:.2f} s  {r['file']} ({mb:.1f} MB{size})")
+        return '\n'.join(lines)
+
+    def to_dict(self, n=10):
+        with self._lock:
+            images, documents = list(self.images), list(self.documents)
+        return {'totals': self.totals(), 'slowest': [r['file'] for r in self.slowest(n)],
+                'documents': documents, 'images': images}
+
+    def write(self, path):
+        """Salva il report in CSV (una riga per immagine) o JSON, secondo l'estensione."""
+        path = Path(path)
+        if path.suffix.lower() == '.csv':
+            with self._lock:
+                images = list(self.images)
+            with open(path, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.DictWriter(f, fieldnames=IMAGE_FIELDS)
+                writer.writeheader()
+                writer.writerows(images)
+        else:
+            path.write_text(json.dumps(self.to_dict(), indent=2), encoding='utf-8')
+
+
+class DocumentReport:
+    """Registrazioni di un singolo documento (un operatore di una generazione)."""
+
+    def __init__(self, report, operator, document):
+        self._report = report
+        self.operator = operator
+        self.document = document
+        self._count = 0
+
+    def image(self, block, path, item=None, error=None, insert_s=None):
+        """Registra un'immagine; `item` è il `ProcessedImage` (None se fallita)."""
+        try:
+            input_bytes = os.path.getsize(path)
+        except OSError:
+            input_bytes = None
+        stats = (item.stats if item is not None else None) or {}
+        output_bytes = None
+        if item is not None:
+            source = item.source
+            output_bytes = source.getbuffer().nbytes if hasattr(source, 'getbuffer') else input_bytes
+        source_w, source_h = stats.get('source_size') or (None, None)
+        width, height = item.size if item is not None else (None, None)
+        record = {
+            'operator': self.operator, 'document': self.document, 'block': block,
+            'file': str(path), 'input_bytes': input_bytes, 'output_bytes': output_bytes,
+            'source_width': source_w, 'source_height': source_h, 'width': width, 'height': height,
+            'cache': stats.get('cache', ''),
+        }
+        for stage in IMAGE_STAGES:
+            value = insert_s if stage == 'insert' else stats.get(stage)
+            record[f'{stage}_s'] = round(value, 6) if value is not None else None
+        record['total_s'] = round(sum(record[f'{s}_s'] or 0 for s in IMAGE_STAGES), 6)
+        record['error'] = str(error) if error is not None else ''
+        self._count += 1
+        self._report._add(self._report.images, record)
+
+    def saved(self, path, save_s):
+        """Registra il salvataggio del documento."""
+        try:
+            output_bytes = os.path.getsize(path)
+        except OSError:
+            output_bytes = None
+        self._report._add(self._report.documents, {
+            'operator': self.operator, 'document': self.document, 'images': self._count,
+            'save_s': round(save_s, 6), 'output_bytes': output_bytes, 'error': '',
+        })
+
+    def failed(self, error):
+        """Registra un documento non generato."""
+        self._report._add(self._report.documents, {
+            'operator': self.operator, 'document': self.document, 'images': self._count,
+            'save_s': None, 'output_bytes': None, 'error': str(error),
+        })
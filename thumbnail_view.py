@@ -0,0 +1,198 @@
+# ReportGenerator - Finestra con il contenuto dei blocchi
+# Creato da Alessandro Frullo
+#
+# Mostra le miniature di tutte le immagini dei blocchi, nell'ordine in cui
+# finiranno nei documenti (`sort_images_by_order`) e con l'operatore a cui
+# sono assegnate. La vista è virtualizzata: il Canvas contiene solo le righe
+# visibili, ridisegnate a ogni scorrimento, e vengono richieste solo le
+# miniature visibili (vedi `thumbnails.ThumbnailLoader`); le PhotoImage
+# create restano in memoria in numero limitato. Migliaia di immagini non
+# rallentano quindi l'interfaccia.
+
+import base64
+import bisect
+import os
+import queue
+import tkinter as tk
+from collections import OrderedDict
+from tkinter import ttk
+
+from image_names import parse_image_name, sort_images_by_order
+from report_settings import ACCENT_BLUE, ACCENT_ORANGE, MAIN_BG
+from thumbnails import THUMBNAIL_SIZE, ThumbnailLoader
+
+__author__ = "Alessandro Frullo"
+
+# Dimensioni (pixel) di una cella, dell'intestazione di blocco e dei margini
+CELL_WIDTH = THUMBNAIL_SIZE + 24
+CELL_HEIGHT = THUMBNAIL_SIZE + 46
+HEADER_HEIGHT = 32
+PADDING = 8
+# Miniature tenute in memoria come PhotoImage
+MAX_PHOTOS = 600
+# Caratteri del nome file mostrati sotto la miniatura
+_NAME_CHARS = 24
+# Intervallo (ms) con cui il thread Tk raccoglie le miniature pronte
+_POLL_MS = 50
+
+
+class ThumbnailBrowser(tk.Toplevel):
+    """Finestra con le miniature dei blocchi {titolo: immagini}.
+
+    `loader_factory(on_ready)` crea il `ThumbnailLoader` (predefinito: con la
+    cache delle miniature nella cartella standard).
+    """
+
+    def __init__(self, master, blocks, loader_factory=None):
+        super().__init__(master)
+        self.title('Contenuto Blocchi')
+        self.geometry('900x700')
+        self.configure(bg=MAIN_BG)
+
+        self.canvas = tk.Canvas(self, bg='white', highlightthickness=0, yscrollincrement=CELL_HEIGHT // 4)
+        scrollbar = ttk.Scrollbar(self, orient='vertical', command=self._yview)
+        self.canvas.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side='right', fill='y')
+        self.canvas.pack(side='left', fill='both', expand=True)
+        self.canvas.bind('<Configure>', lambda e: self._layout())
+        # Legati alla finestra valgono anche per il Canvas (la finestra è nei suoi bindtags).
+        self.bind('<MouseWheel>', self._on_wheel)
+        self.bind('<Button-4>', lambda e: self._yview('scroll', -1, 'units'))
+        self.bind('<Button-5>', lambda e: self._yview('scroll', 1, 'units'))
+
+        factory = loader_factory or ThumbnailLoader.with_default_cache
+        self._loader = factory(self._on_thumbnail)
+        self._photos = OrderedDict()  # {percorso: PhotoImage o None se non leggibile}
+        self._blocks = {}
+        self._rows = []               # [('header', titolo) o ('images', titolo, [(posizione, percorso)])]
+        self._offsets = []            # y di inizio di ogni riga
+        self._columns = 1
+        self._ready = queue.Queue()   # (percorso, dati PNG) dai thread del loader
+        self._closed = False
+        self.protocol('WM_DELETE_WINDOW', self.close)
+        self.set_blocks(blocks)
+        self._poll_id = self.after(_POLL_MS, self._poll)
+
+    def set_blocks(self, blocks):
+        """Mostra i blocchi indicati al posto dei precedenti."""
+        self._blocks = {title: sort_images_by_order(images) for title, images in blocks.items()}
+        self._layout()
+
+    def show_block(self, title):
+        """Scorre la vista fino al blocco `title`."""
+        for row, offset in zip(self._rows, self._offsets):
+            if row[0] == 'header' and row[1] == title:
+                total = self._offsets[-1] if self._offsets else 1
+                self._yview('moveto', offset / total)
+                return
+
+    def close(self):
+        self._closed = True
+        self.after_cancel(self._poll_id)
+        self._loader.close()
+        self.destroy()
+
+    # -- disposizione e disegno ----------------------------------------------
+
+    def _layout(self):
+        width = max(self.canvas.winfo_width(), CELL_WIDTH + 2 * PADDING)
+        self._columns = max(1, (width - 2 * PADDING) // CELL_WIDTH)
+        self._rows, self._offsets = [], []
+        y = PADDING
+        for title, images in self._blocks.items():
+            self._rows.append(('header', title))
+            self._offsets.append(y)
+            y += HEADER_HEIGHT
+            cells = list(enumerate(images, 1))
+            for i in range(0, len(cells), self._columns):
+                self._rows.append(('images', title, cells[i:i + self._columns]))
+                self._offsets.append(y)
+                y += CELL_HEIGHT
+        self._offsets.append(y + PADDING)  # altezza totale
+        self.canvas.configure(scrollregion=(0, 0, width, self._offsets[-1]))
+        self._redraw()
+
+    def _yview(self, *args):
+        self.canvas.yview(*args)
+        self._redraw()
+
+    def _on_wheel(self, event):
+        self._yview('scroll', -1 if event.delta > 0 else 1, 'units')
+
+    def _visible_rows(self):
+        top = self.canvas.canvasy(0)
+        bottom = top + self.canvas.winfo_height()
+        first = max(0, bisect.bisect_right(self._offsets, top) - 1)
+        last = bisect.bisect_left(self._offsets, bottom)
+        return range(first, min(last, len(self._rows)))
+
+    def _redraw(self):
+        if self._closed:
+            return
+        self.canvas.delete('cell')
+        visible = []
+        for index in self._visible_rows():
+            row, y = self._rows[index], self._offsets[index]
+            if row[0] == 'header':
+                count = len(self._blocks[row[1]])
+                self.canvas.create_text(PADDING, y + HEADER_HEIGHT / 2, anchor='w', tags='cell',
+                                        text=f'{row[1]}  ({count} immagini)', fill=ACCENT_BLUE,
+                                        font=('Arial', 12, 'bold'))
+                continue
+            for column, (position, path) in enumerate(row[2]):
+                self._draw_cell(PADDING + column * CELL_WIDTH, y, position, path)
+                visible.append(path)
+        self._loader.request([p for p in visible if p not in self._photos])
+
+    def _draw_cell(self, x, y, position, path):
+        center = x + CELL_WIDTH / 2
+        photo = self._photos.get(path)
+        if path in self._photos:
+            self._photos.move_to_end(path)
+        if photo is not None:
+            self.canvas.create_image(center, y + 4 + THUMBNAIL_SIZE / 2, image=photo, tags='cell')
+        else:
+            self.canvas.create_rectangle(center - THUMBNAIL_SIZE / 2, y + 4, center + THUMBNAIL_SIZE / 2,
+                                         y + 4 + THUMBNAIL_SIZE, outline='#cccccc', fill='#f4f4f4', tags='cell')
+            text = 'non leggibile' if path in self._photos else '...'
+            self.canvas.create_text(center, y + 4 + THUMBNAIL_SIZE / 2, text=text, fill='#888888', tags='cell')
+        operators = parse_image_name(path).operators
+        tag = ', '.join(operators) if operators else 'nessun operatore'
+        self.canvas.create_text(center, y + THUMBNAIL_SIZE + 14, tags='cell', font=('Arial', 9, 'bold'),
+                                text=f'{position}. {tag}', fill=ACCENT_BLUE if operators else ACCENT_ORANGE)
+        name = os.path.basename(path)
+        if len(name) > _NAME_CHARS:
+            name = name[:_NAME_CHARS - 1] + '…'
+        self.canvas.create_text(center, y + THUMBNAIL_SIZE + 30, text=name, tags='cell', font=('Arial', 8),
+                                fill='#555555')
+
+    # -- miniature ------------------------------------------------------------
+
+    def _on_thumbnail(self, path, data):
+        # Chiamata dai thread del loader, che non possono usare Tk: la
+        # miniatura viene raccolta da `_poll` nel thread Tk.
+        self._ready.put((path, data))
+
+    def _poll(self):
+        added = False
+        while True:
+            try:
+                path, data = self._ready.get_nowait()
+            except queue.Empty:
+                break
+            self._add_photo(path, data)
+            added = True
+        if added:
+            self._redraw()
+        self._poll_id = self.after(_POLL_MS, self._poll)
+
+    def _add_photo(self, path, data):
+        photo = None
+        if data is not None:
+            try:
+                photo = tk.PhotoImage(master=self, data=base64.b64encode(data).decode('ascii'))
+            except tk.TclError:
+                photo = None
+        self._photos[path] = photo
+        while len(self._photos) > MAX_PHOTOS:
+            self._photos.popitem(last=False)
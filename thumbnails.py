@@ -0,0 +1,112 @@
+# ReportGenerator - Miniature delle immagini
+# Creato da Alessandro Frullo
+#
+# Le miniature vengono create su un pool di thread (Pillow rilascia il GIL
+# durante decodifica e ridimensionamento) con decodifica ridotta: `draft`
+# per i JPEG, `reduce` per gli altri formati. Vengono salvate come PNG, il
+# formato che Tk mostra senza Pillow, in una `ImageCache` separata da quella
+# delle immagini elaborate, con chiave percorso, dimensione e data di
+# modifica del file. Il modulo non importa Pillow finché non serve una
+# miniatura, così l'avvio della GUI resta rapido.
+
+import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from image_cache import ImageCache, default_cache_dir
+
+__author__ = "Alessandro Frullo"
+
+# Lato massimo delle miniature, in pixel
+THUMBNAIL_SIZE = 160
+THUMBNAIL_WORKERS = 4
+THUMBNAIL_CACHE_SIZE = 256 * 1024 ** 2  # 256 MB
+
+
+def default_thumbnail_dir():
+    """Cartella predefinita della cache delle miniature, accanto alla cache delle immagini."""
+    cache_dir = default_cache_dir()
+    return cache_dir.with_name(cache_dir.name + '_thumbnails')
+
+
+def make_thumbnail(path, size=THUMBNAIL_SIZE):
+    """Miniatura di `path` entro size x size pixel: (byte PNG, (larghezza, altezza))."""
+    from PIL import Image
+
+    with Image.open(path) as img:
+        # JPEG: decodifica direttamente a risoluzione ridotta.
+        img.draft('RGB', (size, size))
+        if img.mode not in ('L', 'RGB'):
+            img = img.convert('RGB')
+        # reducing_gap: riduzione a blocchi (reduce) prima del filtro finale.
+        img.thumbnail((size, size), Image.BILINEAR, reducing_gap=2.0)
+    buf = io.BytesIO()
+    img.save(buf, format='PNG', compress_level=1)
+    return buf.getvalue(), img.size
+
+
+class ThumbnailLoader:
+    """Crea o legge dalla cache le miniature richieste, in background.
+
+    request(paths) indica le immagini visibili in questo momento: quelle
+    richieste in precedenza e non più visibili, se non ancora iniziate,
+    vengono saltate. on_ready(path, dati PNG o None) viene chiamata dal
+    thread che ha prodotto la miniatura (None se l'immagine non è
+    leggibile): un'interfaccia Tk deve riportarla sul thread principale.
+    """
+
+    def __init__(self, on_ready, cache=None, size=THUMBNAIL_SIZE, workers=THUMBNAIL_WORKERS):
+        self.size = size
+        self._on_ready = on_ready
+        self._cache = cache
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='thumbnail')
+        self._lock = threading.Lock()
+        self._wanted = set()
+        self._pending = set()
+        self._closed = False
+
+    @classmethod
+    def with_default_cache(cls, on_ready, **kwargs):
+        """Loader con la cache delle miniature nella cartella predefinita."""
+        return cls(on_ready, ImageCache(default_thumbnail_dir(), max_bytes=THUMBNAIL_CACHE_SIZE), **kwargs)
+
+    def request(self, paths):
+        """Richiede le miniature di `paths` (le immagini visibili) al posto delle precedenti."""
+        with self._lock:
+            if self._closed:
+                return
+            self._wanted = set(paths)
+            new = [p for p in paths if p not in self._pending]
+            self._pending.update(new)
+        for path in new:
+            self._pool.submit(self._load, path)
+
+    def _load(self, path):
+        with self._lock:
+            if self._closed or path not in self._wanted:
+                self._pending.discard(path)
+                return
+        data = None
+        key = self._cache.key(path, self.size) if self._cache is not None else None
+        hit = self._cache.get(key) if key is not None else None
+        if hit is not None:
+            data = hit[0]
+        else:
+            try:
+                data, size = make_thumbnail(path, self.size)
+            except Exception:
+                data = None
+            else:
+                if key is not None:
+                    self._cache.put(key, data, size)
+        with self._lock:
+            self._pending.discard(path)
+            if self._closed:
+                return
+        self._on_ready(path, data)
+
+    def close(self):
+        """Ferma il loader: le miniature in attesa non vengono più create."""
+        with self._lock:
+            self._closed = True
+        self._pool.shutdown(wait=False)
@@ -0,0 +1,199 @@
+# ReportGenerator - Suddivisione dei documenti in volumi
+# Creato da Alessandro Frullo
+#
+# Un documento che supererebbe i limiti indicati (byte delle immagini, numero
+# di immagini o pagine stimate) prosegue in `<titolo>_<operatore>_vol2.docx`,
+# `_vol3` e così via: ogni file resta veloce da aprire, salvare e aggiornare.
+# La suddivisione viene pianificata prima della generazione, dalle dimensioni
+# dei file sorgente: i blocchi restano interi quando entrano in un volume e
+# solo un blocco più grande di un intero volume viene diviso (le parti
+# successive hanno il titolo seguito da "(segue)"). In `<titolo>_volumes.json`
+# viene scritto l'indice dei blocchi contenuti in ogni volume, usato anche per
+# sapere quanto è pieno l'ultimo volume quando vi si aggiungono blocchi.
+
+import glob
+import os
+import re
+import threading
+import zipfile
+from pathlib import Path
+from typing import NamedTuple
+
+from build_manifest import load_json, save_json_atomic
+from image_names import sort_images_by_order
+
+__author__ = "Alessandro Frullo"
+
+# Da incrementare quando cambia la struttura dell'indice.
+INDEX_FORMAT = 1
+# Suffisso del titolo per le parti successive di un blocco diviso
+CONTINUED = 'segue'
+
+
+class VolumeUsage(NamedTuple):
+    """Contenuto (stimato) di un volume."""
+    bytes: int = 0
+    images: int = 0
+    pages: int = 0
+
+
+def _add(a, b):
+    return VolumeUsage(a.bytes + b.bytes, a.images + b.images, a.pages + b.pages)
+
+
+def _size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def image_usage(path):
+    """Contributo di un'immagine: dimensione del file sorgente, una pagina."""
+    return VolumeUsage(_size(path), 1, 1)
+
+
+def fits(usage, limits):
+    """True se `usage` rispetta tutti i limiti di `limits` (`VolumeLimits`)."""
+    return ((not limits.max_bytes or usage.bytes <= limits.max_bytes)
+            and (not limits.max_images or usage.images <= limits.max_images)
+            and (not limits.max_pages or usage.pages <= limits.max_pages))
+
+
+def volume_path(out_dir, title, op, number, suffix):
+    """Percorso del volume `number` (il primo non ha suffisso di volume)."""
+    name = f'{title}_{op}' if number == 1 else f'{title}_{op}_vol{number}'
+    return Path(out_dir) / f'{name}.{suffix}'
+
+
+def existing_volumes(out_dir, title, op, suffix):
+    """Numeri dei volumi presenti su disco (consecutivi a partire da 1)."""
+    numbers = []
+    while volume_path(out_dir, title, op, len(numbers) + 1, suffix).exists():
+        numbers.append(len(numbers) + 1)
+    return numbers
+
+
+def remove_stale_volumes(out_dir, title, op, suffix, keep):
+    """Elimina i volumi oltre il numero `keep`; restituisce i percorsi eliminati."""
+    pattern = re.compile(rf'{re.escape(title)}_{re.escape(op)}_vol(\d+)\.{re.escape(suffix)}$')
+    removed = []
+    # Il titolo può contenere caratteri speciali per glob (es. "C[1]").
+    for path in Path(out_dir).glob(f"{glob.escape(f'{title}_{op}')}_vol*.{suffix}"):
+        match = pattern.match(path.name)
+        if match and int(match.group(1)) > keep:
+            try:
+                path.unlink()
+            except OSError as e:
+                print(f"Impossibile eliminare {path.name}: {e}")
+                continue
+            removed.append(path)
+    return removed
+
+
+def estimate_usage(path):
+    """Contenuto di un documento esistente non presente nell'indice.
+
+    Byte: dimensione del file; immagini e pagine: file in word/media
+    (solo .docx, altrimenti 0).
+    """
+    images = 0
+    if str(path).endswith('.docx'):
+        try:
+            with zipfile.ZipFile(path) as zf:
+                images = sum(1 for name in zf.namelist() if name.startswith('word/media/'))
+        except (OSError, zipfile.BadZipFile):
+            pass
+    return VolumeUsage(_size(path), images, images)
+
+
+def plan_volumes(blocks, limits, used=VolumeUsage()):
+    """Divide i blocchi in volumi secondo `limits`.
+
+    blocks: lista di (titolo, immagini); used: contenuto già presente nel
+    primo volume (aggiunta a un documento esistente). Restituisce una lista
+    di (blocchi, `VolumeUsage` complessivo) per volume, a partire da quello
+    già esistente, che può restare senza blocchi nuovi se è già pieno.
+    """
+    volumes = [([], used)]
+    for title, images in blocks:
+        images = sort_images_by_order(images)
+        usages = [image_usage(p) for p in images]
+        cost = VolumeUsage(sum(u.bytes for u in usages), len(images), len(images) + 1)  # + titolo
+        current, usage = volumes[-1]
+        if fits(_add(usage, cost), limits):
+            volumes[-1] = (current + [(title, images)], _add(usage, cost))
+            continue
+        if current or usage != VolumeUsage():
+            volumes.append(([], VolumeUsage()))
+        if fits(cost, limits):
+            volumes[-1] = ([(title, images)], cost)
+            continue
+        # Blocco più grande di un volume: si divide in parti che lo riempiono.
+        part, part_usage, part_title = [], VolumeUsage(0, 0, 1), title
+        for path, image in zip(images, usages):
+            if part and not fits(_add(part_usage, image), limits):
+                volumes[-1] = ([(part_title, part)], part_usage)
+                volumes.append(([], VolumeUsage()))
+                part, part_usage, part_title = [], VolumeUsage(0, 0, 1), f'{title} ({CONTINUED})'
+            part.append(path)
+            part_usage = _add(part_usage, image)
+        volumes[-1] = ([(part_title, part)], part_usage)
+    return volumes
+
+
+class VolumeIndex:
+    """Indice dei volumi di una generazione, salvato in `<titolo>_volumes.json`.
+
+    Per ogni operatore elenca i volumi con file, blocchi contenuti e
+    contenuto stimato. I metodi possono essere chiamati da più thread; il
+    file viene scritto solo da `save`.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._operators = load_json(self.path, INDEX_FORMAT).get('operators') or {}
+
+    @classmethod
+    def for_output(cls, out_dir, title):
+        """Indice dei volumi `<title>_*` nella cartella out_dir."""
+        return cls(Path(out_dir) / f'{title}_volumes.json')
+
+    def usage(self, op, file_name):
+        """`VolumeUsage` registrato per il file, o None se non è nell'indice."""
+        with self._lock:
+            for entry in self._operators.get(op, []):
+                if entry['file'] == file_name:
+                    return VolumeUsage(entry['bytes'], entry['images'], entry['pages'])
+        return None
+
+    def reset(self, op):
+        """Dimentica i volumi dell'operatore (documenti ricreati da zero)."""
+        with self._lock:
+            self._operators[op] = []
+
+    def record(self, op, file_name, block_titles, usage, append=False):
+        """Registra un volume; con append i blocchi si aggiungono a quelli già presenti."""
+        with self._lock:
+            entries = self._operators.setdefault(op, [])
+            entry = next((e for e in entries if e['file'] == file_name), None)
+            if entry is None:
+                entry = {'file': file_name, 'blocks': []}
+                entries.append(entry)
+            if not append:
+                entry['blocks'] = []
+            entry['blocks'] = entry['blocks'] + list(block_titles)
+            entry.update(bytes=usage.bytes, images=usage.images, pages=usage.pages)
+            entries.sort(key=lambda e: _volume_number(e['file']))
+
+    def save(self):
+        """Scrive l'indice (prima in un file temporaneo, poi lo sostituisce)."""
+        # Le voci vengono modificate sul posto: si scrive tenendo il lock.
+        with self._lock:
+            save_json_atomic(self.path, INDEX_FORMAT, {'operators': self._operators})
+
+
+def _volume_number(file_name):
+    match = re.search(r'_vol(\d+)\.\w+$', file_name)
+    return int(match.group(1)) if match else 1
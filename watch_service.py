@@ -0,0 +1,415 @@
+# ReportGenerator - Servizio di sorveglianza delle cartelle di campagna
+# Creato da Alessandro Frullo
+#
+# Esempio:
+#   python watch_service.py campagna_roma.json --workers 8
+#
+# Il manifest è quello della modalità batch (vedi report_batch.py) con
+# "campaign_root" al posto di "blocks":
+#   {"title": "Campagna Roma", "output_dir": "report/roma", "campaign_root": "//nas/roma", ...}
+# Ogni cartella 4G/5G di una sottocartella della campagna diventa un blocco
+# "<sottocartella> <cartella 4G/5G>" con le immagini che contiene; gli
+# operatori vengono ricavati dai nomi dei file come sempre.
+#
+# Il servizio resta in esecuzione e sorveglia le cartelle: con inotify su
+# Linux, altrimenti (o su condivisioni di rete, dove inotify non vede i file
+# caricati da altri computer) controllandole periodicamente. Gli eventi
+# vengono raccolti finché i caricamenti non si fermano per qualche secondo,
+# poi i report interessati vengono rigenerati in modo incrementale: solo i
+# documenti degli operatori con immagini cambiate vengono ricreati, e cache
+# e processi di elaborazione restano attivi tra una generazione e l'altra.
+
+import argparse
+import ctypes
+import ctypes.util
+import multiprocessing
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from pathlib import Path
+
+from folder_scan import technology_folders
+from image_cache import DEFAULT_CACHE_SIZE, ImageCache
+from read_ahead import DEFAULT_READ_AHEAD_BYTES
+from report_batch import ManifestError, _print_operator_done, _read_manifest_file, load_settings
+from report_engine import create_image_pool, generate_reports
+from report_settings import DEFAULT_WORKERS, IMAGE_EXTENSIONS
+
+__author__ = "Alessandro Frullo"
+
+# Secondi senza nuovi eventi prima di rigenerare, e attesa massima durante
+# un caricamento continuo.
+DEFAULT_DEBOUNCE = 5.0
+DEFAULT_MAX_DELAY = 60.0
+# Intervallo del controllo periodico, in secondi
+DEFAULT_POLL_INTERVAL = 10.0
+# Livelli sorvegliati sotto la cartella di campagna: sottocartelle e cartelle 4G/5G
+WATCH_DEPTH = 2
+# File system di rete su cui inotify non vede le modifiche fatte da altri computer
+NETWORK_FILESYSTEMS = ('cifs', 'smb3', 'smbfs', 'nfs', 'nfs4', 'fuse.sshfs', '9p')
+
+# Attesa massima di una singola chiamata a `wait`: limita il ritardo di uno stop.
+_WAIT_STEP = 1.0
+
+# inotify (vedi inotify(7))
+_IN_MODIFY = 0x2
+_IN_CLOSE_WRITE = 0x8
+_IN_MOVED_FROM = 0x40
+_IN_MOVED_TO = 0x80
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_IN_DELETE_SELF = 0x400
+_IN_MOVE_SELF = 0x800
+_IN_Q_OVERFLOW = 0x4000
+_IN_IGNORED = 0x8000
+_IN_ONLYDIR = 0x01000000
+_IN_ISDIR = 0x40000000
+_WATCH_MASK = (_IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+               | _IN_DELETE_SELF | _IN_MOVE_SELF | _IN_ONLYDIR)
+_INOTIFY_EVENT = struct.Struct('iIII')  # wd, mask, cookie, len (poi il nome)
+
+
+def _subdirs(path):
+    try:
+        with os.scandir(path) as it:
+            return sorted(e.path for e in it if e.is_dir())
+    except OSError:
+        return []
+
+
+class InotifyWatcher:
+    """Sorveglianza con inotify (Linux), tramite ctypes: nessuna dipendenza esterna.
+
+    Le cartelle create dopo l'avvio vengono aggiunte alla sorveglianza.
+    """
+
+    def __init__(self, roots, depth=WATCH_DEPTH):
+        self.depth = depth
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True)
+        fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1')
+        self._fd = fd
+        self._watches = {}  # {wd: (cartella, livello)}
+        try:
+            for root in roots:
+                self._add_tree(os.path.abspath(root), 0)
+        except OSError:
+            self.close()
+            raise
+
+    def _add_tree(self, path, level):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), _WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if level == 0:
+                raise OSError(err, os.strerror(err), path)
+            print(f'Impossibile sorvegliare {path}: {os.strerror(err)}')
+            return
+        self._watches[wd] = (path, level)
+        if level < self.depth:
+            for sub in _subdirs(path):
+                self._add_tree(sub, level + 1)
+
+    def wait(self, timeout):
+        """Attende al massimo `timeout` secondi; restituisce le cartelle modificate."""
+        if not select.select([self._fd], [], [], timeout)[0]:
+            return set()
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+        changed = set()
+        offset = 0
+        while offset + _INOTIFY_EVENT.size <= len(data):
+            wd, mask, _, length = _INOTIFY_EVENT.unpack_from(data, offset)
+            name = data[offset + _INOTIFY_EVENT.size:offset + _INOTIFY_EVENT.size + length].rstrip(b'\0')
+            offset += _INOTIFY_EVENT.size + length
+            if mask & _IN_Q_OVERFLOW:
+                # Eventi persi: si considera modificato tutto.
+                changed.update(path for path, _ in self._watches.values())
+                continue
+            if wd not in self._watches:
+                continue
+            path, level = self._watches[wd]
+            if mask & _IN_IGNORED:
+                del self._watches[wd]
+            changed.add(path)
+            if mask & _IN_ISDIR and mask & (_IN_CREATE | _IN_MOVED_TO) and level < self.depth:
+                child = os.path.join(path, os.fsdecode(name))
+                self._add_tree(child, level + 1)
+                changed.add(child)
+        return changed
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class PollingWatcher:
+    """Sorveglianza con controlli periodici di nomi, dimensioni e date dei file.
+
+    Funziona su qualsiasi sistema e sulle condivisioni di rete; una modifica
+    viene vista al più `interval` secondi dopo.
+    """
+
+    def __init__(self, roots, interval=DEFAULT_POLL_INTERVAL, depth=WATCH_DEPTH):
+        self.roots = [os.path.abspath(root) for root in roots]
+        self.interval = interval
+        self.depth = depth
+        self._state = self._snapshot()
+        self._next = time.monotonic() + interval
+
+    def _snapshot(self):
+        state = {}
+        for root in self.roots:
+            self._walk(root, 0, state)
+        return state
+
+    def _walk(self, path, level, state):
+        entries = []
+        subdirs = []
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir():
+                            entries.append((entry.name, None, None))
+                            subdirs.append(entry.path)
+                        else:
+                            st = entry.stat()
+                            entries.append((entry.name, st.st_size, st.st_mtime_ns))
+                    except OSError:
+                        continue
+        except OSError:
+            return
+        state[path] = frozenset(entries)
+        if level < self.depth:
+            for sub in subdirs:
+                self._walk(sub, level + 1, state)
+
+    def wait(self, timeout):
+        """Attende al massimo `timeout` secondi; restituisce le cartelle modificate."""
+        delay = self._next - time.monotonic()
+        if delay > timeout:
+            time.sleep(timeout)
+            return set()
+        time.sleep(max(0.0, delay))
+        self._next = time.monotonic() + self.interval
+        old, self._state = self._state, self._snapshot()
+        return {path for path in old.keys() | self._state.keys() if old.get(path) != self._state.get(path)}
+
+    def close(self):
+        pass
+
+
+def _filesystem_type(path):
+    """Tipo del file system che contiene `path` (solo Linux, da /proc/self/mounts), o None."""
+    try:
+        with open('/proc/self/mounts', encoding='utf-8') as f:
+            mounts = [line.split()[1:3] for line in f]
+    except OSError:
+        return None
+    path = os.path.realpath(path)
+    best, fs_type = '', None
+    for mount_point, mount_type in mounts:
+        mount_point = mount_point.replace('\\040', ' ')
+        if (path == mount_point or path.startswith(mount_point.rstrip('/') + '/')) and len(mount_point) > len(best):
+            best, fs_type = mount_point, mount_type
+    return fs_type
+
+
+def create_watcher(roots, poll=False, interval=DEFAULT_POLL_INTERVAL):
+    """inotify quando possibile, altrimenti (o con poll) controllo periodico."""
+    if not poll and sys.platform.startswith('linux'):
+        remote = [root for root in roots if _filesystem_type(root) in NETWORK_FILESYSTEMS]
+        if remote:
+            print(f'{remote[0]} è su una condivisione di rete: controllo periodico ogni {interval:g} s')
+        else:
+            try:
+                return InotifyWatcher(roots)
+            except (OSError, AttributeError) as e:
+                print(f'inotify non disponibile ({e}): controllo periodico ogni {interval:g} s')
+    return PollingWatcher(roots, interval)
+
+
+class Campaign:
+    """Una cartella di campagna con le impostazioni del suo manifest.
+
+    settings: risultato di `report_batch.load_settings`. Le immagini di ogni
+    cartella 4G/5G vengono memorizzate e rilette solo quando la cartella
+    risulta modificata.
+    """
+
+    def __init__(self, root, settings):
+        self.root = os.path.abspath(root)
+        self.settings = settings
+        self._images = {}  # {cartella 4G/5G: [immagini]}
+
+    @property
+    def title(self):
+        return self.settings['title']
+
+    def contains(self, path):
+        root, path = os.path.normcase(self.root), os.path.normcase(path)
+        return path == root or path.startswith(root.rstrip(os.sep) + os.sep)
+
+    def blocks(self, changed=()):
+        """{titolo blocco: immagini}, rileggendo le cartelle in `changed` e quelle nuove."""
+        for path in changed:
+            self._images.pop(path, None)
+        blocks = {}
+        seen = set()
+        for sub in _subdirs(self.root):
+            for name, path in technology_folders(sub):
+                seen.add(path)
+                if path not in self._images:
+                    self._images[path] = _list_images(path)
+                if self._images[path]:
+                    blocks[f'{os.path.basename(sub)} {name}'] = self._images[path]
+        for path in set(self._images) - seen:
+            del self._images[path]
+        return blocks
+
+
+def _list_images(folder):
+    try:
+        with os.scandir(folder) as it:
+            return sorted(e.path for e in it
+                          if e.is_file() and os.path.splitext(e.name)[1].lower() in IMAGE_EXTENSIONS)
+    except OSError:
+        return []
+
+
+class WatchService:
+    """Rigenera i report delle campagne quando cambiano le loro cartelle.
+
+    image_pool e cache (vedi `report_engine.create_image_pool` e
+    `ImageCache`) vengono usati per tutte le generazioni, così restano
+    pronti tra un evento e l'altro.
+    """
+
+    def __init__(self, campaigns, watcher, image_pool=None, cache=None, debounce=DEFAULT_DEBOUNCE,
+                 max_delay=DEFAULT_MAX_DELAY, read_ahead=DEFAULT_READ_AHEAD_BYTES):
+        self.campaigns = list(campaigns)
+        self.watcher = watcher
+        self.image_pool = image_pool
+        self.cache = cache
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.read_ahead = read_ahead
+
+    def generate(self, campaign, changed=()):
+        """Rigenera (in modo incrementale) il report di una campagna. Restituisce gli errori."""
+        blocks = campaign.blocks(changed)
+        settings = campaign.settings
+        count = sum(len(images) for images in blocks.values())
+        print(f"Generazione '{campaign.title}': {len(blocks)} blocchi, {count} immagini...")
+        start = time.perf_counter()
+        try:
+            errors = generate_reports(
+                settings['title'], settings['out_dir'], blocks, settings['options'],
+                image_pool=self.image_pool, on_operator_done=_print_operator_done, cache=self.cache,
+                incremental=True, output_format=settings['output_format'],
+                volume_limits=settings['volume_limits'], read_ahead=self.read_ahead,
+            )
+        except Exception as e:
+            print(f"Errore con '{campaign.title}': {e}")
+            return {None: e}
+        print(f"'{campaign.title}' aggiornato in {time.perf_counter() - start:.1f} s")
+        return errors
+
+    def run(self, stop=None):
+        """Genera tutti i report, poi li aggiorna a ogni modifica finché `stop` non viene impostato."""
+        stop = stop or threading.Event()
+        for campaign in self.campaigns:
+            self.generate(campaign)
+        pending = {}  # {campagna: cartelle modificate}
+        first = last = None
+        while not stop.is_set():
+            timeout = _WAIT_STEP
+            if pending:
+                due = min(last + self.debounce, first + self.max_delay)
+                timeout = min(timeout, max(0.0, due - time.monotonic()))
+            changed = self.watcher.wait(timeout)
+            now = time.monotonic()
+            for path in changed:
+                for campaign in self.campaigns:
+                    if campaign.contains(path):
+                        pending.setdefault(campaign, set()).add(path)
+                        last = now
+                        if first is None:
+                            first = now
+            if pending and (now - last >= self.debounce or now - first >= self.max_delay):
+                batch, pending, first, last = pending, {}, None, None
+                for campaign, paths in batch.items():
+                    self.generate(campaign, paths)
+
+
+def load_campaigns(manifest_paths):
+    """Legge i manifest e restituisce le `Campaign` da sorvegliare."""
+    campaigns = []
+    for manifest_path in manifest_paths:
+        manifest_path = Path(manifest_path)
+        for data in _read_manifest_file(manifest_path):
+            settings = load_settings(data, manifest_path.parent)
+            root = data.get('campaign_root')
+            if not root:
+                raise ManifestError(f"{manifest_path}: campaign_root obbligatorio per '{settings['title']}'")
+            root = manifest_path.parent / Path(root).expanduser()
+            if not root.is_dir():
+                raise ManifestError(f'{manifest_path}: cartella di campagna non trovata: {root}')
+            campaigns.append(Campaign(root, settings))
+    return campaigns
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Sorveglia le cartelle di campagna e rigenera i report quando arrivano nuove immagini.')
+    parser.add_argument('manifests', nargs='+', help='file manifest (.json, .yaml, .yml) con campaign_root')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f'processi per le immagini (predefinito: {DEFAULT_WORKERS}, 1 = seriale)')
+    parser.add_argument('--debounce', type=float, default=DEFAULT_DEBOUNCE,
+                        help='secondi senza nuovi file prima di rigenerare (predefinito: %(default)s)')
+    parser.add_argument('--max-delay', type=float, default=DEFAULT_MAX_DELAY,
+                        help='attesa massima durante un caricamento continuo (predefinito: %(default)s)')
+    parser.add_argument('--poll', action='store_true', help='usa il controllo periodico invece di inotify')
+    parser.add_argument('--poll-interval', type=float, default=DEFAULT_POLL_INTERVAL,
+                        help='secondi tra due controlli periodici (predefinito: %(default)s)')
+    parser.add_argument('--no-cache', action='store_true', help='non usare la cache delle immagini elaborate')
+    parser.add_argument('--cache-dir', help='cartella della cache (predefinita: cartella cache utente)')
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE // 1024 ** 2,
+                        help='dimensione massima della cache in MB (predefinito: %(default)s)')
+    args = parser.parse_args(argv)
+
+    try:
+        campaigns = load_campaigns(args.manifests)
+    except (OSError, ValueError) as e:
+        print(f'Errore: {e}')
+        return 1
+    cache = None if args.no_cache else ImageCache(args.cache_dir, max_bytes=args.cache_size * 1024 ** 2)
+    watcher = create_watcher([c.root for c in campaigns], poll=args.poll, interval=args.poll_interval)
+    pool = create_image_pool(max(1, args.workers))
+    service = WatchService(campaigns, watcher, image_pool=pool, cache=cache, debounce=args.debounce,
+                           max_delay=args.max_delay)
+    mode = 'inotify' if isinstance(watcher, InotifyWatcher) else f'controllo ogni {args.poll_interval:g} s'
+    print(f'Sorveglianza di {len(campaigns)} campagne ({mode}), Ctrl+C per uscire')
+    try:
+        service.run()
+    except KeyboardInterrupt:
+        print('Sorveglianza terminata')
+    finally:
+        watcher.close()
+        if pool is not None:
+            pool.shutdown()
+    return 0
+
+
+if __name__ == '__main__':
+    # Necessario per il pool di processi nell'eseguibile PyInstaller.
+    multiprocessing.freeze_support()
+    sys.exit(main())